@@ -0,0 +1,93 @@
+"""Cached request identity — request.user and masquerade targets without queries.
+
+Users are cached under a key that includes a per-user version. CustomUser
+save()/delete(), and bulk update()/delete() on its QuerySet, call
+invalidate_user(), which bumps the version so the next request reloads the
+user from the database. Together with the cached_db
+session engine, a steady-state authenticated request makes no auth queries.
+
+The session auth hash is still verified against the cached user on every
+request, so a password change logs out other sessions as usual (the save
+that changes the password also invalidates the cache), and an inactive
+cached user is never served.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+IDENTITY_CACHE_TTL = 15 * 60  # 15 minutes
+
+
+def _version_key(user_id) -> str:
+    return f"identity:version:{user_id}"
+
+
+def get_user_version(user_id) -> int:
+    """Return the current identity cache version for a user, creating one if missing."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        cache.set(_version_key(user_id), version, None)
+    return version
+
+
+def invalidate_user(user_id) -> None:
+    """Drop the cached user by moving them to a fresh version."""
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_users(user_ids) -> None:
+    """invalidate_user() for many users in one cache round trip."""
+    version = time.time_ns()
+    cache.set_many({_version_key(user_id): version for user_id in user_ids}, None)
+
+
+def _user_key(user_id) -> str:
+    return f"identity:user:{user_id}:{get_user_version(user_id)}"
+
+
+def get_cached_user_by_id(user_id):
+    """Return the user with this id, from cache when possible, or None."""
+    key = _user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = get_user_model().objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, IDENTITY_CACHE_TTL)
+    return user
+
+
+def get_user(request):
+    """Cached equivalent of django.contrib.auth.get_user().
+
+    Anything other than a cache hit on an active user with a matching
+    session hash (first request, invalidated or inactive user, unknown
+    backend, hash mismatch) takes Django's own path, which also handles
+    session flushing, fallback keys and the backend's is_active check.
+    """
+    session = request.session
+    user_id = session.get(SESSION_KEY)
+    if user_id is None or session.get(BACKEND_SESSION_KEY) is None:
+        return AnonymousUser()
+
+    key = _user_key(user_id)
+    user = cache.get(key)
+    if user is not None and user.is_active:
+        session_hash = session.get(HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+            return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, IDENTITY_CACHE_TTL)
+    return user
+
+
+async def aget_user(request):
+    return await sync_to_async(get_user)(request)
@@ -3,7 +3,25 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.db import models
 
 
-class CustomUserManager(BaseUserManager):
+class CustomUserQuerySet(models.QuerySet):
+    """Bulk update()/delete() skip save()/delete(); invalidate the cached identities here too."""
+
+    def update(self, **kwargs):
+        from accounts.identity import invalidate_users
+        user_ids = list(self.values_list("pk", flat=True))
+        result = super().update(**kwargs)
+        invalidate_users(user_ids)
+        return result
+
+    def delete(self):
+        from accounts.identity import invalidate_users
+        user_ids = list(self.values_list("pk", flat=True))
+        result = super().delete()
+        invalidate_users(user_ids)
+        return result
+
+
+class CustomUserManager(BaseUserManager.from_queryset(CustomUserQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError("Email is required")
@@ -34,5 +52,23 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            # Admin user list orders by newest signup
+            models.Index(fields=["-date_joined"], name="accounts_user_joined_idx"),
+        ]
+
     def __str__(self):
         return self.email
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from accounts.identity import invalidate_user
+        invalidate_user(self.pk)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        from accounts.identity import invalidate_user
+        invalidate_user(pk)
+        return result
@@ -1,3 +1,58 @@
-from django.test import TestCase
+from django.contrib.auth import HASH_SESSION_KEY, get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from accounts.identity import _user_key, get_user
+
+
+class IdentityCacheTests(TestCase):
+    """request.user from the identity cache must never outlive what Django's own get_user() would allow."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email="reader@example.com", password="pw")
+        self.client.force_login(self.user)
+
+    def request(self):
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        return request
+
+    def test_cache_hit_makes_no_queries(self):
+        self.assertEqual(get_user(self.request()), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user(self.request()), self.user)
+
+    def test_save_invalidates(self):
+        get_user(self.request())
+        self.user.first_name = "Ada"
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user(self.request()).first_name, "Ada")
+
+    def test_delete_logs_out(self):
+        get_user(self.request())
+        self.user.delete()
+        self.assertFalse(get_user(self.request()).is_authenticated)
+
+    def test_bulk_deactivation_logs_out(self):
+        get_user(self.request())
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(get_user(self.request()).is_authenticated)
+
+    def test_inactive_cached_user_is_not_served(self):
+        # e.g. cached by a masquerade lookup, which does not filter on is_active
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.user.is_active = False
+        cache.set(_user_key(self.user.pk), self.user)
+        self.assertFalse(get_user(self.request()).is_authenticated)
+
+    def test_session_hash_mismatch_takes_django_path(self):
+        get_user(self.request())
+        session = self.client.session
+        session[HASH_SESSION_KEY] = "stale"
+        session.save()
+        request = self.request()
+        self.assertFalse(get_user(request).is_authenticated)
+        # Django's path flushed the session, as it would without the cache
+        self.assertIsNone(request.session.get(HASH_SESSION_KEY))
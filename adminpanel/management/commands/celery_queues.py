@@ -0,0 +1,90 @@
+"""Management command to show Celery queue depth and lag.
+
+Reads the Redis broker directly: for each queue, the number of waiting
+messages per priority and the age of the oldest one (from the
+published_at header set in core/celery.py). Messages reserved by workers
+but not yet acknowledged are shown as "unacked".
+
+Usage:
+    python manage.py celery_queues                 # One snapshot
+    python manage.py celery_queues --watch 5       # Refresh every 5 seconds
+    python manage.py celery_queues --workers       # Also list which workers consume which queues
+"""
+import json
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.celery import QUEUES, app
+
+
+class Command(BaseCommand):
+    help = "Show Celery queue depth and lag per queue and priority"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            type=int,
+            default=0,
+            metavar="SECONDS",
+            help="Refresh every SECONDS until interrupted",
+        )
+        parser.add_argument(
+            "--workers",
+            action="store_true",
+            help="Ask running workers which queues they consume (waits up to 1s for replies)",
+        )
+
+    def handle(self, *args, **options):
+        client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+        while True:
+            self.show_queues(client)
+            if options["workers"]:
+                self.show_workers()
+            if not options["watch"]:
+                break
+            time.sleep(options["watch"])
+            self.stdout.write("")
+
+    def show_queues(self, client):
+        transport = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+        steps = transport.get("priority_steps", [0, 3, 6, 9])
+        sep = transport.get("sep", ":")
+        now = time.time()
+
+        self.stdout.write(f"{'Queue':<14}{'Waiting':>9}  {'By priority':<28}{'Lag':>10}")
+        for queue in QUEUES:
+            keys = [queue if priority == 0 else f"{queue}{sep}{priority}" for priority in steps]
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.llen(key)
+                pipe.lindex(key, -1)  # messages are pushed left and consumed right: -1 is the oldest
+            results = pipe.execute()
+
+            depths = results[0::2]
+            oldest = [_published_at(raw) for raw in results[1::2] if raw]
+            oldest = [published for published in oldest if published]
+            lag = f"{now - min(oldest):.1f}s" if oldest else "-"
+            by_priority = " ".join(f"p{priority}={depth}" for priority, depth in zip(steps, depths) if depth) or "-"
+            line = f"{queue:<14}{sum(depths):>9}  {by_priority:<28}{lag:>10}"
+            style = self.style.WARNING if oldest and now - min(oldest) > 30 else self.style.SUCCESS
+            self.stdout.write(style(line) if sum(depths) else line)
+
+        self.stdout.write(f"Unacked (reserved by workers): {client.hlen('unacked')}")
+
+    def show_workers(self):
+        replies = app.control.inspect(timeout=1.0).active_queues() or {}
+        if not replies:
+            self.stdout.write(self.style.WARNING("No workers replied."))
+            return
+        for worker, queues in sorted(replies.items()):
+            self.stdout.write(f"  {worker}: {', '.join(q['name'] for q in queues)}")
+
+
+def _published_at(raw: bytes):
+    try:
+        return json.loads(raw)["headers"].get("published_at")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
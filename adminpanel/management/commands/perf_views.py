@@ -0,0 +1,137 @@
+"""Management command to time the slowest pages against seeded data.
+
+Requests each page in-process (django.test.Client, full middleware and
+template rendering) as the heavy seed user from `manage.py seed_perf_data`,
+--runs times after one warm-up request, and reports the median and p95
+time, the number of queries and — on PostgreSQL, with the default planner —
+the tables read with a full scan. The chat sidebar is measured cold (its
+fragment cache invalidated before every request).
+
+--update-baseline writes the results to the baseline file (default
+perf_baseline.json next to manage.py); later runs compare against it and
+fail when a page got slower than --tolerance allows or issues more queries.
+Baselines are machine-specific: record them on the machine that compares.
+
+Usage:
+    python manage.py seed_perf_data --scale 0.1
+    python manage.py perf_views --update-baseline
+    python manage.py perf_views                      # Compare with the baseline
+    python manage.py perf_views --runs 50 --tolerance 0.5 --baseline /tmp/perf.json
+"""
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.identity import invalidate_user
+from accounts.models import CustomUser
+from adminpanel.management.commands.seed_perf_data import HEAVY_EMAIL
+from chat.models import Conversation
+from chat.services.sidebar import invalidate_sidebar
+from core.query_plans import seq_scans
+
+
+class Command(BaseCommand):
+    help = "Time the admin and chat pages against seeded data and compare with a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=20, help="Timed requests per page (default 20)")
+        parser.add_argument("--baseline", default=str(Path(settings.BASE_DIR) / "perf_baseline.json"))
+        parser.add_argument("--update-baseline", action="store_true", help="Save this run as the baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed median time increase vs the baseline (default 0.25 = 25%%)")
+        parser.add_argument("--no-explain", action="store_true", help="Skip the EXPLAIN check")
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(email=HEAVY_EMAIL).first()
+        if user is None:
+            raise CommandError(f"No seeded data ({HEAVY_EMAIL} not found). Run `manage.py seed_perf_data` first.")
+        longest = Conversation.objects.filter(user=user).order_by("-message_count").first()
+
+        hosts = [h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")]
+        self.client = Client(HTTP_HOST=hosts[0] if hosts else "localhost")
+        self.client.force_login(user)
+        self.user = user
+        explain = connection.vendor == "postgresql" and not options["no_explain"]
+
+        pages = [
+            ("dashboard", reverse("adminpanel:dashboard"), False),
+            ("admin_documents", reverse("adminpanel:documents"), False),
+            ("admin_conversations", reverse("adminpanel:conversations"), False),
+            ("admin_conversation_detail", reverse("adminpanel:conversation_detail", args=[longest.pk]), False),
+            ("admin_users", reverse("adminpanel:users"), False),
+            ("admin_usage", reverse("adminpanel:usage"), False),
+            ("admin_drive_settings", reverse("adminpanel:drive_settings"), False),
+            ("conversation_detail", reverse("chat:detail", args=[longest.pk]), False),
+            ("conversation_sidebar", reverse("chat:sidebar"), True),
+        ]
+        results = {}
+        for name, url, cold in pages:
+            results[name] = self.measure(url, options["runs"], cold, explain)
+            self.report(name, results[name])
+
+        baseline_path = Path(options["baseline"])
+        if options["update_baseline"]:
+            baseline_path.write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+        elif baseline_path.exists():
+            self.compare(results, json.loads(baseline_path.read_text()), options["tolerance"])
+        else:
+            self.stdout.write(f"No baseline at {baseline_path}; run with --update-baseline to record one.")
+
+    def measure(self, url: str, runs: int, cold: bool, explain: bool) -> dict:
+        self._get(url, cold)  # warm-up: imports, template loading
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            self._get(url, cold)
+            timings.append((time.perf_counter() - started) * 1000)
+        with CaptureQueriesContext(connection) as captured:
+            self._get(url, cold)
+        ordered = sorted(timings)
+        return {
+            "median_ms": round(ordered[len(ordered) // 2], 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            "queries": len(captured.captured_queries),
+            "seq_scans": sorted({table for table, _ in seq_scans(captured.captured_queries)}) if explain else None,
+        }
+
+    def _get(self, url: str, cold: bool) -> None:
+        if cold:
+            invalidate_sidebar(self.user.pk)
+        invalidate_user(self.user.pk)
+        response = self.client.get(url)
+        if response.status_code == 400:
+            raise CommandError(f"GET {url} returned 400; is ALLOWED_HOSTS set?")
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def report(self, name: str, result: dict) -> None:
+        line = (f"{name:<28}median {result['median_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+                f"{result['queries']:>3} queries")
+        if result["seq_scans"]:
+            line += "  seq scans: " + ", ".join(result["seq_scans"])
+        self.stdout.write(line)
+
+    def compare(self, results: dict, baseline: dict, tolerance: float) -> None:
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            if result["median_ms"] > base["median_ms"] * (1 + tolerance):
+                regressions.append(f"{name} median {base['median_ms']:.1f} -> {result['median_ms']:.1f} ms")
+            if result["queries"] > base["queries"]:
+                regressions.append(f"{name} queries {base['queries']} -> {result['queries']}")
+            new_scans = set(result["seq_scans"] or []) - set(base.get("seq_scans") or [])
+            if result["seq_scans"] is not None and base.get("seq_scans") is not None and new_scans:
+                regressions.append(f"{name} new seq scans on {', '.join(sorted(new_scans))}")
+        if regressions:
+            raise CommandError("Regression vs baseline: " + "; ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"All pages within {tolerance:.0%} of baseline"))
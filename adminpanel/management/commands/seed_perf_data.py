@@ -0,0 +1,308 @@
+"""Management command to seed a large, realistic dataset for performance work.
+
+Default volumes: 100k users, 200k conversations, 1M messages, 5k documents
+(each with a DriveFile), 1M usage logs and hourly Drive sync runs, spread
+over the last 180 days.
+Conversation sizes follow a long tail, so a few conversations are very long
+and a few users own thousands of conversations — the cases that make
+conversation_detail, the sidebar and the admin lists slow.
+
+One staff user, perf-heavy@seed.invalid, always gets HEAVY_CONVERSATIONS
+conversations, the first of them with HEAVY_MESSAGES messages;
+`manage.py perf_views` and the view query tests browse as that user.
+Seeded rows are marked (users @seed.invalid, documents with a file-seed
+OpenAI id, sync runs triggered by the heavy user) and removed with --clear. Generation is deterministic (--seed).
+
+Usage:
+    python manage.py seed_perf_data                           # Full volumes (several minutes)
+    python manage.py seed_perf_data --scale 0.01              # 1% of every volume
+    python manage.py seed_perf_data --users 500 --messages 20000 --documents 100 --usage-logs 5000
+    python manage.py seed_perf_data --clear                   # Delete seeded data
+"""
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from adminpanel.models import UsageLog
+from chat.models import Conversation, ConversationSummary, Message
+from chat.services.pricing import compute_cost
+from documents.models import Document, DriveFile, SyncRun
+
+EMAIL_DOMAIN = "seed.invalid"
+HEAVY_EMAIL = f"perf-heavy@{EMAIL_DOMAIN}"
+HEAVY_CONVERSATIONS = 2000
+HEAVY_MESSAGES = 2000
+SEED_FILE_PREFIX = "file-seed"
+DAYS = 180
+
+WORDS = (
+    "tenant landlord lease notice eviction possession deposit statute court judgment property code section "
+    "petition hearing filing deadline appeal county justice precinct repair remedy damages contract breach "
+    "probate estate will heir guardian custody support divorce decree protective order bail misdemeanor"
+).split()
+MODELS = ["gpt-4o-mini", "gpt-4o-mini", "gpt-4o-mini", "gpt-4.1-mini", "gpt-4o"]
+
+
+@contextmanager
+def backdated(*models):
+    """Let bulk_create keep explicit values for auto_now/auto_now_add fields of these models."""
+    fields = [f for model in models for f in model._meta.concrete_fields if getattr(f, "auto_now", False)
+              or getattr(f, "auto_now_add", False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Seed users, conversations, messages, documents and usage logs at production-like volumes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--conversations", type=int, default=None, help="Default: 2 per user")
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--documents", type=int, default=5_000)
+        parser.add_argument("--usage-logs", type=int, default=1_000_000)
+        parser.add_argument("--sync-runs", type=int, default=DAYS * 24)
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiply every volume (e.g. 0.01)")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default 42)")
+        parser.add_argument("--clear", action="store_true", help="Delete previously seeded data and exit")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            self.clear()
+            return
+
+        scale = options["scale"]
+        users = max(2, int(options["users"] * scale))
+        conversations = int((options["conversations"] or options["users"] * 2) * scale)
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+
+        self.clear()
+        with backdated(CustomUser, Conversation, Message, Document, DriveFile, UsageLog, SyncRun):
+            user_ids = self.seed_users(users)
+            conv_rows = self.seed_conversations(user_ids, max(conversations, 1))
+            self.seed_messages(conv_rows, int(options["messages"] * scale))
+            self.seed_documents(int(options["documents"] * scale))
+            self.seed_usage(conv_rows, int(options["usage_logs"] * scale))
+            self.seed_sync_runs(user_ids[0], int(options["sync_runs"] * scale), int(options["documents"] * scale))
+
+        self.stdout.write("Rebuilding conversation counters...")
+        call_command("backfill_conversation_stats", batch_size=2000, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded data for {users} users. Heavy user: {HEAVY_EMAIL}"))
+
+    def clear(self):
+        seeded_users = CustomUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}")
+        with transaction.atomic():
+            # Children first, so each delete is a single statement instead of a cascade collected in Python
+            UsageLog.objects.filter(user__in=seeded_users).delete()
+            SyncRun.objects.filter(triggered_by__in=seeded_users).delete()
+            Message.objects.filter(conversation__user__in=seeded_users).delete()
+            ConversationSummary.objects.filter(conversation__user__in=seeded_users).delete()
+            Conversation.objects.filter(user__in=seeded_users).delete()
+            DriveFile.objects.filter(document__openai_file_id__startswith=SEED_FILE_PREFIX).delete()
+            Document.objects.filter(openai_file_id__startswith=SEED_FILE_PREFIX).delete()
+            deleted, _ = seeded_users.delete()
+        if deleted:
+            self.stdout.write(f"Cleared previously seeded data ({deleted} user rows and related).")
+
+    def _when(self, days: float = DAYS):
+        return self.now - timedelta(seconds=self.rng.random() * days * 86400)
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def _bulk(self, model, objs):
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def seed_users(self, count: int) -> list:
+        self.stdout.write(f"Users: {count}")
+        ids = []
+        batch = []
+        for i in range(count):
+            user = CustomUser(
+                id=uuid.uuid4(),
+                email=HEAVY_EMAIL if i == 0 else f"user{i}@{EMAIL_DOMAIN}",
+                first_name=self.rng.choice(["Ana", "Ben", "Carla", "Dev", "Eli", "Fay"]),
+                last_name=self.rng.choice(["Garcia", "Nguyen", "Smith", "Patel", "Lee", "Brown"]),
+                is_staff=i == 0,
+                date_joined=self._when(DAYS * 2),
+                password="!seeded",  # unusable: never matches a hash
+            )
+            ids.append(user.id)
+            batch.append(user)
+            if len(batch) >= self.batch_size:
+                self._bulk(CustomUser, batch)
+                batch = []
+        self._bulk(CustomUser, batch)
+        return ids
+
+    def seed_conversations(self, user_ids: list, count: int) -> list[tuple]:
+        """Returns (conversation_id, user_id, created_at) rows; the heavy user's conversations first."""
+        self.stdout.write(f"Conversations: {count}")
+        heavy = min(HEAVY_CONVERSATIONS, count // 2)
+        # 1% of users own a third of the remaining conversations
+        power_users = user_ids[1:max(2, len(user_ids) // 100)]
+        rows = []
+        batch = []
+        for i in range(count):
+            if i < heavy:
+                user_id = user_ids[0]
+            elif self.rng.random() < 0.33:
+                user_id = self.rng.choice(power_users)
+            else:
+                user_id = self.rng.choice(user_ids)
+            updated = self._when()
+            conv = Conversation(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                title=self._text(self.rng.randint(3, 7)).capitalize(),
+                is_pinned=self.rng.random() < 0.02,
+                is_archived=self.rng.random() < 0.05,
+                created_at=updated - timedelta(minutes=self.rng.randint(0, 600)),
+                updated_at=updated,
+            )
+            rows.append((conv.id, user_id, conv.created_at))
+            batch.append(conv)
+            if len(batch) >= self.batch_size:
+                self._bulk(Conversation, batch)
+                batch = []
+        self._bulk(Conversation, batch)
+        return rows
+
+    def seed_messages(self, conv_rows: list, count: int) -> None:
+        self.stdout.write(f"Messages: {count}")
+        heavy = min(HEAVY_MESSAGES, count // 4)
+        # Long tail: Pareto-distributed lengths, scaled to the requested total, in user/assistant pairs
+        weights = [self.rng.paretovariate(1.2) for _ in conv_rows[1:]]
+        remaining = max(count - heavy, 0)
+        weight_sum = sum(weights) or 1
+        sizes = [heavy] + [2 * max(1, round(remaining * w / weight_sum / 2)) for w in weights]
+        batch = []
+        written = 0
+        for (conv_id, _, started), size in zip(conv_rows, sizes):
+            when = started
+            for n in range(size):
+                if written >= count:
+                    break
+                when = min(when + timedelta(seconds=self.rng.randint(5, 300)), self.now)
+                role = "user" if n % 2 == 0 else "assistant"
+                content = self._text(self.rng.randint(8, 30) if role == "user" else self.rng.randint(60, 250))
+                batch.append(Message(
+                    conversation_id=conv_id,
+                    role=role,
+                    content=content,
+                    content_html=f"<p>{content}</p>" if role == "assistant" else "",
+                    created_at=when,
+                ))
+                written += 1
+                if len(batch) >= self.batch_size:
+                    self._bulk(Message, batch)
+                    batch = []
+            if written >= count:
+                break
+        self._bulk(Message, batch)
+
+    def seed_documents(self, count: int) -> None:
+        self.stdout.write(f"Documents: {count}")
+        documents = []
+        drive_files = []
+        for i in range(count):
+            created = self._when(DAYS * 2)
+            title = f"{self._text(4).title()} {i}"
+            doc = Document(
+                id=uuid.uuid4(),
+                title=title,
+                file=f"documents/{title}.pdf",
+                authority_level=self.rng.choice([c for c, _ in Document.AUTHORITY_CHOICES]),
+                domain=self.rng.choice([c for c, _ in Document.DOMAIN_CHOICES]),
+                status="failed" if self.rng.random() < 0.01 else "completed",
+                openai_file_id=f"{SEED_FILE_PREFIX}{i:06d}",
+                created_at=created,
+                updated_at=created,
+            )
+            documents.append(doc)
+            drive_files.append(DriveFile(
+                drive_file_id=f"seed-drive-{i:06d}",
+                name=f"{title}.pdf",
+                mime_type="application/pdf",
+                md5_checksum=uuid.uuid4().hex,
+                modified_time=created,
+                document=doc,
+                last_synced=self._when(7),
+                created_at=created,
+            ))
+        self._bulk(Document, documents)
+        self._bulk(DriveFile, drive_files)
+
+    def seed_usage(self, conv_rows: list, count: int) -> None:
+        self.stdout.write(f"Usage logs: {count}")
+        batch = []
+        for _ in range(count):
+            conv_id, user_id, _ = self.rng.choice(conv_rows)
+            model = self.rng.choice(MODELS)
+            input_tokens = self.rng.randint(800, 9000)
+            output_tokens = self.rng.randint(40, 700)
+            cached = input_tokens // 2 if self.rng.random() < 0.6 else 0
+            batch.append(UsageLog(
+                user_id=user_id,
+                conversation_id=conv_id,
+                query_text=self._text(self.rng.randint(6, 20)),
+                domain_classified=self.rng.choice(["property", "family", "criminal", "civil", "other"]),
+                response_tokens=output_tokens,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=cached,
+                model=model,
+                cost=compute_cost(input_tokens, output_tokens, cached, model).quantize(Decimal("0.000001")),
+                created_at=self._when(),
+            ))
+            if len(batch) >= self.batch_size:
+                self._bulk(UsageLog, batch)
+                batch = []
+        self._bulk(UsageLog, batch)
+
+    def seed_sync_runs(self, heavy_user_id, count: int, files: int) -> None:
+        """Hourly runs back from now, mostly unchanged folders with the odd failure or overlap."""
+        self.stdout.write(f"Sync runs: {count}")
+        batch = []
+        for i in range(count):
+            started = self.now - timedelta(hours=i + 1)
+            status = self.rng.choices(["succeeded", "failed", "skipped"], weights=[95, 2, 3])[0]
+            run = SyncRun(trigger="manual", triggered_by_id=heavy_user_id, status=status,
+                          started_at=started, finished_at=started)
+            if status != "skipped":
+                changed = self.rng.randint(0, 5)
+                run.files_seen = files
+                run.new_count = self.rng.randint(0, changed)
+                run.updated_count = changed - run.new_count
+                run.unchanged_count = max(files - changed, 0)
+                run.bytes_downloaded = changed * self.rng.randint(50_000, 2_000_000)
+                run.list_seconds = 2 + files / 500 * self.rng.uniform(0.8, 1.2)
+                run.diff_seconds = files / 20_000
+                run.download_seconds = changed * self.rng.uniform(0.3, 2.0)
+                run.db_seconds = changed * 0.05
+                run.enqueue_seconds = changed * 0.005
+                run.finished_at = started + timedelta(seconds=sum(s for _, s in run.phase_timings()))
+                if status == "failed":
+                    run.error = "HttpError: 503 Backend Error"
+            batch.append(run)
+            if len(batch) >= self.batch_size:
+                self._bulk(SyncRun, batch)
+                batch = []
+        self._bulk(SyncRun, batch)
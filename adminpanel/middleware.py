@@ -1,6 +1,23 @@
 """Masquerade middleware — allows admins to view the site as another user."""
+from functools import partial
+
 from django.utils import timezone
 
+from accounts.identity import get_cached_user_by_id
+
+
+def masquerade_target(session):
+    """The user an admin is viewing the site as in this session, or None."""
+    user_id = session.get("masquerade_user_id")
+    if not user_id:
+        return None
+    # Served from the versioned identity cache — no query per request
+    return get_cached_user_by_id(user_id)
+
+
+async def _auser(user):
+    return user
+
 
 class MasqueradeMiddleware:
     def __init__(self, get_response):
@@ -16,13 +33,14 @@ class MasqueradeMiddleware:
                 del request.session["masquerade_user_id"]
                 request.is_masquerading = False
             else:
-                from accounts.models import CustomUser
-                try:
-                    target = CustomUser.objects.get(id=request.session["masquerade_user_id"])
+                target = masquerade_target(request.session)
+                if target is not None:
                     request.real_user = request.user
                     request.user = target
+                    # Async views read the user through request.auser()
+                    request.auser = partial(_auser, target)
                     request.is_masquerading = True
-                except CustomUser.DoesNotExist:
+                else:
                     del request.session["masquerade_user_id"]
 
         response = self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0003_add_cost_to_usagelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='cached_tokens',
+            field=models.IntegerField(default=0),
+        ),
+    ]
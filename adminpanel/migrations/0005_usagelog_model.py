@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0004_usagelog_cached_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='model',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
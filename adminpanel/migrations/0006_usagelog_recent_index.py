@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0005_usagelog_model'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usagelog',
+            index=models.Index(fields=['-created_at'], name='adminpanel_usage_recent_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 
 class UsageLog(models.Model):
@@ -13,15 +14,34 @@ class UsageLog(models.Model):
     response_tokens = models.IntegerField(default=0)
     input_tokens = models.IntegerField(default=0)
     output_tokens = models.IntegerField(default=0)
+    cached_tokens = models.IntegerField(default=0)  # prompt-cache hits, a subset of input_tokens
+    model = models.CharField(max_length=50, blank=True, default="")  # OpenAI model chosen by the model router
     cost = models.DecimalField(max_digits=10, decimal_places=6, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Admin usage list and dashboard "recent usage" read the newest rows first
+            models.Index(fields=["-created_at"], name="adminpanel_usage_recent_idx"),
+        ]
 
     def __str__(self):
         return f"Usage by {self.user.email} at {self.created_at}"
 
+    def save(self, *args, **kwargs):
+        """Save the log and add its tokens/cost to the conversation totals atomically."""
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new and self.conversation_id:
+                from chat.models import Conversation
+                cost = self._meta.get_field("cost").to_python(self.cost)
+                Conversation.objects.filter(pk=self.conversation_id).update(
+                    total_tokens=F("total_tokens") + self.input_tokens + self.output_tokens,
+                    total_cost=F("total_cost") + cost,
+                )
+
 
 class MasqueradeSession(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -1,3 +1,123 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.identity import invalidate_user
+from accounts.middleware import CachedAuthenticationMiddleware
+from accounts.models import CustomUser
+from adminpanel.middleware import MasqueradeMiddleware
+from adminpanel.management.commands.seed_perf_data import HEAVY_EMAIL
+from chat.models import Conversation
+from core.query_plans import seq_scans
+
+# Seeded volumes are small but shaped like production (long-tail conversations,
+# a user with many conversations); query counts must not grow with them.
+SEED = {"users": 30, "messages": 600, "documents": 12, "usage_logs": 300, "sync_runs": 60}
+
+
+class MasqueradeMiddlewareTests(TestCase):
+    def test_sync_and_async_user_are_the_target(self):
+        admin = CustomUser.objects.create_user(email="admin@example.com", password="pw", is_staff=True)
+        target = CustomUser.objects.create_user(email="client@example.com", password="pw")
+        self.client.force_login(admin)
+        session = self.client.session
+        session["masquerade_user_id"] = str(target.pk)
+        session.save()
+
+        request = RequestFactory().get(reverse("chat:home"))
+        request.session = self.client.session
+        CachedAuthenticationMiddleware(lambda request: None).process_request(request)
+        seen = {}
+
+        def view(request):
+            seen["user"] = request.user
+            seen["auser"] = async_to_sync(request.auser)()  # what async views (user_events) read
+
+        MasqueradeMiddleware(view)(request)
+        self.assertEqual(seen, {"user": target, "auser": target})
+        self.assertEqual(request.real_user, admin)
+
+
+@override_settings(METRICS_TOKEN="s3cret")
+class MetricsEndpointTests(TestCase):
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get(reverse("metrics"), headers={"Authorization": "Bearer s3cret"}).status_code, 200)
+        for auth in ["Bearer wrong", "Bearer s3crét"]:  # non-ASCII must be a 404, not a server error
+            with self.subTest(auth=auth):
+                self.assertEqual(self.client.get(reverse("metrics"), headers={"Authorization": auth}).status_code, 404)
+
+
+class SeededViewTestCase(TestCase):
+    """Base for view regression tests over seed_perf_data output, logged in as the heavy staff user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_perf_data", stdout=StringIO(), **SEED)
+        cls.heavy = CustomUser.objects.get(email=HEAVY_EMAIL)
+        cls.longest = Conversation.objects.filter(user=cls.heavy).order_by("-message_count").first()
+
+    def setUp(self):
+        invalidate_user(self.heavy.pk)
+        self.client.force_login(self.heavy)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class AdminViewQueryCountTests(SeededViewTestCase):
+    """Each admin page issues a fixed number of queries, however many rows it lists."""
+
+    def test_dashboard(self):
+        with self.assertNumQueries(7):
+            self.get(reverse("adminpanel:dashboard"))
+
+    def test_documents(self):
+        with self.assertNumQueries(3):
+            self.get(reverse("adminpanel:documents"))
+
+    def test_conversations(self):
+        with self.assertNumQueries(3):
+            self.get(reverse("adminpanel:conversations"))
+
+    def test_conversation_detail(self):
+        with self.assertNumQueries(4):
+            self.get(reverse("adminpanel:conversation_detail", args=[self.longest.pk]))
+
+    def test_users(self):
+        with self.assertNumQueries(3):
+            self.get(reverse("adminpanel:users"))
+
+    def test_usage(self):
+        with self.assertNumQueries(4):
+            self.get(reverse("adminpanel:usage"))
+
+    def test_drive_settings(self):
+        with self.assertNumQueries(8):
+            self.get(reverse("adminpanel:drive_settings"))
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN plans are PostgreSQL-specific")
+class AdminViewQueryPlanTests(SeededViewTestCase):
+    """No admin page query reads a whole table when an index could serve it."""
+
+    def assertNoSeqScans(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            self.get(url)
+        self.assertEqual(seq_scans(captured.captured_queries, force_index=True), [])
+
+    def test_list_pages(self):
+        for name in ("adminpanel:dashboard", "adminpanel:documents", "adminpanel:conversations",
+                     "adminpanel:users", "adminpanel:usage", "adminpanel:drive_settings"):
+            with self.subTest(name):
+                self.assertNoSeqScans(reverse(name))
+
+    def test_conversation_detail(self):
+        self.assertNoSeqScans(reverse("adminpanel:conversation_detail", args=[self.longest.pk]))
@@ -28,6 +28,9 @@ urlpatterns = [
     # Usage & Export
     path("usage/", views.admin_usage, name="usage"),
     path("usage/export/", views.admin_usage_export, name="usage_export"),
+    # Request traces
+    path("traces/", views.admin_traces, name="traces"),
+    path("traces/<str:trace_id>/", views.admin_trace_detail, name="trace_detail"),
     # Vector Store
     path("vector-store/", views.admin_vector_store, name="vector_store"),
     # Settings
@@ -1,40 +1,51 @@
 import csv
 import html
 import os
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.core.paginator import Paginator
-from django.db.models import Q, Sum
+from django.db.models import Avg, Count, F, Q, Sum
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from accounts.models import CustomUser
-from documents.models import Document, DriveFile
+from documents.models import Document, DriveFile, SyncRun
 from documents.forms import DocumentUploadForm
 from documents.tasks import process_document, sync_drive_folder
+from documents.services.drive_sync import SYNC_LOCK_NAME
 from documents.services.vector_store import remove_file_from_vector_store
 from chat.models import Conversation, Message
+from chat.services.hedging import hedge_stats
+from chat.services.model_router import TASK_ANSWER, TASK_TITLE, model_stats
+from chat.services.sidebar import invalidate_sidebar
+from core import tracing
+from core.locks import LeaseLock
 from .models import UsageLog, MasqueradeSession
 
 
 @staff_member_required
 def dashboard(request):
     """Admin dashboard with key stats."""
-    total_cost = UsageLog.objects.aggregate(total=Sum("cost"))["total"] or Decimal("0")
-    total_input = UsageLog.objects.aggregate(total=Sum("input_tokens"))["total"] or 0
-    total_output = UsageLog.objects.aggregate(total=Sum("output_tokens"))["total"] or 0
+    # One pass over usage logs for all totals
+    usage = UsageLog.objects.aggregate(
+        queries=Count("id"),
+        cost=Sum("cost"),
+        input_tokens=Sum("input_tokens"),
+        output_tokens=Sum("output_tokens"),
+    )
     context = {
         "total_documents": Document.objects.count(),
         "total_users": CustomUser.objects.count(),
         "total_conversations": Conversation.objects.count(),
-        "total_queries": UsageLog.objects.count(),
-        "total_cost": total_cost,
-        "total_input_tokens": total_input,
-        "total_output_tokens": total_output,
+        "total_queries": usage["queries"],
+        "total_cost": usage["cost"] or Decimal("0"),
+        "total_input_tokens": usage["input_tokens"] or 0,
+        "total_output_tokens": usage["output_tokens"] or 0,
         "recent_documents": Document.objects.all()[:5],
         "recent_usage": UsageLog.objects.select_related("user").all()[:10],
     }
@@ -151,9 +162,10 @@ def admin_conversations(request):
 
 @staff_member_required
 def admin_conversation_detail(request, pk):
-    conv = get_object_or_404(Conversation, pk=pk)
-    chat_messages = conv.messages.all()
-    return render(request, "adminpanel/conversation_detail.html", {"conversation": conv, "chat_messages": chat_messages})
+    conv = get_object_or_404(Conversation.objects.select_related("user"), pk=pk)
+    paginator = Paginator(conv.messages.all(), 50)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "adminpanel/conversation_detail.html", {"conversation": conv, "chat_messages": page})
 
 
 @staff_member_required
@@ -162,6 +174,7 @@ def admin_conversation_delete(request, pk):
     """Delete a conversation."""
     conv = get_object_or_404(Conversation, pk=pk)
     conv.delete()
+    invalidate_sidebar(conv.user_id)
     messages.success(request, "Conversation deleted.")
     return redirect("adminpanel:conversations")
 
@@ -172,7 +185,10 @@ def admin_conversations_bulk_delete(request):
     """Bulk delete selected conversations."""
     ids = request.POST.getlist("selected")
     if ids:
+        user_ids = set(Conversation.objects.filter(pk__in=ids).values_list("user_id", flat=True))
         count = Conversation.objects.filter(pk__in=ids).delete()[0]
+        for user_id in user_ids:
+            invalidate_sidebar(user_id)
         messages.success(request, f"Deleted {count} conversation(s).")
     return redirect("adminpanel:conversations")
 
@@ -276,7 +292,10 @@ def admin_usage(request):
         total_cost=Sum("cost"),
         total_input=Sum("input_tokens"),
         total_output=Sum("output_tokens"),
+        total_cached=Sum("cached_tokens"),
     )
+    total_input = totals["total_input"] or 0
+    total_cached = totals["total_cached"] or 0
     paginator = Paginator(qs, 50)
     page = paginator.get_page(request.GET.get("page"))
     return render(request, "adminpanel/usage.html", {
@@ -285,8 +304,10 @@ def admin_usage(request):
         "user_filter": user_filter,
         "total": paginator.count,
         "total_cost": totals["total_cost"] or Decimal("0"),
-        "total_input": totals["total_input"] or 0,
+        "total_input": total_input,
         "total_output": totals["total_output"] or 0,
+        "total_cached": total_cached,
+        "cache_hit_rate": (total_cached * 100 / total_input) if total_input else 0,
     })
 
 
@@ -305,8 +326,31 @@ def admin_drive_settings(request):
         )
         return redirect("adminpanel:drive_settings")
 
-    drive_files = DriveFile.objects.select_related("document").all()
-    last_sync = drive_files.order_by("-last_synced").first()
+    files_page = Paginator(DriveFile.objects.select_related("document"), 50).get_page(request.GET.get("page"))
+    runs_page = Paginator(SyncRun.objects.select_related("triggered_by"), 20).get_page(request.GET.get("runs"))
+    last_run = SyncRun.objects.exclude(status="skipped").first()
+    # Linked document status per Drive file, counted in the database
+    by_status = {
+        row["document__status"]: row["n"]
+        for row in DriveFile.objects.values("document__status").annotate(n=Count("id")).order_by()
+    }
+    # Last 30 days of runs in one query; timings are averaged over successful runs
+    ok = Q(status="succeeded")
+    busy = (F("list_seconds") + F("diff_seconds") + F("download_seconds") + F("db_seconds")
+            + F("enqueue_seconds") + F("remove_seconds"))
+    recent = SyncRun.objects.filter(started_at__gte=timezone.now() - timedelta(days=30)).aggregate(
+        runs=Count("id"),
+        failed=Count("id", filter=Q(status="failed")),
+        skipped=Count("id", filter=Q(status="skipped")),
+        avg_seconds=Avg(busy, filter=ok),
+        new=Sum("new_count"),
+        updated=Sum("updated_count"),
+        removed=Sum("removed_count"),
+        errors=Sum("error_count"),
+        bytes_downloaded=Sum("bytes_downloaded"),
+        **{f"avg_{phase}": Avg(f"{phase}_seconds", filter=ok) for phase in SyncRun.PHASES},
+    )
+    recent["phases"] = [(phase, recent.pop(f"avg_{phase}") or 0) for phase in SyncRun.PHASES]
     context = {
         "folder_id": settings.GOOGLE_DRIVE_FOLDER_ID,
         "sync_interval": settings.GOOGLE_DRIVE_SYNC_INTERVAL_MINUTES,
@@ -315,9 +359,13 @@ def admin_drive_settings(request):
             settings.GOOGLE_SERVICE_ACCOUNT_FILE
             and os.path.exists(settings.GOOGLE_SERVICE_ACCOUNT_FILE)
         ),
-        "last_sync_time": last_sync.last_synced if last_sync else None,
-        "drive_files": drive_files,
-        "total_synced": drive_files.count(),
+        "last_run": last_run,
+        "sync_running": LeaseLock(SYNC_LOCK_NAME, ttl=settings.DRIVE_SYNC_LOCK_TTL).is_locked(),
+        "drive_files": files_page,
+        "total_synced": files_page.paginator.count,
+        "by_status": sorted(by_status.items(), key=lambda item: -item[1]),
+        "runs": runs_page,
+        "recent": recent,
     }
     return render(request, "adminpanel/drive_settings.html", context)
 
@@ -328,8 +376,10 @@ def admin_drive_sync(request):
     if request.method == "POST":
         if not settings.GOOGLE_DRIVE_FOLDER_ID:
             messages.error(request, "Google Drive folder ID is not configured.")
+        elif LeaseLock(SYNC_LOCK_NAME, ttl=settings.DRIVE_SYNC_LOCK_TTL).is_locked():
+            messages.info(request, "A Drive sync is already running.")
         else:
-            sync_drive_folder.delay()
+            sync_drive_folder.delay(trigger="manual", user_id=str(request.user.pk))
             messages.success(request, "Drive sync has been queued. Check back shortly for results.")
     return redirect("adminpanel:drive_settings")
 
@@ -364,6 +414,38 @@ def admin_raw_log(request):
     )
 
 
+# ─── Request Traces ──────────────────────────────────────────────────────────
+
+def _from_epoch(seconds):
+    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+@staff_member_required
+def admin_traces(request):
+    """Recent sampled request traces (core.tracing), newest first."""
+    traces = tracing.recent_traces(limit=100)
+    for trace in traces:
+        trace["started"] = _from_epoch(trace["started_at"])
+    return render(request, "adminpanel/traces.html", {
+        "traces": traces,
+        "sample_rate": settings.TRACE_SAMPLE_RATE * 100,
+    })
+
+
+@staff_member_required
+def admin_trace_detail(request, trace_id):
+    """Waterfall of one trace's spans across the web process, workers and OpenAI calls."""
+    trace = tracing.waterfall(trace_id)
+    if not trace["spans"]:
+        messages.error(request, "Trace not found (it may have expired).")
+        return redirect("adminpanel:traces")
+    return render(request, "adminpanel/trace_detail.html", {
+        "trace_id": trace_id,
+        "trace": trace,
+        "started": _from_epoch(trace["started_at"]),
+    })
+
+
 # ─── Vector Store Status ─────────────────────────────────────────────────────
 
 @staff_member_required
@@ -438,9 +520,24 @@ def admin_settings(request):
         messages.success(request, "Settings saved. Restart services for changes to take effect.")
         return redirect("adminpanel:settings")
 
+    # Live model routing stats (rolling p95 TTFT / error rate per model)
+    answer_stats = model_stats(TASK_ANSWER)
+    background_stats = model_stats(TASK_TITLE)
+    routing = [
+        {
+            "model": model,
+            "tasks": ", ".join(task for task, stats in (("answers", answer_stats), ("background", background_stats)) if model in stats),
+            "stats": answer_stats.get(model) or background_stats.get(model),
+        }
+        for model in dict.fromkeys(list(answer_stats) + list(background_stats))
+    ]
+
     # Read current values
     context = {
         "chat_model": settings.OPENAI_CHAT_MODEL,
+        "routing": routing,
+        "hedge_enabled": settings.CHAT_HEDGE_ENABLED,
+        "hedge": hedge_stats() if settings.CHAT_HEDGE_ENABLED else None,
         "vector_store_id": settings.OPENAI_VECTOR_STORE_ID,
         "max_results": getattr(settings, "FILE_SEARCH_MAX_RESULTS", 5),
         "temperature": getattr(settings, "CHAT_TEMPERATURE", 0.3),
@@ -493,13 +590,15 @@ def admin_usage_export(request):
     response = HttpResponse(content_type="text/csv")
     response["Content-Disposition"] = "attachment; filename=usage_logs.csv"
     writer = csv.writer(response)
-    writer.writerow(["Date", "User", "Query", "Input Tokens", "Output Tokens", "Total Tokens", "Cost ($)"])
+    writer.writerow(["Date", "User", "Query", "Model", "Input Tokens", "Cached Input Tokens", "Output Tokens", "Total Tokens", "Cost ($)"])
     for log in UsageLog.objects.select_related("user").all():
         writer.writerow([
             log.created_at.strftime("%Y-%m-%d %H:%M"),
             log.user.email,
             log.query_text[:200],
+            log.model,
             log.input_tokens,
+            log.cached_tokens,
             log.output_tokens,
             log.input_tokens + log.output_tokens,
             f"{log.cost:.6f}",
@@ -4,9 +4,10 @@ from .models import Conversation, Message, ConversationSummary
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ("title", "user", "is_archived", "created_at", "updated_at")
+    list_display = ("title", "user", "message_count", "total_cost", "is_archived", "created_at", "updated_at")
     list_filter = ("is_archived",)
     search_fields = ("title", "user__email")
+    readonly_fields = ("message_count", "last_message_at", "total_tokens", "total_cost")
 
 
 @admin.register(Message)
@@ -0,0 +1,221 @@
+"""WebSocket transport for chat — one socket multiplexing every conversation.
+
+Optional (CHAT_WEBSOCKET_ENABLED); the SSE endpoints remain the fallback.
+A browser tab opens one socket to /ws/chat/ and uses it to send messages,
+receive answer streams for any number of conversations, receive title
+updates and cancel answers.
+
+Client -> server:
+    {"type": "send", "conversation_id": "<uuid>", "message": "..."}
+    {"type": "subscribe", "conversation_id": "<uuid>", "last_event_id": "..."}
+    {"type": "cancel", "conversation_id": "<uuid>"}
+    {"type": "ack", "conversation_id": "<uuid>", "count": <stream events handled>}
+
+Server -> client:
+    {"type": "user_message", "conversation_id": "<uuid>", "html": "..."}
+    {"type": "stream", "conversation_id": "<uuid>", "id": "<entry id>", "data": <SSE payload>}
+    {"type": "title", "conversation_id": "<uuid>", "title": "..."}
+    {"type": "error", "conversation_id": "<uuid>" | null, "error": "..."}
+
+"data" is exactly what the SSE endpoint sends in a data: line — a token,
+html_block, message_html, citations, queued, error or cancelled object, or
+"[DONE]".
+
+Backpressure: the answer itself stays buffered in Redis, so a relay simply
+stops reading once STREAM_WINDOW events are unacknowledged by the client and
+resumes as acks arrive. A slow client delays only its own relay and never
+grows server memory.
+"""
+import asyncio
+import json
+import logging
+
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.loader import render_to_string
+
+from adminpanel.middleware import masquerade_target
+from chat.models import Conversation
+from chat.services.events import user_channel
+from chat.services.generation import GenerationBuffer, attach_generation, read_buffer, submit_user_message
+from chat.services.sse import DONE_BYTES, encode_event
+
+logger = logging.getLogger(__name__)
+
+STREAM_WINDOW = 64  # stream events a client may have in flight before the relay pauses
+MAX_MESSAGE_CHARS = 8000
+
+
+class StreamRelay:
+    """Relay one conversation's answer from its GenerationBuffer onto the socket."""
+
+    def __init__(self, consumer, conversation_id: str, user_message_id, last_event_id: str = "0"):
+        self.consumer = consumer
+        self.conversation_id = conversation_id
+        self.user_message_id = user_message_id
+        self.last_event_id = last_event_id
+        self.sent = 0
+        self.acked = 0
+        self.window_open = asyncio.Event()
+        self.window_open.set()
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def ack(self, count: int) -> None:
+        self.acked = max(self.acked, min(count, self.sent))
+        if self.sent - self.acked < STREAM_WINDOW:
+            self.window_open.set()
+
+    async def run(self):
+        # Prefix precomputed per relay; payloads are spliced in without re-encoding
+        prefix = f'{{"type":"stream","conversation_id":"{self.conversation_id}","id":"'.encode()
+        try:
+            async for batch in read_buffer(self.user_message_id, self.last_event_id):
+                for entry_id, data in batch:
+                    await self.window_open.wait()
+                    payload = b'"[DONE]"' if data == DONE_BYTES else data
+                    frame = prefix + (entry_id or b"") + b'","data":' + payload + b"}"
+                    await self.consumer.send(text_data=frame.decode())
+                    self.sent += 1
+                    if self.sent - self.acked >= STREAM_WINDOW:
+                        self.window_open.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"WebSocket relay failed for conversation {self.conversation_id}")
+            await self.consumer.send_error(self.conversation_id, "Connection lost. Please try again.")
+        finally:
+            if self.consumer.relays.get(self.conversation_id) is self:
+                del self.consumer.relays[self.conversation_id]
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """One authenticated socket per tab; see the module docstring for the protocol."""
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close(code=4001)
+            return
+        # A masquerading admin sees the target's conversations here too, as over HTTP
+        target = await database_sync_to_async(masquerade_target)(self.scope["session"])
+        self.user = target or user
+        self.relays = {}
+        await self.accept()
+        self.events_task = asyncio.create_task(self.relay_user_events())
+
+    async def disconnect(self, code):
+        for relay in list(getattr(self, "relays", {}).values()):
+            relay.stop()
+        if getattr(self, "events_task", None):
+            self.events_task.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or "")
+            msg_type = message["type"]
+            conversation_id = str(message.get("conversation_id", ""))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            await self.send_error(None, "Malformed message.")
+            return
+
+        if msg_type == "ack":
+            relay = self.relays.get(conversation_id)
+            if relay and isinstance(message.get("count"), int):
+                relay.ack(message["count"])
+        elif msg_type == "send":
+            await self.handle_send(conversation_id, str(message.get("message", "")).strip())
+        elif msg_type == "subscribe":
+            await self.handle_subscribe(conversation_id, str(message.get("last_event_id") or "0"))
+        elif msg_type == "cancel":
+            await self.handle_cancel(conversation_id)
+        else:
+            await self.send_error(conversation_id or None, f"Unknown message type: {msg_type}")
+
+    async def handle_send(self, conversation_id: str, content: str):
+        if not content:
+            await self.send_error(conversation_id, "Empty message")
+            return
+        if len(content) > MAX_MESSAGE_CHARS:
+            await self.send_error(conversation_id, "Message is too long.")
+            return
+        result = await self.create_user_message(conversation_id, content)
+        if result is None:
+            await self.send_error(conversation_id, "Conversation not found.")
+            return
+        user_msg_id, html = result
+        await self.send(text_data=json.dumps({"type": "user_message", "conversation_id": conversation_id, "html": html}))
+        self.start_relay(conversation_id, user_msg_id)
+
+    async def handle_subscribe(self, conversation_id: str, last_event_id: str):
+        conv = await self.get_conversation(conversation_id)
+        if conv is None:
+            await self.send_error(conversation_id, "Conversation not found.")
+            return
+        user_msg = await database_sync_to_async(attach_generation)(conv)
+        if user_msg is None:
+            await self.send(text_data=encode_event({"type": "stream", "conversation_id": conversation_id, "id": "", "data": "[DONE]"}))
+            return
+        self.start_relay(conversation_id, user_msg.pk, last_event_id)
+
+    async def handle_cancel(self, conversation_id: str):
+        relay = self.relays.get(conversation_id)
+        if relay:
+            # The producer answers with {"cancelled": true} and [DONE] through the same relay
+            await sync_to_async(GenerationBuffer(relay.user_message_id).cancel)()
+
+    def start_relay(self, conversation_id: str, user_message_id, last_event_id: str = "0"):
+        previous = self.relays.get(conversation_id)
+        if previous:
+            previous.stop()
+        self.relays[conversation_id] = StreamRelay(self, conversation_id, user_message_id, last_event_id).start()
+
+    async def relay_user_events(self):
+        """Forward the user's pub/sub events (title updates) as-is."""
+        client = aioredis.Redis.from_url(settings.REDIS_URL)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(user_channel(self.user.pk))
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    await self.send(text_data=data.decode() if isinstance(data, bytes) else data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"WebSocket user event relay failed for user {self.user.pk}")
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+    async def send_error(self, conversation_id, error: str):
+        await self.send(text_data=json.dumps({"type": "error", "conversation_id": conversation_id, "error": error}))
+
+    @database_sync_to_async
+    def get_conversation(self, conversation_id: str):
+        try:
+            return Conversation.objects.get(pk=conversation_id, user=self.user)
+        except (Conversation.DoesNotExist, ValidationError):
+            return None
+
+    @database_sync_to_async
+    def create_user_message(self, conversation_id: str, content: str):
+        """Same as send_message: save the user message and start generation."""
+        try:
+            conv = Conversation.objects.get(pk=conversation_id, user=self.user)
+        except (Conversation.DoesNotExist, ValidationError):
+            return None
+        user_msg, _ = submit_user_message(self.user, conv, content, start=True)
+        html = render_to_string("chat/partials/user_message.html", {"message": user_msg, "conversation": conv})
+        return user_msg.pk, html
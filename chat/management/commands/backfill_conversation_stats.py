@@ -0,0 +1,59 @@
+"""Management command to rebuild the denormalized counters on Conversation.
+
+Recomputes message_count, last_message_at, total_tokens and total_cost from
+Message and UsageLog rows. Safe to re-run at any time.
+
+Usage:
+    python manage.py backfill_conversation_stats
+    python manage.py backfill_conversation_stats --batch-size 500
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, IntegerField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from adminpanel.models import UsageLog
+from chat.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = "Recompute Conversation message/token/cost counters from Message and UsageLog"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of conversations updated per transaction (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        messages = Message.objects.filter(conversation=OuterRef("pk")).order_by().values("conversation")
+        usage = UsageLog.objects.filter(conversation=OuterRef("pk")).order_by().values("conversation")
+        message_count = messages.annotate(n=Count("pk")).values("n")
+        last_message_at = messages.annotate(last=Max("created_at")).values("last")
+        total_tokens = usage.annotate(t=Sum(F("input_tokens") + F("output_tokens"))).values("t")
+        total_cost = usage.annotate(c=Sum("cost")).values("c")
+
+        ids = list(Conversation.objects.order_by("pk").values_list("pk", flat=True))
+        total = len(ids)
+        self.stdout.write(f"Backfilling counters for {total} conversations...")
+
+        for start in range(0, total, batch_size):
+            batch = ids[start:start + batch_size]
+            with transaction.atomic():
+                Conversation.objects.filter(pk__in=batch).update(
+                    message_count=Coalesce(Subquery(message_count, output_field=IntegerField()), 0),
+                    last_message_at=Subquery(last_message_at),
+                    total_tokens=Coalesce(Subquery(total_tokens, output_field=IntegerField()), 0),
+                    total_cost=Coalesce(
+                        Subquery(total_cost, output_field=DecimalField(max_digits=10, decimal_places=6)),
+                        0,
+                        output_field=DecimalField(max_digits=10, decimal_places=6),
+                    ),
+                )
+            self.stdout.write(f"  [{min(start + batch_size, total)}/{total}]")
+
+        self.stdout.write(self.style.SUCCESS("Backfill complete."))
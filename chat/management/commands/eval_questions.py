@@ -0,0 +1,234 @@
+"""Management command to evaluate answers to TEST_QUESTIONS.md from recorded API calls.
+
+Runs every question as a one-turn conversation through
+assistant.stream_response and reports per question the input, cached and
+output tokens, cost, citations and latency (time to first token and total).
+With --record the OpenAI calls go to the API and are saved as cassettes
+(core/openai_cassettes.py), one per question; without it they are replayed
+from the cassettes, offline and deterministically, with the latency taken
+from the recording. Hedging is off and the model is pinned (--model), so
+runs are comparable.
+
+A replayed question whose request no longer matches its recording (changed
+prompt, tools or model) is marked stale: its numbers are the recorded ones,
+so re-record to measure the change. --output saves the results; --baseline
+prints what changed per question and fails when total tokens, cost or p95
+latency grew, or citations fell, by more than --max-regression.
+
+Usage:
+    python manage.py eval_questions --record                 # Calls the API (costs money)
+    python manage.py eval_questions --output eval.json       # Replays offline
+    python manage.py eval_questions --baseline eval.json
+    python manage.py eval_questions --only Q1,Q7 --cassettes /tmp/cassettes
+"""
+import json
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from chat.services.assistant import stream_response
+from chat.services.llm import SYSTEM_PROMPT
+from chat.services.pricing import compute_cost
+from core.openai_cassettes import cassette, timings
+from core.openai_client import reset_openai_client
+
+QUESTION_RE = re.compile(r"^\*\*(Q\d+)\.\*\*\s+(.+?)\s*$", re.MULTILINE)
+COMPARED = ("prompt_chars", "input_tokens", "cached_tokens", "output_tokens", "citations", "ttft_ms", "total_ms")
+
+
+def parse_questions(text: str) -> list[tuple[str, str]]:
+    """[(id, question)] from the **Q1.** lines of TEST_QUESTIONS.md."""
+    return QUESTION_RE.findall(text)
+
+
+class Command(BaseCommand):
+    help = "Run TEST_QUESTIONS.md through the answer pipeline against recorded API calls and diff with a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--record", action="store_true", help="Call the OpenAI API and (re)record the cassettes")
+        parser.add_argument("--cassettes", default=str(Path(settings.OPENAI_CASSETTE_DIR) / "test_questions"))
+        parser.add_argument("--questions", default=str(Path(settings.BASE_DIR) / "TEST_QUESTIONS.md"))
+        parser.add_argument("--only", default="", help="Comma-separated question ids, e.g. Q1,Q7")
+        parser.add_argument("--model", default=settings.OPENAI_ANSWER_MODELS[0],
+                            help=f"Answer model (default {settings.OPENAI_ANSWER_MODELS[0]})")
+        parser.add_argument("--output", help="Save the results as JSON")
+        parser.add_argument("--baseline", help="Compare with results saved by --output")
+        parser.add_argument("--max-regression", type=float, default=0.1,
+                            help="Allowed increase in total tokens, cost and p95 latency vs --baseline "
+                                 "(default 0.1 = 10%%)")
+
+    def handle(self, *args, **options):
+        questions = parse_questions(Path(options["questions"]).read_text(encoding="utf-8"))
+        if options["only"]:
+            wanted = {q.strip().upper() for q in options["only"].split(",")}
+            questions = [(qid, text) for qid, text in questions if qid in wanted]
+        if not questions:
+            raise CommandError(f"No questions found in {options['questions']}")
+
+        mode = "record" if options["record"] else "replay"
+        self.stdout.write(f"{mode.capitalize()}ing {len(questions)} questions on {options['model']} "
+                          f"({options['cassettes']})")
+        results = []
+        with override_settings(
+            OPENAI_CASSETTE_MODE=mode,
+            OPENAI_CASSETTE_DIR=options["cassettes"],
+            OPENAI_CASSETTE_REALTIME=False,
+            OPENAI_ANSWER_MODELS=[options["model"]],
+            CHAT_HEDGE_ENABLED=False,
+        ):
+            reset_openai_client()
+            try:
+                for qid, text in questions:
+                    result = self.ask(qid, text)
+                    results.append(result)
+                    self.report_line(result)
+            finally:
+                reset_openai_client()
+
+        summary = summarize(results, mode, options["model"])
+        self.report(summary)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(summary, indent=2))
+            self.stdout.write(f"Saved to {options['output']}")
+        if options["baseline"]:
+            self.compare(summary, json.loads(Path(options["baseline"]).read_text()), options["max_regression"])
+
+    def ask(self, qid: str, question: str) -> dict:
+        result = {
+            "id": qid, "question": question, "prompt_chars": len(SYSTEM_PROMPT) + len(question),
+            "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "cost": 0.0, "citations": 0,
+            "answer_chars": 0, "ttft_ms": None, "total_ms": None, "stale": False, "error": "",
+        }
+        usage = None
+        with cassette(qid) as tape:
+            try:
+                for event in stream_response([{"role": "user", "content": question}]):
+                    if "token" in event:
+                        result["answer_chars"] += len(event["token"])
+                    elif "citations" in event:
+                        result["citations"] = len(event["citations"])
+                    elif "usage" in event:
+                        usage = event["usage"]
+            except Exception as e:
+                cause = e.__cause__ or e
+                result["error"] = f"{cause.__class__.__name__}: {cause}"
+        if usage:
+            result.update(
+                model=usage["model"],
+                input_tokens=usage["input_tokens"],
+                cached_tokens=usage["cached_tokens"],
+                output_tokens=usage["output_tokens"],
+                cost=float(compute_cost(usage["input_tokens"], usage["output_tokens"], usage["cached_tokens"],
+                                        usage["model"])),
+            )
+        if tape["interactions"]:
+            # Calls run back to back (a failover retries after the failed attempt)
+            elapsed = sum(timings(i)["total_ms"] for i in tape["interactions"][:-1])
+            last = timings(tape["interactions"][-1])
+            result["ttft_ms"] = elapsed + last["ttft_ms"] if last["ttft_ms"] is not None else None
+            result["total_ms"] = elapsed + last["total_ms"]
+            result["stale"] = any(i.get("stale") for i in tape["interactions"])
+        return result
+
+    def report_line(self, result: dict) -> None:
+        if result["error"]:
+            self.stdout.write(self.style.ERROR(f"{result['id']:<5}{result['error']}"))
+            return
+        ttft = f"{result['ttft_ms'] / 1000:.2f}s" if result["ttft_ms"] is not None else "-"
+        line = (f"{result['id']:<5}in {result['input_tokens']:>6} (cached {result['cached_tokens']:>6})  "
+                f"out {result['output_tokens']:>5}  ${result['cost']:.4f}  {result['citations']} citations  "
+                f"TTFT {ttft}  total {(result['total_ms'] or 0) / 1000:.2f}s")
+        if result["stale"]:
+            line += "  [stale]"
+        self.stdout.write(line)
+
+    def report(self, summary: dict) -> None:
+        write = self.stdout.write
+        totals = summary["totals"]
+        write("")
+        write(f"Questions    {summary['questions']} ({summary['errors']} errors, {summary['stale']} stale)")
+        write(f"Tokens       in {totals['input_tokens']} (cached {totals['cached_tokens']}), "
+              f"out {totals['output_tokens']}, cost ${totals['cost']:.4f}")
+        write(f"Citations    {totals['citations']}")
+        for name in ("ttft_ms", "total_ms"):
+            p = summary[name]
+            label = "TTFT" if name == "ttft_ms" else "Answer time"
+            write(f"{label:<13}p50 {p['p50'] / 1000:.2f}s  p95 {p['p95'] / 1000:.2f}s  max {p['max'] / 1000:.2f}s")
+        if summary["stale"]:
+            write(self.style.WARNING(
+                f"{summary['stale']} question(s) sent a different request than was recorded; "
+                "their numbers are from the recording. Re-record with --record to measure the change."
+            ))
+
+    def compare(self, summary: dict, baseline: dict, max_regression: float) -> None:
+        before = {r["id"]: r for r in baseline["results"]}
+        self.stdout.write("")
+        self.stdout.write("Changes vs baseline:")
+        changed = 0
+        for result in summary["results"]:
+            old = before.get(result["id"])
+            if old is None:
+                changed += 1
+                self.stdout.write(f"  {result['id']:<5}new")
+                continue
+            diffs = [f"{field} {old[field]} -> {result[field]}" for field in COMPARED
+                     if old.get(field) != result.get(field)]
+            if diffs:
+                changed += 1
+                self.stdout.write(f"  {result['id']:<5}" + ", ".join(diffs))
+        if not changed:
+            self.stdout.write("  none")
+
+        regressions = []
+        totals, base_totals = summary["totals"], baseline["totals"]
+        tokens = totals["input_tokens"] + totals["output_tokens"]
+        base_tokens = base_totals["input_tokens"] + base_totals["output_tokens"]
+        if base_tokens and tokens > base_tokens * (1 + max_regression):
+            regressions.append(f"tokens {base_tokens} -> {tokens}")
+        if base_totals["cost"] and totals["cost"] > base_totals["cost"] * (1 + max_regression):
+            regressions.append(f"cost ${base_totals['cost']:.4f} -> ${totals['cost']:.4f}")
+        p95, base_p95 = summary["total_ms"]["p95"], baseline["total_ms"]["p95"]
+        if base_p95 and p95 > base_p95 * (1 + max_regression):
+            regressions.append(f"p95 answer time {base_p95 / 1000:.2f}s -> {p95 / 1000:.2f}s")
+        if base_totals["citations"] and totals["citations"] < base_totals["citations"] * (1 - max_regression):
+            regressions.append(f"citations {base_totals['citations']} -> {totals['citations']}")
+        if summary["errors"] > baseline["errors"]:
+            regressions.append(f"errors {baseline['errors']} -> {summary['errors']}")
+        if regressions:
+            raise CommandError("Regression vs baseline: " + "; ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"Within {max_regression:.0%} of baseline"))
+
+
+def _percentiles(samples: list) -> dict:
+    ordered = sorted(s for s in samples if s is not None)
+    if not ordered:
+        return {"p50": 0, "p95": 0, "max": 0}
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    return {"p50": at(0.50), "p95": at(0.95), "max": ordered[-1]}
+
+
+def summarize(results: list[dict], mode: str, model: str) -> dict:
+    ok = [r for r in results if not r["error"]]
+    return {
+        "mode": mode,
+        "model": model,
+        "questions": len(results),
+        "errors": len(results) - len(ok),
+        "stale": sum(1 for r in results if r["stale"]),
+        "totals": {
+            "input_tokens": sum(r["input_tokens"] for r in ok),
+            "cached_tokens": sum(r["cached_tokens"] for r in ok),
+            "output_tokens": sum(r["output_tokens"] for r in ok),
+            "cost": round(sum(r["cost"] for r in ok), 6),
+            "citations": sum(r["citations"] for r in ok),
+        },
+        "ttft_ms": _percentiles([r["ttft_ms"] for r in ok]),
+        "total_ms": _percentiles([r["total_ms"] for r in ok]),
+        "results": results,
+    }
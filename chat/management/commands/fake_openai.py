@@ -0,0 +1,235 @@
+"""Management command to run a local stand-in for the OpenAI API.
+
+Speaks enough of the API for the app to run fully offline under load:
+
+* POST /v1/responses with stream=true: the Responses streaming protocol
+  (response.created, file_search_call events when tools are sent, text
+  deltas at a fixed token rate after a configurable time to first token,
+  file_citation annotations, response.completed with usage).
+* POST /v1/chat/completions: summaries, and the structured titles batch.
+* POST /v1/files, /v1/vector_stores/... : minimal JSON so admin pages work.
+
+Errors can be injected: --error-rate answers with HTTP 500 before streaming
+(the model router fails over), --stream-error-rate sends an error event
+mid-stream. Point the app at it with OPENAI_BASE_URL (Daphne and Celery).
+
+Usage:
+    python manage.py fake_openai                                   # 127.0.0.1:8090
+    python manage.py fake_openai --ttft 1.5 --tokens-per-second 40 --tokens 400
+    python manage.py fake_openai --annotations 3 --error-rate 0.02 --stream-error-rate 0.01
+
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 OPENAI_API_KEY=fake OPENAI_VECTOR_STORE_ID=vs_fake daphne ...
+"""
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+WORDS = (
+    "the court held that a tenant must give written notice before the lease ends and the landlord "
+    "may recover possession under the property code if the notice period has passed without cure"
+).split()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    options = {}  # set by the command
+
+    def log_message(self, format, *args):
+        if self.options.get("verbose"):
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+        if random.random() < self.options["error_rate"]:
+            self._json({"error": {"message": "Injected failure", "type": "server_error", "code": None}}, status=500)
+            return
+        path = self.path.split("?")[0]
+        if path.endswith("/responses"):
+            if payload.get("stream"):
+                self._stream_response(payload)
+            else:
+                self._json(self._response_object(payload, _answer_words(self.options["tokens"])))
+        elif path.endswith("/chat/completions"):
+            self._chat_completion(payload)
+        elif "/files" in path or "/vector_stores" in path:
+            self._json({"id": f"file-{uuid.uuid4().hex[:24]}", "object": "file", "status": "completed"})
+        else:
+            self._json({"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}}, status=404)
+
+    def do_GET(self):
+        self._json({"id": self.path.rstrip("/").rsplit("/", 1)[-1], "object": "vector_store", "status": "completed",
+                    "file_counts": {"completed": 0, "failed": 0, "in_progress": 0, "cancelled": 0, "total": 0},
+                    "usage_bytes": 0, "data": []})
+
+    def do_DELETE(self):
+        self._json({"id": self.path.rstrip("/").rsplit("/", 1)[-1], "deleted": True})
+
+    # ─── Responses API ───────────────────────────────────────────────────
+
+    def _stream_response(self, payload):
+        options = self.options
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex}")
+        self.end_headers()
+
+        words = _answer_words(options["tokens"])
+        sequence = iter(range(1_000_000))
+        item_id = f"msg_{uuid.uuid4().hex}"
+        response = self._response_object(payload, [], status="in_progress")
+        try:
+            self._event("response.created", {"response": response}, sequence)
+            ttft = max(0.0, random.gauss(options["ttft"], options["ttft"] * options["jitter"]))
+            if payload.get("tools"):
+                search_id = f"fs_{uuid.uuid4().hex}"
+                self._event("response.file_search_call.in_progress", {"item_id": search_id, "output_index": 0}, sequence)
+                self._event("response.file_search_call.searching", {"item_id": search_id, "output_index": 0}, sequence)
+                time.sleep(ttft * 0.8)
+                self._event("response.file_search_call.completed", {"item_id": search_id, "output_index": 0}, sequence)
+                time.sleep(ttft * 0.2)
+            else:
+                time.sleep(ttft)
+
+            fail_at = len(words) // 2 if random.random() < options["stream_error_rate"] else None
+            interval = 1 / options["tokens_per_second"]
+            annotations = options["annotations"] if payload.get("tools") else 0
+            annotate_every = max(1, len(words) // (annotations + 1)) if annotations else 0
+            for i, word in enumerate(words):
+                if i == fail_at:
+                    self._event("error", {"code": "server_error", "message": "Injected stream failure", "param": None},
+                                sequence)
+                    return
+                delta = word if i == 0 else f" {word}"
+                self._event("response.output_text.delta", {
+                    "item_id": item_id, "output_index": 1, "content_index": 0, "delta": delta,
+                }, sequence)
+                if annotate_every and i and i % annotate_every == 0 and i // annotate_every <= annotations:
+                    n = i // annotate_every
+                    self._event("response.output_text.annotation.added", {
+                        "item_id": item_id, "output_index": 1, "content_index": 0, "annotation_index": n - 1,
+                        "annotation": {"type": "file_citation", "file_id": f"file-fake{n:04d}",
+                                       "filename": f"Fake Source {n}.pdf", "index": i},
+                    }, sequence)
+                time.sleep(interval)
+            self._event("response.completed", {"response": self._response_object(payload, words)}, sequence)
+        except (BrokenPipeError, ConnectionResetError):
+            return  # the app closed the stream (cancel, hedge loser)
+        finally:
+            try:
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def _event(self, event_type, data, sequence):
+        data = {"type": event_type, "sequence_number": next(sequence), **data}
+        frame = f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+        self.wfile.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+        self.wfile.flush()
+
+    def _response_object(self, payload, words, status="completed"):
+        input_tokens = _count_tokens(payload.get("instructions", "")) + _count_tokens(json.dumps(payload.get("input", "")))
+        cached = int(input_tokens * self.options["cached_fraction"]) // 128 * 128
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": status,
+            "model": payload.get("model", "gpt-4o-mini"),
+            "output": [{
+                "type": "message", "id": f"msg_{uuid.uuid4().hex}", "role": "assistant", "status": status,
+                "content": [{"type": "output_text", "text": " ".join(words), "annotations": []}],
+            }] if words else [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": len(words),
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + len(words),
+            } if status == "completed" else None,
+        }
+
+    # ─── Chat Completions (titles, summaries) ────────────────────────────
+
+    def _chat_completion(self, payload):
+        messages = payload.get("messages", [])
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        time.sleep(self.options["ttft"] / 2)
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            ids = re.findall(r"^\[([^\]]+)\]", prompt, re.MULTILINE)
+            content = json.dumps({"titles": [{"id": key, "title": "Load Test Conversation"} for key in ids]})
+        else:
+            content = " ".join(_answer_words(min(self.options["tokens"], 120)))
+        output_tokens = _count_tokens(content)
+        self._json({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": _count_tokens(prompt), "completion_tokens": output_tokens,
+                      "total_tokens": _count_tokens(prompt) + output_tokens},
+        })
+
+    def _json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-request-id", f"req_{uuid.uuid4().hex}")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _answer_words(count: int) -> list[str]:
+    return [WORDS[i % len(WORDS)] for i in range(count)]
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class Command(BaseCommand):
+    help = "Run a local fake OpenAI API (Responses streaming, chat completions) for offline load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument("--ttft", type=float, default=0.8, help="Seconds before the first text delta (default 0.8)")
+        parser.add_argument("--jitter", type=float, default=0.25, help="TTFT standard deviation as a fraction of --ttft")
+        parser.add_argument("--tokens-per-second", type=float, default=60)
+        parser.add_argument("--tokens", type=int, default=250, help="Output tokens per answer")
+        parser.add_argument("--annotations", type=int, default=2, help="file_citation annotations per answer")
+        parser.add_argument("--cached-fraction", type=float, default=0.5, help="Share of input tokens reported as cached")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+        parser.add_argument("--stream-error-rate", type=float, default=0.0,
+                            help="Share of streams that send an error event halfway through")
+        parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+    def handle(self, *args, **options):
+        FakeOpenAIHandler.options = options
+        server = ThreadingHTTPServer((options["host"], options["port"]), FakeOpenAIHandler)
+        server.daemon_threads = True
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake OpenAI API on http://{options['host']}:{options['port']}/v1 — "
+            f"TTFT {options['ttft']}s, {options['tokens']} tokens at {options['tokens_per_second']}/s, "
+            f"errors {options['error_rate']:.0%} + {options['stream_error_rate']:.0%} mid-stream"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
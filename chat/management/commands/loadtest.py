@@ -0,0 +1,309 @@
+"""Management command to load-test the chat pipeline end to end.
+
+Creates synthetic users (loadtest-N@loadtest.invalid) with a signed-in
+session each, then every user posts questions to /chat/<pk>/send/ and reads
+the reply from /chat/<pk>/stream/ like the browser does. Run it against a
+Daphne + Celery deployment whose OPENAI_BASE_URL points at
+`manage.py fake_openai`, so the whole run is offline and repeatable.
+
+Reports time to first token (from the send POST to the first token event),
+total answer time, throughput, failures, and — sampled every second —
+database connections (PostgreSQL), Redis clients and the resident memory of
+the given processes. --output saves the summary as JSON; --baseline compares
+against a saved one and fails when p95 TTFT or throughput regressed by more
+than --max-regression.
+
+Usage:
+    python manage.py fake_openai --ttft 0.8 &
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 daphne -p 8003 core.asgi:application &
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 celery -A core worker -Q interactive,background -P threads -c 32 &
+
+    python manage.py loadtest --users 50 --messages 3 --pid $(pgrep -f daphne)
+    python manage.py loadtest --users 50 --output loadtest.json
+    python manage.py loadtest --users 50 --baseline loadtest.json
+    python manage.py loadtest --cleanup                # Delete the synthetic users and their data
+"""
+import asyncio
+import json
+import threading
+import time
+from importlib import import_module
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.crypto import get_random_string
+
+from chat.models import Conversation
+
+EMAIL_DOMAIN = "loadtest.invalid"
+QUESTIONS = [
+    "What notice does a landlord have to give before filing an eviction in Texas?",
+    "How long does a tenant have to move out after a judgment for possession?",
+    "Can a landlord keep the security deposit for normal wear and tear?",
+    "What are the requirements for adverse possession under the Property Code?",
+    "Hello, thanks for the help!",
+]
+
+
+class Command(BaseCommand):
+    help = "Load-test send/stream with synthetic users and report TTFT percentiles, throughput and resources"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8003", help="Daphne base URL")
+        parser.add_argument("--users", type=int, default=20, help="Concurrent synthetic users (default 20)")
+        parser.add_argument("--messages", type=int, default=3, help="Questions per user, sent one after another")
+        parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which users start")
+        parser.add_argument("--think-time", type=float, default=1.0, help="Seconds between a reply and the next question")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before an answer counts as failed")
+        parser.add_argument("--pid", type=int, action="append", default=[],
+                            help="Sample this process's resident memory (repeatable)")
+        parser.add_argument("--output", help="Write the summary to this JSON file")
+        parser.add_argument("--baseline", help="Compare with a summary written by --output")
+        parser.add_argument("--max-regression", type=float, default=0.2,
+                            help="Allowed p95 TTFT increase / throughput drop vs --baseline (default 0.2 = 20%%)")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the synthetic users and exit")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options["cleanup"]:
+            deleted, _ = User.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+            self.stdout.write(f"Deleted {deleted} row(s) belonging to synthetic users.")
+            return
+
+        users = self.prepare_users(options["users"])
+        sampler = ResourceSampler(options["pid"])
+        sampler.start()
+        started = time.monotonic()
+        try:
+            results = asyncio.run(self.run_users(users, options))
+        finally:
+            sampler.stop()
+        elapsed = time.monotonic() - started
+
+        summary = summarize(results, elapsed, sampler, options)
+        self.report(summary)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(summary, indent=2))
+            self.stdout.write(f"Summary written to {options['output']}")
+        if options["baseline"]:
+            self.compare(summary, json.loads(Path(options["baseline"]).read_text()), options["max_regression"])
+
+    def prepare_users(self, count: int) -> list[dict]:
+        """Synthetic users, each with a fresh conversation and a signed-in session."""
+        User = get_user_model()
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        users = []
+        for i in range(count):
+            user, created = User.objects.get_or_create(email=f"loadtest-{i}@{EMAIL_DOMAIN}")
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=["password"])
+            session = session_store()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            conversation = Conversation.objects.create(user=user, title="Load test")
+            users.append({"index": i, "session": session.session_key, "conversation": str(conversation.pk)})
+        connection.close()
+        self.stdout.write(f"Prepared {count} synthetic user(s).")
+        return users
+
+    async def run_users(self, users: list[dict], options: dict) -> list[dict]:
+        results = []
+        delay = options["ramp"] / max(len(users), 1)
+        tasks = [
+            asyncio.create_task(self.run_user(user, user["index"] * delay, options, results))
+            for user in users
+        ]
+        await asyncio.gather(*tasks)
+        return results
+
+    async def run_user(self, user: dict, start_after: float, options: dict, results: list) -> None:
+        csrf = get_random_string(32)
+        cookies = {settings.SESSION_COOKIE_NAME: user["session"], settings.CSRF_COOKIE_NAME: csrf}
+        timeout = httpx.Timeout(options["timeout"], connect=10.0)
+        async with httpx.AsyncClient(base_url=options["base_url"], cookies=cookies, timeout=timeout) as client:
+            await asyncio.sleep(start_after)
+            for n in range(options["messages"]):
+                question = QUESTIONS[(user["index"] + n) % len(QUESTIONS)]
+                results.append(await self.ask(client, user["conversation"], question, csrf))
+                await asyncio.sleep(options["think_time"])
+
+    async def ask(self, client, conversation: str, question: str, csrf: str) -> dict:
+        result = {"ttft": None, "total": None, "chars": 0, "queued": False, "error": None}
+        started = time.monotonic()
+        try:
+            response = await client.post(
+                f"/chat/{conversation}/send/",
+                data={"message": question},
+                headers={"X-CSRFToken": csrf, "HX-Request": "true", "Referer": str(client.base_url)},
+            )
+            if response.status_code != 200:
+                result["error"] = f"send HTTP {response.status_code}"
+                return result
+            async with client.stream("GET", f"/chat/{conversation}/stream/") as stream:
+                if stream.status_code != 200:
+                    result["error"] = f"stream HTTP {stream.status_code}"
+                    return result
+                async for line in stream.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    event = json.loads(data)
+                    if "token" in event:
+                        if result["ttft"] is None:
+                            result["ttft"] = time.monotonic() - started
+                        result["chars"] += len(event["token"])
+                    elif "queued" in event:
+                        result["queued"] = True
+                    elif "error" in event:
+                        result["error"] = "stream error event"
+        except httpx.HTTPError as e:
+            result["error"] = type(e).__name__
+            return result
+        result["total"] = time.monotonic() - started
+        if result["ttft"] is None and not result["error"]:
+            result["error"] = "no tokens"
+        return result
+
+    def report(self, summary: dict) -> None:
+        write = self.stdout.write
+        write("")
+        write(f"Answers      {summary['ok']} ok, {summary['failed']} failed, {summary['queued']} queued "
+              f"in {summary['elapsed']:.1f}s with {summary['users']} users")
+        for reason, count in sorted(summary["errors"].items()):
+            write(self.style.WARNING(f"             {count} x {reason}"))
+        for name in ("ttft", "total"):
+            p = summary[name]
+            label = "TTFT" if name == "ttft" else "Answer time"
+            write(f"{label:<13}p50 {p['p50']:.2f}s  p95 {p['p95']:.2f}s  p99 {p['p99']:.2f}s  max {p['max']:.2f}s")
+        write(f"Throughput   {summary['answers_per_second']:.2f} answers/s, "
+              f"{summary['chars_per_second']:.0f} chars/s streamed")
+        db = summary["db_connections"]
+        if db:
+            write(f"DB conns     peak {db['peak']}, mean {db['mean']:.1f} (pg_stat_activity, includes this command)")
+        redis_clients = summary["redis_clients"]
+        if redis_clients:
+            write(f"Redis        peak {redis_clients['peak']} clients, mean {redis_clients['mean']:.1f}")
+        for pid, memory in summary["memory_mb"].items():
+            write(f"Memory {pid:<6}start {memory['start']:.1f} MB, peak {memory['peak']:.1f} MB, "
+                  f"end {memory['end']:.1f} MB")
+
+    def compare(self, summary: dict, baseline: dict, max_regression: float) -> None:
+        regressions = []
+        p95, base_p95 = summary["ttft"]["p95"], baseline["ttft"]["p95"]
+        if base_p95 and p95 > base_p95 * (1 + max_regression):
+            regressions.append(f"p95 TTFT {base_p95:.2f}s -> {p95:.2f}s")
+        rate, base_rate = summary["answers_per_second"], baseline["answers_per_second"]
+        if base_rate and rate < base_rate * (1 - max_regression):
+            regressions.append(f"throughput {base_rate:.2f} -> {rate:.2f} answers/s")
+        if summary["failed"] > baseline["failed"]:
+            regressions.append(f"failures {baseline['failed']} -> {summary['failed']}")
+        if regressions:
+            raise CommandError("Regression vs baseline: " + "; ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f"Within {max_regression:.0%} of baseline (p95 TTFT {base_p95:.2f}s -> {p95:.2f}s, "
+            f"{base_rate:.2f} -> {rate:.2f} answers/s)"
+        ))
+
+
+class ResourceSampler:
+    """Samples DB connections, Redis clients and process memory once a second on a background thread."""
+
+    def __init__(self, pids: list[int]):
+        self.pids = pids
+        self.db = []
+        self.redis = []
+        self.memory = {pid: [] for pid in pids}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="loadtest-sampler")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        from core.redis_client import get_redis_client
+
+        redis = get_redis_client()
+        try:
+            while not self._stop.is_set():
+                if connection.vendor == "postgresql":
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+                        self.db.append(cursor.fetchone()[0])
+                try:
+                    self.redis.append(redis.info("clients")["connected_clients"])
+                except Exception:
+                    pass
+                for pid in self.pids:
+                    rss = _rss_mb(pid)
+                    if rss is not None:
+                        self.memory[pid].append(rss)
+                self._stop.wait(1.0)
+        finally:
+            connection.close()
+
+
+def _rss_mb(pid: int) -> float | None:
+    """Resident memory of a process in MB, from /proc (Linux)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def at(q):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": ordered[-1]}
+
+
+def _peak_mean(samples: list[int]) -> dict | None:
+    return {"peak": max(samples), "mean": sum(samples) / len(samples)} if samples else None
+
+
+def summarize(results: list[dict], elapsed: float, sampler: ResourceSampler, options: dict) -> dict:
+    ok = [r for r in results if not r["error"]]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "users": options["users"],
+        "messages_per_user": options["messages"],
+        "elapsed": elapsed,
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "queued": sum(1 for r in results if r["queued"]),
+        "errors": errors,
+        "ttft": _percentiles([r["ttft"] for r in ok]),
+        "total": _percentiles([r["total"] for r in ok]),
+        "answers_per_second": len(ok) / elapsed if elapsed else 0.0,
+        "chars_per_second": sum(r["chars"] for r in ok) / elapsed if elapsed else 0.0,
+        "db_connections": _peak_mean(sampler.db),
+        "redis_clients": _peak_mean(sampler.redis),
+        "memory_mb": {
+            str(pid): {"start": samples[0], "peak": max(samples), "end": samples[-1]}
+            for pid, samples in sampler.memory.items() if samples
+        },
+    }
@@ -0,0 +1,24 @@
+"""Management command to (re)train the local query router.
+
+Builds the per-domain keyword model from Document titles and UsageLog query
+history and stores it in the cache, where every web and worker process picks
+it up within a few minutes. Also runs daily from Celery beat.
+
+Usage:
+    python manage.py train_query_router
+"""
+from django.core.management.base import BaseCommand
+
+from chat.services.router import train_router
+
+
+class Command(BaseCommand):
+    help = "Train the local query router from Documents and UsageLog history"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Training query router...")
+        result = train_router()
+        self.stdout.write(self.style.SUCCESS(
+            f"Query router trained: {result['documents']} documents, {result['queries']} queries, "
+            f"{result['terms']} terms."
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 10:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', 'is_archived', '-is_pinned', '-updated_at'], name='chat_conv_sidebar_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 import uuid
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 
 class Conversation(models.Model):
@@ -9,11 +10,27 @@ class Conversation(models.Model):
     title = models.CharField(max_length=200, default="New Conversation")
     is_pinned = models.BooleanField(default=False)
     is_archived = models.BooleanField(default=False)
+    # Denormalized counters — maintained by Message.save() / UsageLog.save(),
+    # rebuilt with `manage.py backfill_conversation_stats`.
+    message_count = models.IntegerField(default=0)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    total_tokens = models.IntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=6, default=0)
+    # Responses API state chaining (CHAT_STATEFUL_RESPONSES): the id of the last
+    # stored response and the summary that was current when the chain started
+    last_response_id = models.CharField(max_length=100, blank=True, default="")
+    response_chain_summary_id = models.UUIDField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # Sidebar listing: filter by user/archived, order by pinned then recency
+            models.Index(fields=["user", "is_archived", "-is_pinned", "-updated_at"], name="chat_conv_sidebar_idx"),
+            # Admin conversation list: all users, newest activity first
+            models.Index(fields=["-updated_at"], name="chat_conv_recent_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user.email})"
@@ -30,15 +47,52 @@ class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="messages")
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     content = models.TextField()
+    # Pre-rendered, sanitized HTML for assistant messages (see chat.services.markdown)
+    content_html = models.TextField(blank=True, default="")
     citations = models.JSONField(default=list, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Windowed loading: newest-first keyset scans within a conversation
+            models.Index(fields=["conversation", "-created_at"], name="chat_msg_window_idx"),
+        ]
 
     def __str__(self):
         return f"{self.role}: {self.content[:50]}"
 
+    def save(self, *args, **kwargs):
+        """Save the message and bump the conversation counters in the same transaction."""
+        is_new = self._state.adding
+        if self.role == "assistant" and self.content and not self.content_html:
+            from chat.services.markdown import render_markdown
+            self.content_html = render_markdown(self.content)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                Conversation.objects.filter(pk=self.conversation_id).update(
+                    message_count=F("message_count") + 1,
+                    last_message_at=self.created_at,
+                )
+
+    @property
+    def rendered_html(self) -> str:
+        """Stored HTML for this message, rendering and persisting it once for older rows."""
+        if not self.content_html and self.content:
+            from chat.services.markdown import render_markdown
+            self.content_html = render_markdown(self.content)
+            Message.objects.filter(pk=self.pk).update(content_html=self.content_html)
+        return self.content_html
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Conversation.objects.filter(pk=self.conversation_id).update(
+                message_count=F("message_count") - 1,
+            )
+        return result
+
 
 class ConversationSummary(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
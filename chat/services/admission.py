@@ -0,0 +1,183 @@
+"""Admission control — caps concurrent upstream answer streams.
+
+Every answer holds a slot for as long as its OpenAI stream is open. Slots
+are Redis semaphores, so the limits hold across all generation workers:
+
+* CHAT_MAX_CONCURRENT_STREAMS for everyone together, and
+* CHAT_MAX_STREAMS_PER_USER for any one user (many tabs, rapid resends).
+
+A request that cannot start waits in one FIFO queue; staff wait in a
+priority lane ahead of everyone else. A request first takes one of its
+user's slots and only then joins the global queue, so a user who is over
+their own limit never blocks the queue for others. While waiting, the
+queue position is reported through the generation buffer as
+{"queued": {"position": N}} ({"position": 0} once admitted).
+
+Waiting never holds a worker: try_admit() makes one attempt and raises
+AdmissionQueued, and the generate_response task retries itself after
+RETRY_SECONDS, keeping its place in the queue.
+
+Slots and queue places are leases (LEASE_SECONDS). An admitted request
+renews its slot from a background timer for as long as it holds it, however
+long the upstream stays silent, so only a crashed worker loses it.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 60
+RENEW_INTERVAL = 15
+RETRY_SECONDS = 0.5  # between admission attempts; well inside LEASE_SECONDS, so the queue place is kept
+PRIORITY_OFFSET = 10 ** 13  # ms; orders every normal ticket after every staff ticket
+UNLIMITED = 10 ** 6
+
+HOLDERS_KEY = "chat:admit:holders"
+QUEUE_KEY = "chat:admit:queue"
+WAITING_KEY = "chat:admit:waiting"
+
+# KEYS: holders, user holders, queue, waiting
+# ARGV: ticket, now, lease expiry, global limit, user limit, queue order score
+# Returns 0 when admitted, otherwise the 1-based queue position.
+_ACQUIRE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[2])
+for _, t in ipairs(stale) do
+    redis.call('ZREM', KEYS[3], t)
+    redis.call('ZREM', KEYS[4], t)
+end
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[5]) then
+        return redis.call('ZCARD', KEYS[3]) + 1
+    end
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+end
+redis.call('ZADD', KEYS[2], 'XX', ARGV[3], ARGV[1])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[6], ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+local rank = redis.call('ZRANK', KEYS[3], ARGV[1])
+if rank < tonumber(ARGV[4]) - redis.call('ZCARD', KEYS[1]) then
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    redis.call('ZREM', KEYS[4], ARGV[1])
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    return 0
+end
+return rank + 1
+"""
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a request waited CHAT_ADMISSION_TIMEOUT seconds without getting a slot."""
+
+
+class AdmissionQueued(Exception):
+    """Raised by try_admit() while the request waits its turn; try again after RETRY_SECONDS."""
+
+    def __init__(self, position: int, enqueued_at: float):
+        super().__init__(f"Queued at position {position}")
+        self.position = position
+        self.enqueued_at = enqueued_at
+
+
+def _user_key(user_id) -> str:
+    return f"chat:admit:user:{user_id}"
+
+
+class Admission:
+    """One answer's claim on a stream slot. ticket is unique per generation (the user message id).
+
+    enqueued_at (epoch seconds) is when the request first asked for a slot;
+    pass it back on every retry so the queue order and the timeout count
+    from the first attempt.
+    """
+
+    def __init__(self, ticket, user_id, priority: bool = False, enqueued_at: float | None = None):
+        self.ticket = str(ticket)
+        self.user_key = _user_key(user_id)
+        self.redis = get_redis_client()
+        self.enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        enqueued_ms = int(self.enqueued_at * 1000)
+        self.order = enqueued_ms if priority else enqueued_ms + PRIORITY_OFFSET
+        self.admitted = False
+        self._released = threading.Event()
+        self._acquire = self.redis.register_script(_ACQUIRE)
+
+    def poll(self) -> int:
+        """Try to take a slot: 0 when admitted, otherwise the current queue position."""
+        now = time.time()
+        position = self._acquire(
+            keys=[HOLDERS_KEY, self.user_key, QUEUE_KEY, WAITING_KEY],
+            args=[
+                self.ticket, now, now + LEASE_SECONDS,
+                settings.CHAT_MAX_CONCURRENT_STREAMS, settings.CHAT_MAX_STREAMS_PER_USER or UNLIMITED, self.order,
+            ],
+        )
+        if position == 0:
+            self.admitted = True
+        return position
+
+    def try_admit(self, on_position, should_stop, last_position: int = 0) -> bool:
+        """One admission attempt. True once admitted (the slot is then renewed until release()).
+
+        Returns False if should_stop() is true, raises AdmissionQueued while
+        the request must wait and AdmissionTimeout once it waited
+        CHAT_ADMISSION_TIMEOUT seconds. on_position(n) is called when the
+        position differs from last_position, the one reported by the
+        previous attempt, including 0 on admission after having waited.
+        """
+        position = self.poll()
+        if position != last_position:
+            on_position(position)
+        if position == 0:
+            self._start_renewing()
+            return True
+        if should_stop():
+            self.release()
+            return False
+        if time.time() - self.enqueued_at >= settings.CHAT_ADMISSION_TIMEOUT:
+            self.release()
+            raise AdmissionTimeout(f"No stream slot after {settings.CHAT_ADMISSION_TIMEOUT}s (position {position})")
+        raise AdmissionQueued(position, self.enqueued_at)
+
+    def _start_renewing(self) -> None:
+        def renew_until_released():
+            while not self._released.wait(RENEW_INTERVAL):
+                try:
+                    self.renew()
+                except Exception:
+                    logger.warning(f"Could not renew stream slot {self.ticket}", exc_info=True)
+
+        threading.Thread(target=renew_until_released, daemon=True, name=f"admission-{self.ticket}").start()
+
+    def renew(self) -> None:
+        """Extend the slot lease (only if it is still held)."""
+        if not self.admitted:
+            return
+        expiry = time.time() + LEASE_SECONDS
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(HOLDERS_KEY, {self.ticket: expiry}, xx=True)
+        pipe.zadd(self.user_key, {self.ticket: expiry}, xx=True)
+        pipe.execute()
+
+    def release(self) -> None:
+        self._released.set()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(HOLDERS_KEY, self.ticket)
+        pipe.zrem(self.user_key, self.ticket)
+        pipe.zrem(QUEUE_KEY, self.ticket)
+        pipe.zrem(WAITING_KEY, self.ticket)
+        pipe.execute()
+        self.admitted = False
+
+
+def admission_enabled() -> bool:
+    return settings.CHAT_MAX_CONCURRENT_STREAMS > 0
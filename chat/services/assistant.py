@@ -2,15 +2,34 @@
 
 Uses the Responses API (not the deprecated Assistants API).
 No threads or assistant objects — we manage conversation history ourselves.
+
+Requests are laid out for OpenAI prompt caching: the tool definitions and
+instructions (SYSTEM_PROMPT only) are byte-identical on every call, and
+everything that varies — the conversation summary, then the history — comes
+after them in `input`. Every request carries the same prompt_cache_key so
+they are routed to the same cache. Cache hits are reported per call as
+usage.input_tokens_details.cached_tokens and stored on UsageLog.
 """
+import hashlib
 import json
 import logging
 import os
+import time
 from datetime import datetime
 
+import openai
+
 from django.conf import settings
+from core.metrics import (
+    CHAT_CITATION_SECONDS, CHAT_RESPONSES, CHAT_STREAM_SECONDS, CHAT_TOKENS, CHAT_TOKENS_PER_SECOND,
+    CHAT_TOOL_EVENTS, CHAT_TTFT, timed,
+)
+from core import tracing
 from core.openai_client import get_openai_client
+from chat.services import hedging
 from chat.services.llm import SYSTEM_PROMPT
+from chat.services.model_router import FAILOVER_ERRORS, TASK_ANSWER, rank_models, record_error, record_success
+from chat.services.pricing import compute_cost
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +38,33 @@ RAW_LOG_DIR = os.path.join(settings.BASE_DIR, "logs")
 RAW_LOG_FILE = os.path.join(RAW_LOG_DIR, "raw_responses.log")
 
 
+def _prompt_cache_key(model: str) -> str:
+    """Stable per deployment; changes only when the prompt or model does."""
+    if settings.OPENAI_PROMPT_CACHE_KEY:
+        return settings.OPENAI_PROMPT_CACHE_KEY
+    digest = hashlib.sha256(f"{model}\n{SYSTEM_PROMPT}".encode()).hexdigest()
+    return f"tle-chat-{digest[:16]}"
+
+
+def _tools() -> list[dict]:
+    """Tool definitions — part of the cached prefix, so keep them deterministic."""
+    if not settings.OPENAI_VECTOR_STORE_ID:
+        return []
+    return [{
+        "type": "file_search",
+        "vector_store_ids": [settings.OPENAI_VECTOR_STORE_ID],
+        "max_num_results": 5,
+    }]
+
+
+def _cached_tokens(usage) -> int:
+    """Read input_tokens_details.cached_tokens (an object, or a dict on older SDKs)."""
+    details = getattr(usage, "input_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
 def _log_raw(data: str):
     """Append a line to the raw response log file."""
     os.makedirs(RAW_LOG_DIR, exist_ok=True)
@@ -26,93 +72,196 @@ def _log_raw(data: str):
         f.write(data + "\n")
 
 
-def stream_response(conversation_history: list[dict], summary: str = ""):
+def stream_response(
+    conversation_history: list[dict],
+    summary: str = "",
+    previous_response_id: str = "",
+    new_turns: list[dict] | None = None,
+    file_search: bool = True,
+):
     """Stream a response using the Responses API with file_search.
 
     Args:
         conversation_history: List of {"role": "user"|"assistant", "content": "..."} dicts.
         summary: Optional conversation summary for long conversations.
+        previous_response_id: Stored response to chain onto (stateful mode).
+        new_turns: Messages since that response; sent instead of the full
+            history when chaining. Falls back to history + summary if the
+            previous response is gone.
+        file_search: False to answer without the file_search tool (small
+            talk; see chat.services.router).
 
     Yields dicts:
         {"token": "..."} for each text chunk
         {"citations": [...]} at the end if file citations were found
+        {"response_id": "resp_..."} once the response has completed
+        {"usage": {...}} last, with input/output/cached token counts and the model used
+
+    The model is chosen per request by chat.services.model_router; if opening
+    the stream fails with a transient error, the next-ranked model is tried.
     """
     client = get_openai_client()
     vector_store_id = settings.OPENAI_VECTOR_STORE_ID
 
-    # Build input messages
-    input_messages = []
-    for msg in conversation_history:
-        input_messages.append({"role": msg["role"], "content": msg["content"]})
-
-    # Build instructions with summary context
+    # Static prefix: tools + instructions never change between requests
+    # (one variant with file_search, one without)
+    tools = _tools() if file_search else []
     instructions = SYSTEM_PROMPT
+
+    # Volatile suffix: summary first (changes rarely), then the history
+    input_messages = []
     if summary:
-        instructions += f"\n\nCONVERSATION SUMMARY (prior context):\n{summary}"
-
-    # Configure tools
-    tools = []
-    if vector_store_id:
-        tools.append({
-            "type": "file_search",
-            "vector_store_ids": [vector_store_id],
-            "max_num_results": 5,
+        input_messages.append({
+            "role": "developer",
+            "content": f"CONVERSATION SUMMARY (prior context):\n{summary}",
         })
+    for msg in conversation_history:
+        input_messages.append({"role": msg["role"], "content": msg["content"]})
 
     # Log request details
     timestamp = datetime.now().isoformat()
     _log_raw(f"\n{'='*80}")
     _log_raw(f"[{timestamp}] NEW REQUEST")
     _log_raw(f"{'='*80}")
-    _log_raw(f"Model: {settings.OPENAI_CHAT_MODEL}")
-    _log_raw(f"Vector Store: {vector_store_id}")
+    _log_raw(f"Vector Store: {vector_store_id if tools else '(file_search skipped)'}")
     _log_raw(f"History ({len(input_messages)} messages):")
     for msg in input_messages:
         _log_raw(f"  [{msg['role']}]: {msg['content'][:200]}{'...' if len(msg['content']) > 200 else ''}")
     _log_raw(f"Summary: {summary[:200] if summary else '(none)'}")
     _log_raw(f"{'-'*80}")
 
-    # Stream response
-    stream = client.responses.create(
-        model=settings.OPENAI_CHAT_MODEL,
-        instructions=instructions,
-        input=input_messages,
-        tools=tools,
-        temperature=0.3,
-        stream=True,
-    )
+    def create(model, input_items, **extra):
+        return client.responses.create(
+            model=model,
+            instructions=instructions,
+            input=input_items,
+            tools=tools,
+            temperature=0.3,
+            stream=True,
+            # Not a named argument in the pinned SDK version yet
+            extra_body={"prompt_cache_key": _prompt_cache_key(model)},
+            **extra,
+        )
+
+    # Stream response — chained onto the previous response when possible.
+    # Instructions and tools are never inherited from it, so they are resent.
+    def open_stream(model):
+        if previous_response_id and new_turns:
+            _log_raw(f"Chained on {previous_response_id} with {len(new_turns)} new turn(s)")
+            try:
+                return create(
+                    model,
+                    [{"role": msg["role"], "content": msg["content"]} for msg in new_turns],
+                    previous_response_id=previous_response_id,
+                    truncation="auto",
+                )
+            except (openai.NotFoundError, openai.BadRequestError) as e:
+                # Expired or deleted response: rebuild from the full history instead
+                logger.info(f"Response chain {previous_response_id} unavailable, sending full history: {e}")
+                _log_raw(f"CHAIN BROKEN: {e}")
+        return create(model, input_messages)
+
+    prompt_chars = len(instructions) + sum(len(msg["content"]) for msg in input_messages)
+    models = rank_models(TASK_ANSWER, prompt_chars)
+    for attempt, model in enumerate(models, start=1):
+        started = time.monotonic()
+        started_at = time.time()
+        try:
+            stream = open_stream(model)
+            break
+        except FAILOVER_ERRORS as e:
+            record_error(model)
+            if attempt == len(models):
+                raise
+            logger.warning(f"Answer stream on {model} failed ({e.__class__.__name__}), failing over to {models[attempt]}")
+            _log_raw(f"FAILOVER: {model} -> {models[attempt]}: {e}")
+    _log_raw(f"Model: {model}")
+    hedged = None
+    if settings.CHAT_HEDGE_ENABLED:
+        # Same model, same input; only the slower of the two starts is cancelled
+        hedging.count_request()
+        hedged = hedging.HedgedStream(stream, lambda: open_stream(model), settings.CHAT_HEDGE_AFTER_MS / 1000)
+        stream = hedged
 
     annotations_collected = []
-    full_text = ""
+    text_parts = []
     all_events = []
-    usage_data = {"input_tokens": 0, "output_tokens": 0}
-
-    for event in stream:
-        # Log every event type
-        all_events.append(event.type)
-
-        if event.type == "response.output_text.delta":
-            full_text += event.delta
-            yield {"token": event.delta}
-        elif event.type == "response.output_text.annotation.added":
-            # Log full annotation details
-            annotation_data = {
-                "type": getattr(event.annotation, "type", None),
-                "file_id": getattr(event.annotation, "file_id", None),
-                "filename": getattr(event.annotation, "filename", None),
-                "index": getattr(event.annotation, "index", None),
-            }
-            _log_raw(f"  ANNOTATION: {json.dumps(annotation_data)}")
-            annotations_collected.append(event.annotation)
-        elif event.type == "response.completed":
-            # Extract token usage from completed response
-            response = event.response
-            if hasattr(response, "usage") and response.usage:
-                usage_data["input_tokens"] = getattr(response.usage, "input_tokens", 0)
-                usage_data["output_tokens"] = getattr(response.usage, "output_tokens", 0)
-                _log_raw(f"  USAGE: input_tokens={usage_data['input_tokens']}, output_tokens={usage_data['output_tokens']}")
+    usage_data = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "model": model}
+    response_id = ""
+    ttft = None
+    search_times = {}  # first file_search_call event and its completion, for the trace
+
+    try:
+        for event in stream:
+            # Log every event type
+            all_events.append(event.type)
+
+            if event.type.startswith("response.file_search_call"):
+                search_times.setdefault("start", time.monotonic())
+                if event.type.endswith(".completed"):
+                    search_times["end"] = time.monotonic()
+            if event.type == "response.output_text.delta":
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                text_parts.append(event.delta)
+                yield {"token": event.delta}
+            elif event.type == "response.output_text.annotation.added":
+                # Log full annotation details
+                annotation_data = {
+                    "type": getattr(event.annotation, "type", None),
+                    "file_id": getattr(event.annotation, "file_id", None),
+                    "filename": getattr(event.annotation, "filename", None),
+                    "index": getattr(event.annotation, "index", None),
+                }
+                _log_raw(f"  ANNOTATION: {json.dumps(annotation_data)}")
+                annotations_collected.append(event.annotation)
+            elif event.type == "response.completed":
+                # Extract token usage from completed response
+                response = event.response
+                if getattr(response, "id", None):
+                    response_id = response.id
+                if hasattr(response, "usage") and response.usage:
+                    usage_data["input_tokens"] = getattr(response.usage, "input_tokens", 0)
+                    usage_data["output_tokens"] = getattr(response.usage, "output_tokens", 0)
+                    usage_data["cached_tokens"] = _cached_tokens(response.usage)
+                    _log_raw(
+                        f"  USAGE: input_tokens={usage_data['input_tokens']}, output_tokens={usage_data['output_tokens']}, "
+                        f"cached_tokens={usage_data['cached_tokens']}"
+                    )
+    except Exception:
+        record_error(model)
+        CHAT_STREAM_SECONDS.labels(model, "error").observe(time.monotonic() - started)
+        raise
+    finally:
+        # Closing the HTTP stream cancels the upstream request if the caller stops early
+        stream.close()
+    router_ttft = ttft if ttft is not None else time.monotonic() - started
+    if hedged and hedged.hedged and hedged.primary_first_text_at() is not None:
+        # The primary's own time, not the hedge's: the router must see the model that needed rescuing
+        router_ttft = hedged.primary_first_text_at() - started
+    record_success(model, router_ttft)
+    _observe_stream(model, time.monotonic() - started, ttft, usage_data, all_events, bool(tools))
+    tracing.record_span(
+        "openai.stream", started_at, time.monotonic() - started,
+        model=model, ttft_ms=round(ttft * 1000) if ttft is not None else None, file_search=bool(tools),
+        input_tokens=usage_data["input_tokens"], output_tokens=usage_data["output_tokens"],
+        cached_tokens=usage_data["cached_tokens"], hedged=bool(hedged and hedged.hedged), response_id=response_id,
+    )
+    if "start" in search_times:
+        tracing.record_span(
+            "file_search", started_at + (search_times["start"] - started),
+            search_times.get("end", search_times["start"]) - search_times["start"],
+        )
+    if hedged and hedged.hedged:
+        # The loser was cancelled before its first token: roughly its input tokens were billed
+        outcome = "hedge" if hedged.winner == 1 else "primary"
+        extra_cost = compute_cost(usage_data["input_tokens"], 0, usage_data["cached_tokens"], model)
+        hedging.record_outcome(outcome, ttft or 0.0, extra_cost)
+        logger.info(f"Hedged answer on {model}: {outcome} won, TTFT {ttft or 0:.2f}s, est. extra cost ${extra_cost:.6f}")
+        _log_raw(f"HEDGE: {outcome} won, ttft={ttft or 0:.2f}s, extra_cost={extra_cost:.6f}")
 
     # Log full response text
+    full_text = "".join(text_parts)
     _log_raw(f"{'-'*80}")
     _log_raw(f"FULL RESPONSE TEXT:")
     _log_raw(full_text)
@@ -123,17 +272,36 @@ def stream_response(conversation_history: list[dict], summary: str = ""):
 
     # Resolve citations after streaming completes
     if annotations_collected:
-        citations = resolve_file_citations(annotations_collected)
+        with timed(CHAT_CITATION_SECONDS), tracing.span("citations", annotations=len(annotations_collected)):
+            citations = resolve_file_citations(annotations_collected)
         _log_raw(f"RESOLVED CITATIONS: {json.dumps(citations, indent=2)}")
         if citations:
             yield {"citations": citations}
 
+    if response_id:
+        yield {"response_id": response_id}
+
     # Yield usage data for the view to save
     yield {"usage": usage_data}
 
     _log_raw(f"{'='*80}\n")
 
 
+def _observe_stream(model, duration, ttft, usage_data, event_types, file_search):
+    """Record a completed answer stream in core.metrics."""
+    CHAT_STREAM_SECONDS.labels(model, "ok").observe(duration)
+    CHAT_RESPONSES.labels(model, "true" if file_search else "false").inc()
+    for kind in ("input", "output", "cached"):
+        CHAT_TOKENS.labels(model, kind).inc(usage_data[f"{kind}_tokens"])
+    if ttft is not None:
+        CHAT_TTFT.labels(model).observe(ttft)
+        if usage_data["output_tokens"] and duration > ttft:
+            CHAT_TOKENS_PER_SECOND.labels(model).observe(usage_data["output_tokens"] / (duration - ttft))
+    for event_type in event_types:
+        if event_type.startswith("response.file_search_call"):
+            CHAT_TOOL_EVENTS.labels(event_type).inc()
+
+
 def resolve_file_citations(annotations) -> list[dict]:
     """Map file_citation annotations to document titles.
 
@@ -0,0 +1,26 @@
+"""Opaque keyset-pagination cursors for HTMX "load more" endpoints.
+
+A cursor is the sort key of the last row on the previous page, JSON-encoded
+and base64'd so it can travel in a query string.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values) -> str:
+    """Encode sort-key values (bool/str/datetime/UUID) into a URL-safe token."""
+    payload = [v.isoformat() if isinstance(v, datetime) else v if isinstance(v, bool) else str(v) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list | None:
+    """Decode a cursor produced by encode_cursor(). Returns None if malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
@@ -0,0 +1,57 @@
+"""Per-user push notifications over Redis pub/sub, delivered to the browser via SSE.
+
+Background work (e.g. title generation) publishes small JSON events on the
+user's channel; each open chat tab holds one chat:events stream that relays
+them. Event schema:
+    {"type": "title", "conversation_id": "<uuid>", "title": "..."}
+"""
+import json
+import logging
+import time
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS = 15
+
+
+def user_channel(user_id) -> str:
+    return f"user-events:{user_id}"
+
+
+def publish_user_event(user_id, event: dict) -> None:
+    """Publish an event to a user's channel. Failures are logged, never raised."""
+    try:
+        get_redis_client().publish(user_channel(user_id), json.dumps(event))
+    except redis.RedisError:
+        logger.warning(f"Could not publish {event.get('type')} event for user {user_id}", exc_info=True)
+
+
+async def user_event_stream(user_id):
+    """Async generator of SSE frames for a user's channel, with keepalive comments."""
+    client = aioredis.Redis.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(user_channel(user_id))
+        yield ": connected\n\n"
+        last_sent = time.monotonic()
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=HEARTBEAT_SECONDS)
+            if message is None:
+                # Timed out (or a subscribe ack) — keep proxies from closing an idle stream
+                if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                continue
+            data = message["data"].decode() if isinstance(message["data"], bytes) else message["data"]
+            yield f"data: {data}\n\n"
+            last_sent = time.monotonic()
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,492 @@
+"""Answer generation pipeline — history, upstream stream, persistence.
+
+Generation is decoupled from the browser connection. The generate_response
+Celery task runs generate_events() and appends each SSE payload, numbered by
+Redis stream id, to a per-user-message stream (GenerationBuffer). The SSE
+endpoint is a pure reader: it replays the stream from the start, or from the
+browser's Last-Event-ID after a dropped connection, so a reload or reconnect
+never starts a second upstream request. ensure_generation() is the
+singleflight guard keyed on the user message id.
+
+A reader can cancel a running generation (GenerationBuffer.cancel()); the
+producer notices within CANCEL_CHECK_INTERVAL and closes the upstream call.
+
+Speculative mode (CHAT_SPECULATIVE_START): send_message starts generation
+immediately instead of waiting for the SSE request. If nobody attaches within
+CHAT_SPECULATIVE_ATTACH_TIMEOUT seconds the producer cancels the upstream call.
+"""
+import contextvars
+import logging
+import queue
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from adminpanel.models import UsageLog
+from chat.models import Conversation, Message
+from chat.services.admission import Admission, AdmissionQueued, AdmissionTimeout, admission_enabled
+from chat.services.assistant import stream_response as assistant_stream_response
+from chat.services.markdown import MarkdownBlockStream
+from chat.services.pricing import compute_cost
+from chat.services.router import route
+from chat.services.sidebar import invalidate_sidebar
+from chat.services.sse import (
+    DONE, DONE_BYTES, FRAME_DATA, FRAME_END, FRAME_ID, KEEPALIVE_FRAME,
+    TokenCoalescer, encode_event, retry_frame,
+)
+from chat.tasks import generate_conversation_title, summarize_conversation
+from core import tracing
+from core.db import release_db_connections
+from core.metrics import CHAT_DB_SECONDS, timed
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+MAX_HISTORY_CHARS = 16000  # ~4000 tokens (1 token ≈ 4 chars)
+MAX_MESSAGES = 10
+
+BUFFER_TTL = 10 * 60  # seconds a finished/abandoned buffer is kept for replay
+STALL_TIMEOUT = 180  # seconds without a new event before a reader gives up
+RECONNECT_MS = 1000  # EventSource reconnect delay sent to the browser
+CANCEL_CHECK_INTERVAL = 0.5  # seconds between producer checks for a cancel request
+_EVENT_ID_RE = re.compile(r"\d+-\d+")
+_IDLE = object()
+
+
+def _read_ahead(chunks, wait_for):
+    """Iterate `chunks` on a background thread, yielding _IDLE when a wait runs out.
+
+    wait_for() is asked before every wait for the next chunk and returns the
+    timeout in seconds, or None to wait as long as it takes. Upstream reads
+    block, so this is what lets the caller act during a pause (a tool call,
+    slow generation) instead of only when the next chunk arrives. Closing the
+    generator stops the reader, which closes `chunks` after its next chunk.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        iterator = iter(chunks)
+        try:
+            for chunk in iterator:
+                items.put(("chunk", chunk))
+                if stop.is_set():
+                    break
+            else:
+                items.put(("end", None))
+        except Exception as e:
+            items.put(("error", e))
+        finally:
+            iterator.close()
+            # Citation lookup at the end of the stream runs on this thread
+            release_db_connections()
+
+    # Copy the context so upstream calls keep the trace (and cassette) of the caller
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(pump,), daemon=True, name="answer-upstream").start()
+    try:
+        while True:
+            try:
+                kind, value = items.get(timeout=wait_for())
+            except queue.Empty:
+                yield _IDLE
+                continue
+            if kind == "end":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+
+def build_history(conv) -> tuple[list[dict], str, int]:
+    """Return (history, summary, total_chars) for the next upstream request.
+
+    History is the newest messages that fit in MAX_HISTORY_CHARS, capped at
+    MAX_MESSAGES, oldest first. Always includes at least one message.
+    """
+    history = []
+    total_chars = 0
+    for msg in conv.messages.order_by("-created_at")[:MAX_MESSAGES]:  # newest first
+        msg_chars = len(msg.content)
+        if total_chars + msg_chars > MAX_HISTORY_CHARS and history:
+            break  # already have at least 1 message, stop adding
+        history.insert(0, {"role": msg.role, "content": msg.content})
+        total_chars += msg_chars
+
+    summary = ""
+    latest_summary = conv.summaries.first()
+    if latest_summary:
+        summary = latest_summary.summary_text
+    return history, summary, total_chars
+
+
+def chained_turns(conv, summary_id) -> tuple[str, list[dict]]:
+    """Return (previous_response_id, new user turns) to continue the response chain.
+
+    `summary_id` is the latest summary's id. Returns ("", []) when the chain
+    cannot be continued — no stored response, or a different summary than the
+    one the chain started from (the chain would still carry the old context)
+    — and the full history must be sent.
+    """
+    if not conv.last_response_id or summary_id != conv.response_chain_summary_id:
+        return "", []
+    last_assistant = conv.messages.filter(role="assistant").order_by("-created_at").first()
+    if last_assistant is None:
+        return "", []
+    turns = [
+        {"role": msg.role, "content": msg.content}
+        for msg in conv.messages.filter(role="user", created_at__gt=last_assistant.created_at).order_by("created_at")
+    ]
+    return conv.last_response_id, turns
+
+
+def generate_events(conv, last_user_msg):
+    """Run one chat turn and yield the SSE event dicts, saving the result at the end.
+
+    Yields {"token"}, {"html_block", "chars"}, {"message_html"} and {"citations"}
+    dicts in the order the client expects. The caller appends [DONE]. Upstream
+    deltas are coalesced (see TokenCoalescer), so one token event usually
+    carries many deltas.
+    """
+    # Step 1-2: Build conversation history and summary. In stateful mode only
+    # the new turns are sent, chained onto the last stored response; the full
+    # history is still built for the fallback and the summarization trigger.
+    # Read the summary id first: if a newer summary lands meanwhile, the next
+    # turn sees a mismatch and rebuilds rather than missing it.
+    summary_id = conv.summaries.values_list("id", flat=True).first()
+    with timed(CHAT_DB_SECONDS, phase="history"), tracing.span("db.history") as attrs:
+        history, summary, total_chars = build_history(conv)
+        attrs.update(messages=len(history), chars=total_chars, summary=bool(summary))
+    # Local routing (microseconds): small talk skips file_search; the domain goes to UsageLog
+    routed = route(last_user_msg.content)
+    chain = {} if routed["retrieval"] else {"file_search": False}
+    if settings.CHAT_STATEFUL_RESPONSES:
+        previous_response_id, new_turns = chained_turns(conv, summary_id)
+        if previous_response_id and new_turns:
+            chain.update(previous_response_id=previous_response_id, new_turns=new_turns)
+    # No DB work until the stream ends — don't hold a connection through it
+    release_db_connections()
+
+    # Step 3: Stream response via Responses API
+    parts = []
+    citations = []
+    usage_data = {"input_tokens": 0, "output_tokens": 0}
+    response_id = ""
+    blocks = MarkdownBlockStream()
+    coalescer = TokenCoalescer()
+    pending_blocks = []
+
+    def flushed(text):
+        # Token first, then the server-rendered blocks it completed (they refer to its chars)
+        events = [{"token": text}] if text else []
+        events.extend({"html_block": block["html"], "chars": block["chars"]} for block in pending_blocks)
+        pending_blocks.clear()
+        return events
+
+    for chunk in _read_ahead(assistant_stream_response(history, summary, **chain), coalescer.due_in):
+        if chunk is _IDLE:
+            # Upstream paused with text buffered; send it rather than wait for the next delta
+            yield from flushed(coalescer.flush())
+        elif "token" in chunk:
+            parts.append(chunk["token"])
+            pending_blocks.extend(blocks.feed(chunk["token"]))
+            text = coalescer.add(chunk["token"])
+            if text:
+                yield from flushed(text)
+        elif "citations" in chunk:
+            citations = chunk["citations"]
+        elif "response_id" in chunk:
+            response_id = chunk["response_id"]
+        elif "usage" in chunk:
+            usage_data = chunk["usage"]
+    yield from flushed(coalescer.flush())
+    full_response = "".join(parts)
+
+    # Step 4-5: Save assistant message (renders content_html once) and log usage
+    # with token counts and cost — one short transaction, nothing yielded inside it
+    in_tokens = usage_data.get("input_tokens", 0)
+    out_tokens = usage_data.get("output_tokens", 0)
+    cached_tokens = usage_data.get("cached_tokens", 0)
+    model = usage_data.get("model", "")
+    cost = compute_cost(in_tokens, out_tokens, cached_tokens, model)
+    with timed(CHAT_DB_SECONDS, phase="save"), tracing.span("db.save"), transaction.atomic():
+        assistant_msg = Message.objects.create(
+            conversation=conv,
+            role="assistant",
+            content=full_response,
+            citations=citations,
+        )
+        UsageLog.objects.create(
+            user=conv.user,
+            conversation=conv,
+            query_text=last_user_msg.content,
+            domain_classified=routed["domain"],
+            chunks_retrieved=0,
+            response_tokens=len(full_response.split()),
+            input_tokens=in_tokens,
+            output_tokens=out_tokens,
+            cached_tokens=cached_tokens,
+            model=model,
+            cost=cost,
+        )
+        if response_id:
+            # Next turn can chain onto this response; a full rebuild restarts the chain
+            # under the current summary
+            Conversation.objects.filter(pk=conv.pk).update(
+                last_response_id=response_id,
+                response_chain_summary_id=summary_id,
+            )
+    yield {"message_html": assistant_msg.content_html}
+
+    # Step 6: Send citations to frontend
+    if citations:
+        yield {"citations": citations}
+
+    # Step 7: Background tasks
+    msg_count = conv.messages.count()
+    if msg_count == 2:
+        generate_conversation_title.delay(str(conv.id))
+    # Summarize when history was trimmed by token limit or after 10+ messages
+    if msg_count >= 10 or (msg_count >= 6 and total_chars >= MAX_HISTORY_CHARS):
+        summarize_conversation.delay(str(conv.id))
+
+
+class GenerationBuffer:
+    """Redis stream holding the SSE events produced for one user message."""
+
+    def __init__(self, user_message_id):
+        self.key = f"chat:gen:{user_message_id}"
+        self.started_key = f"{self.key}:started"
+        self.attached_key = f"{self.key}:attached"
+        self.cancelled_key = f"{self.key}:cancelled"
+        self.redis = get_redis_client()
+
+    def claim(self) -> bool:
+        """Atomically mark generation as started. Only the first caller gets True."""
+        return bool(self.redis.set(self.started_key, 1, nx=True, ex=BUFFER_TTL))
+
+    def release(self) -> None:
+        self.redis.delete(self.started_key)
+
+    def exists(self) -> bool:
+        return bool(self.redis.exists(self.started_key))
+
+    def append(self, data: str) -> None:
+        """Append one SSE data payload (JSON string or [DONE])."""
+        pipe = self.redis.pipeline()
+        pipe.xadd(self.key, {"data": data})
+        pipe.expire(self.key, BUFFER_TTL)
+        pipe.execute()
+
+    def mark_attached(self) -> None:
+        self.redis.set(self.attached_key, 1, ex=BUFFER_TTL)
+
+    def is_attached(self) -> bool:
+        return bool(self.redis.exists(self.attached_key))
+
+    def cancel(self) -> None:
+        """Ask the producer to stop; it appends {"cancelled": true} and [DONE]."""
+        self.redis.set(self.cancelled_key, 1, ex=BUFFER_TTL)
+
+    def is_cancelled(self) -> bool:
+        return bool(self.redis.exists(self.cancelled_key))
+
+
+def run_generation(
+    conversation_id, user_message_id, speculative: bool = False, enqueued_at: float | None = None, position: int = 0,
+) -> None:
+    """Producer body (runs in the generate_response Celery task).
+
+    Writes every event of generate_events() to the message's buffer. When the
+    generation was started speculatively and no reader attaches within
+    CHAT_SPECULATIVE_ATTACH_TIMEOUT seconds, the upstream call is cancelled.
+    Once a reader has attached, generation runs to completion even if that
+    reader disconnects, so a reconnect can resume from the buffer — unless a
+    reader explicitly cancels it.
+
+    The upstream stream is only opened once admission control grants a slot;
+    until then the buffer carries the queue position and AdmissionQueued is
+    raised, for the task to retry with the returned enqueued_at and position.
+    """
+    buffer = GenerationBuffer(user_message_id)
+    timeout = settings.CHAT_SPECULATIVE_ATTACH_TIMEOUT
+    started = time.monotonic()
+    next_cancel_check = started
+    events = None
+    admission = None
+    try:
+        if buffer.is_cancelled():
+            buffer.append(encode_event({"cancelled": True}))
+            buffer.append(DONE)
+            return
+        conv = Conversation.objects.select_related("user").get(pk=conversation_id)
+        if admission_enabled():
+            admission = Admission(user_message_id, conv.user_id, priority=conv.user.is_staff, enqueued_at=enqueued_at)
+            with tracing.span("admission") as attrs:
+                admitted = admission.try_admit(
+                    lambda new_position: buffer.append(encode_event({"queued": {"position": new_position}})),
+                    buffer.is_cancelled,
+                    last_position=position,
+                )
+                attrs["admitted"] = admitted
+            if not admitted:
+                buffer.append(encode_event({"cancelled": True}))
+                buffer.append(DONE)
+                return
+        last_user_msg = Message.objects.get(pk=user_message_id)
+        events = generate_events(conv, last_user_msg)
+        attached = not speculative
+        for event in events:
+            if time.monotonic() >= next_cancel_check:
+                next_cancel_check = time.monotonic() + CANCEL_CHECK_INTERVAL
+                if buffer.is_cancelled():
+                    logger.info(f"Generation for {buffer.key} cancelled by reader")
+                    events.close()
+                    buffer.append(encode_event({"cancelled": True}))
+                    buffer.append(DONE)
+                    return
+            attached = attached or buffer.is_attached()
+            if not attached and time.monotonic() - started > timeout:
+                logger.info(f"No consumer attached to {buffer.key} after {timeout}s, cancelling upstream")
+                events.close()
+                buffer.append(encode_event({"error": "Response was not collected in time."}))
+                buffer.append(DONE)
+                return
+            buffer.append(encode_event(event))
+        buffer.append(DONE)
+    except AdmissionQueued:
+        admission = None  # keep the place in the queue for the retry
+        raise
+    except AdmissionTimeout as e:
+        logger.warning(f"Generation for {buffer.key} not admitted: {e}")
+        buffer.append(encode_event({"error": "The assistant is busy right now. Please try again in a minute."}))
+        buffer.append(DONE)
+    except Exception as e:
+        logger.exception("Error in run_generation")
+        buffer.append(encode_event({"error": str(e)}))
+        buffer.append(DONE)
+    finally:
+        if events is not None:
+            events.close()
+        if admission is not None:
+            admission.release()
+
+
+def ensure_generation(conv, user_msg, speculative: bool = False) -> bool:
+    """Start generation for a user message unless it is already running (singleflight).
+
+    Returns True if this call started it. Duplicate SSE connections, tab
+    reloads and retries all land here and simply read the existing buffer.
+    """
+    from chat.tasks import generate_response
+
+    buffer = GenerationBuffer(user_msg.pk)
+    if not buffer.claim():
+        return False
+    try:
+        generate_response.delay(str(conv.pk), str(user_msg.pk), speculative)
+    except Exception:
+        buffer.release()
+        raise
+    return True
+
+
+def submit_user_message(user, conv, content: str, start: bool, speculative: bool = False):
+    """Save a user message; shared by send_message and the WebSocket transport.
+
+    Starts the trace that follows the message through the SSE request, Celery
+    and OpenAI, and starts generation when `start` is set. Returns
+    (user_msg, trace).
+    """
+    trace = tracing.start_trace()
+    with tracing.activated(trace), tracing.span("send_message", conversation=str(conv.pk), user_id=str(user.pk)):
+        with tracing.span("db.save_user_message"):
+            user_msg = Message.objects.create(conversation=conv, role="user", content=content)
+        tracing.remember_for_message(user_msg.pk, trace)
+        invalidate_sidebar(conv.user_id)
+        if start:
+            ensure_generation(conv, user_msg, speculative=speculative)
+    return user_msg, trace
+
+
+def attach_generation(conv):
+    """Return the user message whose reply a new reader should relay, or None.
+
+    Starts generation for the latest user message unless it is already
+    buffered or was answered before the buffer expired.
+    """
+    last_user_msg = conv.messages.filter(role="user").order_by("-created_at").first()
+    if not last_user_msg:
+        return None
+    if not GenerationBuffer(last_user_msg.pk).exists():
+        # Nothing buffered: skip if it was already answered, otherwise start generation
+        answered = conv.messages.filter(role="assistant", created_at__gt=last_user_msg.created_at).exists()
+        if answered:
+            return None
+        # Join send_message's trace so the task it publishes carries the same request id
+        trace = tracing.trace_for_message(last_user_msg.pk)
+        with tracing.activated(trace), tracing.span("sse.start_generation") as attrs:
+            attrs["started"] = ensure_generation(conv, last_user_msg)
+    return last_user_msg
+
+
+async def read_buffer(user_message_id, last_event_id: str = "0"):
+    """Async generator of [(entry_id, data), ...] batches from a GenerationBuffer.
+
+    Both values are bytes. Starts after `last_event_id` (the browser's
+    Last-Event-ID on reconnect), or from the beginning. An empty batch means
+    nothing arrived within the block timeout — a chance to send a keepalive.
+    Ends after [DONE]; if the producer stalls, a final batch carries an error
+    and [DONE] with entry_id None. Holds no DB connection.
+    """
+    import redis.asyncio as aioredis
+
+    buffer = GenerationBuffer(user_message_id)
+    buffer.mark_attached()
+    client = aioredis.Redis.from_url(settings.REDIS_URL)
+    last_id = last_event_id if _EVENT_ID_RE.fullmatch(last_event_id or "") else "0"
+    idle_since = time.monotonic()
+    try:
+        while True:
+            result = await client.xread({buffer.key: last_id}, block=15000, count=100)
+            if not result:
+                if time.monotonic() - idle_since > STALL_TIMEOUT:
+                    yield [(None, encode_event({"error": "Response stream stalled."}).encode()), (None, DONE_BYTES)]
+                    return
+                yield []
+                continue
+            idle_since = time.monotonic()
+            batch = []
+            for entry_id, fields in result[0][1]:
+                last_id = entry_id
+                batch.append((entry_id, fields[b"data"]))
+                if fields[b"data"] == DONE_BYTES:
+                    break
+            yield batch
+            if batch[-1][1] == DONE_BYTES:
+                return
+    finally:
+        await client.aclose()
+
+
+async def relay_buffer(user_message_id, last_event_id: str = "0"):
+    """Async generator of SSE frames (bytes) for a GenerationBuffer.
+
+    Every batch returned by one XREAD is written as a single chunk.
+    """
+    yield retry_frame(RECONNECT_MS)
+    async for batch in read_buffer(user_message_id, last_event_id):
+        if not batch:
+            yield KEEPALIVE_FRAME
+            continue
+        frames = []
+        for entry_id, data in batch:
+            if entry_id is not None:
+                frames += (FRAME_ID, entry_id, b"\n")
+            frames += (FRAME_DATA, data, FRAME_END)
+        yield b"".join(frames)
@@ -0,0 +1,220 @@
+"""Hedged Responses API streams — cut tail time-to-first-token.
+
+Optional (CHAT_HEDGE_ENABLED). Most answers start within a second or two,
+but an occasional request (usually one running file_search) takes much
+longer before its first delta. HedgedStream reads the primary stream; if no
+first text delta arrives within CHAT_HEDGE_AFTER_MS it opens a second,
+identical request and yields whichever produces text first. The other one
+is closed, which cancels it upstream.
+
+Hedges cost money (the loser's input tokens are billed), so they are capped
+at CHAT_HEDGE_MAX_PERCENT of answer requests over the last two minutes,
+counted in Redis across all workers. Outcomes are logged and summed per day
+(hedge_stats()) to weigh the latency win against the extra cost.
+"""
+import contextvars
+import logging
+import queue
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+# Events that settle the race: the first text, or a response with no text at all
+_DECIDING_EVENTS = ("response.output_text.delta", "response.completed")
+
+
+def _budget_keys(minutes_ago: int = 0) -> tuple[str, str]:
+    minute = int(time.time() // 60) - minutes_ago
+    return f"llm:hedge:requests:{minute}", f"llm:hedge:hedged:{minute}"
+
+
+def _stats_key(day: date | None = None) -> str:
+    return f"llm:hedge:stats:{(day or date.today()).isoformat()}"
+
+
+def count_request() -> None:
+    """Count one answer request towards this minute's hedge budget."""
+    requests_key, _ = _budget_keys()
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.incr(requests_key)
+        pipe.expire(requests_key, 180)
+        pipe.execute()
+    except Exception:
+        logger.warning("Could not count request for hedge budget", exc_info=True)
+
+
+def _take_hedge_budget() -> bool:
+    """Claim one hedge if the hedged share of recent requests stays within CHAT_HEDGE_MAX_PERCENT."""
+    requests_key, hedged_key = _budget_keys()
+    previous_requests_key, previous_hedged_key = _budget_keys(minutes_ago=1)
+    try:
+        client = get_redis_client()
+        hedged = client.incr(hedged_key)
+        client.expire(hedged_key, 180)
+        requests, previous_requests, previous_hedged = client.mget(
+            requests_key, previous_requests_key, previous_hedged_key,
+        )
+        requests = int(requests or 0) + int(previous_requests or 0)
+        hedged += int(previous_hedged or 0)
+        if hedged * 100 > requests * settings.CHAT_HEDGE_MAX_PERCENT:
+            client.decr(hedged_key)
+            return False
+        return True
+    except Exception:
+        logger.warning("Could not check hedge budget, not hedging", exc_info=True)
+        return False
+
+
+def record_outcome(outcome: str, ttft: float, extra_cost: Decimal) -> None:
+    """Add one hedge outcome ("primary" or "hedge" won, or "skipped") to today's totals."""
+    key = _stats_key()
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hincrby(key, outcome, 1)
+        if outcome != "skipped":
+            pipe.hincrby(key, "ttft_ms", round(ttft * 1000))
+            pipe.hincrbyfloat(key, "extra_cost", float(extra_cost))
+        pipe.expire(key, 60 * 60 * 24 * 30)
+        pipe.execute()
+    except Exception:
+        logger.warning("Could not record hedge outcome", exc_info=True)
+
+
+def hedge_stats(day: date | None = None) -> dict:
+    """Today's hedge totals: hedges won by each side, skipped for budget, mean hedged TTFT, extra cost."""
+    try:
+        raw = get_redis_client().hgetall(_stats_key(day))
+    except Exception:
+        logger.warning("Could not read hedge stats", exc_info=True)
+        raw = {}
+    values = {key.decode(): float(value) for key, value in raw.items()}
+    hedged = int(values.get("primary", 0) + values.get("hedge", 0))
+    return {
+        "hedged": hedged,
+        "hedge_won": int(values.get("hedge", 0)),
+        "primary_won": int(values.get("primary", 0)),
+        "skipped": int(values.get("skipped", 0)),
+        "mean_ttft_ms": values.get("ttft_ms", 0) / hedged if hedged else 0,
+        "extra_cost": Decimal(str(values.get("extra_cost", 0))),
+    }
+
+
+class HedgedStream:
+    """Iterate the events of a Responses stream, hedged by a duplicate request when slow to start.
+
+    primary is an open stream; open_hedge() opens an identical one. Each
+    stream is read on its own thread into a shared queue; events are held
+    back until one stream produces its first text delta, then that stream's
+    events are yielded and the other is closed.
+    """
+
+    def __init__(self, primary, open_hedge, after_seconds: float):
+        self.open_hedge = open_hedge
+        self.after_seconds = after_seconds
+        self.started = time.monotonic()
+        self.events = queue.Queue()
+        self.streams = {}
+        self.finished = set()
+        self.hedged = False
+        self.skipped = False
+        self.winner = None
+        self.first_text_at = {}  # stream index -> monotonic time of its first text delta
+        self.closed_at = {}
+        self._start(0, lambda: primary)
+
+    def _start(self, index: int, open_stream):
+        def pump():
+            try:
+                stream = open_stream()
+                self.streams[index] = stream
+                if self.winner not in (None, index):
+                    stream.close()
+                    return
+                for event in stream:
+                    self.events.put((index, event))
+            except Exception as e:
+                self.events.put((index, e))
+                return
+            self.events.put((index, _END))
+
+        # Copy the context so the hedge request keeps the caller's request id
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(pump,), daemon=True, name=f"hedged-stream-{index}").start()
+
+    def _race(self):
+        """Wait for a winner; return its held-back events."""
+        held = {0: [], 1: []}
+        while True:
+            timeout = None
+            if not self.hedged and not self.skipped:
+                timeout = max(0.0, self.started + self.after_seconds - time.monotonic())
+            try:
+                index, item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                if _take_hedge_budget():
+                    self.hedged = True
+                    logger.info(f"No first token after {self.after_seconds:.1f}s, hedging the answer request")
+                    self._start(1, self.open_hedge)
+                else:
+                    self.skipped = True
+                    record_outcome("skipped", 0, Decimal(0))
+                continue
+            held[index].append(item)
+            if item is _END or isinstance(item, Exception):
+                self.finished.add(index)
+                if self.hedged and len(self.finished) < 2:
+                    continue  # the other stream may still answer
+                self.winner = index
+                return held[index]
+            if getattr(item, "type", None) == "response.output_text.delta":
+                self.first_text_at.setdefault(index, time.monotonic())
+            if getattr(item, "type", None) in _DECIDING_EVENTS:
+                self.winner = index
+                return held[index]
+
+    def __iter__(self):
+        held = self._race()
+        self._close_losers()
+        for item in held:
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        while True:
+            index, item = self.events.get()
+            if index != self.winner:
+                continue
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _close_losers(self):
+        for index, stream in list(self.streams.items()):
+            if index != self.winner:
+                self.closed_at.setdefault(index, time.monotonic())
+                stream.close()
+
+    def primary_first_text_at(self) -> float | None:
+        """When the primary produced its first text — or, if it lost, when it was cancelled without any.
+
+        The latter is a lower bound on the primary's time to first token; the
+        model router is fed that rather than the hedge's time, so a model that
+        keeps needing rescue still looks slow.
+        """
+        return self.first_text_at.get(0, self.closed_at.get(0))
+
+    def close(self):
+        for stream in list(self.streams.values()):
+            stream.close()
@@ -1,7 +1,8 @@
-"""LLM utilities — system prompt and title generation."""
+"""LLM utilities — system prompt and (batched) title generation."""
+import json
 import logging
-from django.conf import settings
 from core.openai_client import get_openai_client
+from chat.services.model_router import TASK_TITLE, call_with_failover
 
 logger = logging.getLogger(__name__)
 
@@ -90,25 +91,70 @@ If the user challenges your answer, alleges a wrong citation/deadline, or you de
 - Stop and run a correction cycle: re-check citations, re-check deadlines if implicated, re-run IRAC, then issue a clear Correction Notice that supersedes the earlier text."""
 
 
-def generate_title(first_user_message: str, first_assistant_message: str) -> dict:
-    """Generate a short conversation title from the first exchange.
-    Returns dict with 'title', 'input_tokens', 'output_tokens'."""
-    client = get_openai_client()
-    response = client.chat.completions.create(
-        model=settings.OPENAI_CHAT_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": "Generate a short title (5-8 words max) for this legal conversation. Return only the title.",
+TITLES_SCHEMA = {
+    "name": "conversation_titles",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "titles": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"id": {"type": "string"}, "title": {"type": "string"}},
+                    "required": ["id", "title"],
+                    "additionalProperties": False,
+                },
             },
-            {"role": "user", "content": f"User asked: {first_user_message[:200]}\nAssistant replied about: {first_assistant_message[:200]}"},
-        ],
-        max_tokens=20,
-        temperature=0.3,
+        },
+        "required": ["titles"],
+        "additionalProperties": False,
+    },
+}
+
+
+def title_prompt_line(key: str, first_user_message: str, first_assistant_message: str) -> str:
+    return f"[{key}] User asked: {first_user_message[:200]}\nAssistant replied about: {first_assistant_message[:200]}"
+
+
+def generate_titles(exchanges: dict[str, tuple[str, str]]) -> dict:
+    """Generate short titles for several conversations in one structured-output call.
+
+    exchanges maps a key to (first user message, first assistant message).
+    Returns dict with 'titles' ({key: title}, possibly missing keys), 'input_tokens',
+    'output_tokens', 'model'.
+    """
+    client = get_openai_client()
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Generate a short title (5-8 words max) for each legal conversation below. "
+                "Return one entry per conversation, using the id shown in brackets."
+            ),
+        },
+        {"role": "user", "content": "\n\n".join(title_prompt_line(key, *pair) for key, pair in exchanges.items())},
+    ]
+    model, response = call_with_failover(
+        TASK_TITLE,
+        sum(len(m["content"]) for m in messages),
+        lambda model: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=30 * len(exchanges) + 20,
+            temperature=0.3,
+            response_format={"type": "json_schema", "json_schema": TITLES_SCHEMA},
+        ),
     )
     usage = response.usage
+    entries = json.loads(response.choices[0].message.content)["titles"]
     return {
-        "title": response.choices[0].message.content.strip().strip('"'),
+        "titles": {
+            entry["id"]: entry["title"].strip().strip('"')
+            for entry in entries
+            if entry["id"] in exchanges and entry["title"].strip()
+        },
         "input_tokens": usage.prompt_tokens if usage else 0,
         "output_tokens": usage.completion_tokens if usage else 0,
+        "model": model,
     }
@@ -0,0 +1,78 @@
+"""Server-side markdown rendering for assistant messages.
+
+Saved assistant messages are rendered once, when the Message is saved, and
+served as stored HTML. While a response is streaming, MarkdownBlockStream
+splits the text into finished top-level blocks so the client only has to
+re-render the block that is still being written.
+
+Options mirror the client's marked.js setup (GFM tables/strikethrough,
+single newlines become <br>). Raw HTML in the model output is escaped and
+the result is additionally cleaned with nh3 before it is marked safe.
+"""
+import nh3
+from markdown_it import MarkdownIt
+
+_md = (
+    MarkdownIt("commonmark", {"breaks": True, "html": False, "linkify": False})
+    .enable("table")
+    .enable("strikethrough")
+)
+
+_FENCES = ("```", "~~~")
+
+
+def render_markdown(text: str) -> str:
+    """Render markdown to sanitized HTML."""
+    if not text:
+        return ""
+    return nh3.clean(_md.render(text))
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class MarkdownBlockStream:
+    """Incrementally split streamed markdown into finished top-level blocks.
+
+    A block is considered finished once a blank line is followed by a new
+    unindented line outside a code fence. feed() returns one dict per block
+    finished by the new text:
+        {"html": "<p>...</p>", "chars": <raw text consumed, in UTF-16 code units>}
+    "chars" is what the browser slices off its raw tail, and JavaScript
+    string offsets count UTF-16 code units (an emoji counts as 2).
+    Text after the last finished block stays buffered until more arrives.
+    """
+
+    def __init__(self):
+        self._open_lines = []    # complete lines of the unfinished block(s)
+        self._partial = []       # pieces of the current, incomplete line
+        self._in_fence = False
+        self._after_blank = False
+
+    def feed(self, text: str) -> list[dict]:
+        blocks = []
+        pieces = text.split("\n")
+        for piece in pieces[:-1]:
+            self._partial.append(piece)
+            line = "".join(self._partial) + "\n"
+            self._partial = []
+            block = self._push_line(line)
+            if block:
+                blocks.append(block)
+        self._partial.append(pieces[-1])
+        return blocks
+
+    def _push_line(self, line: str) -> dict | None:
+        block = None
+        stripped = line.strip()
+        starts_block = stripped and not line[0].isspace()
+        if starts_block and self._after_blank and not self._in_fence and self._open_lines:
+            raw = "".join(self._open_lines)
+            self._open_lines = []
+            block = {"html": render_markdown(raw), "chars": _utf16_len(raw)}
+        if stripped.startswith(_FENCES):
+            self._in_fence = not self._in_fence
+        self._after_blank = not stripped and not self._in_fence
+        self._open_lines.append(line)
+        return block
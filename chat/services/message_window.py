@@ -0,0 +1,34 @@
+"""Windowed message loading for long conversations.
+
+conversation_detail renders only the newest MESSAGE_WINDOW_SIZE messages;
+older ones are fetched a window at a time through chat:messages as the user
+scrolls up. Paging is keyset-based on (created_at, id), so each window costs
+one index range scan regardless of conversation length.
+"""
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from chat.services.cursors import decode_cursor, encode_cursor
+
+MESSAGE_WINDOW_SIZE = 30
+
+
+def get_message_window(conversation, cursor: str = "") -> tuple[list, str]:
+    """Return (messages, prev_cursor) for the window ending just before `cursor`.
+
+    Messages are returned oldest first, ready to render. prev_cursor is empty
+    when there is nothing older to load.
+    """
+    qs = conversation.messages.order_by("-created_at", "-id")
+    before = decode_cursor(cursor)
+    if before and len(before) == 2:
+        created_at, pk = parse_datetime(before[0]), before[1]
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(qs[:MESSAGE_WINDOW_SIZE + 1])
+    prev_cursor = ""
+    if len(rows) > MESSAGE_WINDOW_SIZE:
+        rows = rows[:MESSAGE_WINDOW_SIZE]
+        oldest = rows[-1]
+        prev_cursor = encode_cursor(oldest.created_at, oldest.pk)
+    rows.reverse()
+    return rows, prev_cursor
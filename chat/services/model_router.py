@@ -0,0 +1,184 @@
+"""Model routing — picks the OpenAI model for each call.
+
+Every call site names its task ("answer", "title" or "summary"). Each task
+has a list of candidate models in preference order (OPENAI_ANSWER_MODELS,
+OPENAI_BACKGROUND_MODELS). choose_model() takes the first candidate that
+
+1. has a context window large enough for the prompt (MODEL_PRICES), and
+2. is healthy: its rolling error rate is below OPENAI_ROUTER_MAX_ERROR_RATE
+   and, for answers, its rolling p95 time-to-first-token is within
+   OPENAI_ROUTER_TTFT_P95_MS.
+
+If no candidate is healthy, the one with the lowest p95 wins. Samples older
+than STATS_WINDOW_SECONDS are ignored, so a model that was routed around
+gets traffic again once its bad samples age out.
+
+Latency and outcome samples are kept in Redis (one capped list per model)
+so web and worker processes share them. Each process reads them at most
+every STATS_REFRESH_SECONDS; a routing decision itself makes no Redis call.
+"""
+import logging
+import time
+
+import openai
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from chat.services.pricing import model_prices
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Worth retrying on the next model; anything else (bad request, auth) would fail there too
+FAILOVER_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+TASK_ANSWER = "answer"
+TASK_TITLE = "title"
+TASK_SUMMARY = "summary"
+
+LATENCY_SAMPLES = 200
+OUTCOME_SAMPLES = 100
+MIN_SAMPLES = 10  # below this a model counts as healthy
+STATS_REFRESH_SECONDS = 10
+STATS_WINDOW_SECONDS = 5 * 60
+CHARS_PER_TOKEN = 4
+OUTPUT_RESERVE_TOKENS = 4000
+
+_stats = {}
+_stats_read_at = 0.0
+
+
+def _ttft_key(model: str) -> str:
+    return f"llm:ttft:{model}"
+
+
+def _outcome_key(model: str) -> str:
+    return f"llm:outcome:{model}"
+
+
+def candidates(task: str) -> list[str]:
+    if task == TASK_ANSWER:
+        return settings.OPENAI_ANSWER_MODELS
+    return settings.OPENAI_BACKGROUND_MODELS
+
+
+def _p95(samples: list[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def _load_stats() -> dict:
+    """Return {model: {"p95_ms", "error_rate", "samples"}} for every configured model, refreshed every few seconds."""
+    global _stats, _stats_read_at
+    now = time.monotonic()
+    if now - _stats_read_at < STATS_REFRESH_SECONDS:
+        return _stats
+    _stats_read_at = now
+    models = list(dict.fromkeys(settings.OPENAI_ANSWER_MODELS + settings.OPENAI_BACKGROUND_MODELS))
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for model in models:
+            pipe.lrange(_ttft_key(model), 0, -1)
+            pipe.lrange(_outcome_key(model), 0, -1)
+        results = pipe.execute()
+    except Exception:
+        logger.warning("Could not read model latency stats, routing by preference order", exc_info=True)
+        return _stats
+    cutoff = time.time() - STATS_WINDOW_SECONDS
+    stats = {}
+    for i, model in enumerate(models):
+        latencies = _recent(results[2 * i], cutoff)
+        outcomes = _recent(results[2 * i + 1], cutoff)
+        stats[model] = {
+            "p95_ms": _p95(latencies) if latencies else 0.0,
+            "error_rate": outcomes.count(0) / len(outcomes) if outcomes else 0.0,
+            "samples": len(outcomes),
+        }
+    _stats = stats
+    return stats
+
+
+def _recent(entries, cutoff: float) -> list[float]:
+    """Values of "<timestamp>:<value>" entries newer than cutoff."""
+    values = []
+    for entry in entries:
+        timestamp, _, value = entry.decode().partition(":")
+        if float(timestamp) >= cutoff:
+            values.append(float(value))
+    return values
+
+
+def model_stats(task: str = TASK_ANSWER) -> dict:
+    """Current stats for a task's candidate models."""
+    stats = _load_stats()
+    return {model: stats.get(model) for model in candidates(task)}
+
+
+def _healthy(task: str, stats: dict) -> bool:
+    if not stats or stats["samples"] < MIN_SAMPLES:
+        return True
+    if stats["error_rate"] >= settings.OPENAI_ROUTER_MAX_ERROR_RATE:
+        return False
+    return task != TASK_ANSWER or stats["p95_ms"] <= settings.OPENAI_ROUTER_TTFT_P95_MS
+
+
+def rank_models(task: str, prompt_chars: int = 0) -> list[str]:
+    """Candidate models for a call, best first: healthy ones in preference order, then the rest by p95."""
+    models = candidates(task)
+    if not models:
+        raise ImproperlyConfigured(f"No candidate models configured for the {task!r} task.")
+    needed = prompt_chars // CHARS_PER_TOKEN + OUTPUT_RESERVE_TOKENS
+    fitting = [model for model in models if model_prices(model)["context"] >= needed] or models
+    stats = _load_stats()
+    healthy = [model for model in fitting if _healthy(task, stats.get(model))]
+    degraded = sorted(
+        (model for model in fitting if model not in healthy),
+        key=lambda model: stats[model]["p95_ms"] if model in stats else 0.0,
+    )
+    return healthy + degraded
+
+
+def choose_model(task: str, prompt_chars: int = 0) -> str:
+    return rank_models(task, prompt_chars)[0]
+
+
+def call_with_failover(task: str, prompt_chars: int, call):
+    """Run call(model) for a non-streaming request, moving down the ranking on transient errors.
+
+    Returns (model, result); the outcome of each attempt is recorded.
+    """
+    models = rank_models(task, prompt_chars)
+    for attempt, model in enumerate(models, start=1):
+        try:
+            result = call(model)
+        except FAILOVER_ERRORS as e:
+            record_error(model)
+            if attempt == len(models):
+                raise
+            logger.warning(f"{task} call to {model} failed ({e.__class__.__name__}), failing over to {models[attempt]}")
+            continue
+        record_success(model)
+        return model, result
+
+
+def record_success(model: str, ttft_seconds: float | None = None) -> None:
+    """Record a successful call; streaming answers also record their time to first token."""
+    _record(model, 1, ttft_seconds)
+
+
+def record_error(model: str) -> None:
+    _record(model, 0)
+
+
+def _record(model: str, outcome: int, ttft_seconds: float | None = None) -> None:
+    now = f"{time.time():.3f}"
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        if ttft_seconds is not None:
+            pipe.lpush(_ttft_key(model), f"{now}:{round(ttft_seconds * 1000)}")
+            pipe.ltrim(_ttft_key(model), 0, LATENCY_SAMPLES - 1)
+        pipe.lpush(_outcome_key(model), f"{now}:{outcome}")
+        pipe.ltrim(_outcome_key(model), 0, OUTCOME_SAMPLES - 1)
+        pipe.execute()
+    except Exception:
+        logger.warning(f"Could not record model stats for {model}", exc_info=True)
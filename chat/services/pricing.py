@@ -0,0 +1,44 @@
+"""Token pricing for OpenAI calls, used to compute UsageLog.cost.
+
+Prices are per model (MODEL_PRICES); the model router may send a request to
+any model listed there. Cached input tokens (prompt-cache hits) are billed at
+a discount; they are a subset of input_tokens, so only the uncached
+remainder is charged at the full input rate.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Per 1M tokens: input, cached input, output. "context" is the context window in tokens.
+MODEL_PRICES = {
+    "gpt-4o-mini": {"input": Decimal("0.15"), "cached_input": Decimal("0.075"), "output": Decimal("0.60"), "context": 128000},
+    "gpt-4o": {"input": Decimal("2.50"), "cached_input": Decimal("1.25"), "output": Decimal("10.00"), "context": 128000},
+    "gpt-4.1": {"input": Decimal("2.00"), "cached_input": Decimal("0.50"), "output": Decimal("8.00"), "context": 1047576},
+    "gpt-4.1-mini": {"input": Decimal("0.40"), "cached_input": Decimal("0.10"), "output": Decimal("1.60"), "context": 1047576},
+    "gpt-4.1-nano": {"input": Decimal("0.10"), "cached_input": Decimal("0.025"), "output": Decimal("0.40"), "context": 1047576},
+}
+_MILLION = Decimal("1000000")
+
+
+def model_prices(model: str = "") -> dict:
+    """Price row for a model; unknown models are billed as OPENAI_CHAT_MODEL."""
+    model = model or settings.OPENAI_CHAT_MODEL
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        logger.warning(f"No pricing for model {model}, using {settings.OPENAI_CHAT_MODEL} prices")
+        prices = MODEL_PRICES.get(settings.OPENAI_CHAT_MODEL, MODEL_PRICES["gpt-4o-mini"])
+    return prices
+
+
+def compute_cost(input_tokens: int, output_tokens: int, cached_tokens: int = 0, model: str = "") -> Decimal:
+    """Return the dollar cost of one call to `model` (default OPENAI_CHAT_MODEL)."""
+    prices = model_prices(model)
+    cached_tokens = min(cached_tokens, input_tokens)
+    return (
+        Decimal(input_tokens - cached_tokens) * prices["input"]
+        + Decimal(cached_tokens) * prices["cached_input"]
+        + Decimal(output_tokens) * prices["output"]
+    ) / _MILLION
@@ -0,0 +1,223 @@
+"""Local query router — decides, before the upstream call, whether a turn needs
+file_search and which legal domain it belongs to.
+
+Two parts, both pure Python dict lookups (a few microseconds per query):
+
+1. Small talk ("hi", "thanks", "who are you?") is recognized from a fixed
+   phrase/word list. Those turns are sent without the file_search tool.
+2. Domains (Document.DOMAIN_CHOICES) are scored with a keyword/TF-IDF model.
+   train_router() builds it from our own data: Document titles, labelled by
+   their domain, plus UsageLog.query_text history, labelled by the seed
+   keywords below where they are unambiguous. The model is stored in the
+   cache; each process keeps a copy and re-reads it every
+   ROUTER_REFRESH_SECONDS. Without a trained model the seed keywords alone
+   are used.
+
+Anything the router is unsure about is sent with retrieval, as before.
+"""
+import logging
+import math
+import re
+import time
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+MODEL_CACHE_KEY = "chat:router:model"
+ROUTER_REFRESH_SECONDS = 5 * 60
+TERMS_PER_DOMAIN = 300
+TRAINING_QUERY_LIMIT = 20000
+SEED_WEIGHT = 1.0
+MIN_DOMAIN_SCORE = 0.15
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Seed keywords per domain; bigrams are written with a space
+SEED_KEYWORDS = {
+    "family": [
+        "divorce", "custody", "child support", "alimony", "spousal maintenance", "visitation", "possession order",
+        "adoption", "paternity", "conservatorship", "protective order", "marriage", "prenup", "family code",
+    ],
+    "criminal": [
+        "arrest", "arrested", "dwi", "dui", "felony", "misdemeanor", "bail", "bond", "probation", "parole",
+        "expunction", "expunge", "nondisclosure", "indictment", "plea", "theft", "assault", "penal code", "warrant",
+    ],
+    "civil": [
+        "lawsuit", "sue", "petition", "negligence", "damages", "small claims", "justice court", "judgment",
+        "discovery", "deposition", "statute of limitations", "personal injury", "breach", "civil procedure",
+    ],
+    "property": [
+        "landlord", "tenant", "lease", "eviction", "deed", "mortgage", "foreclosure", "hoa", "homestead",
+        "easement", "property tax", "security deposit", "rent", "renting",
+    ],
+    "probate": [
+        "last will", "wills", "testament", "probate", "estate", "executor", "heir", "heirship", "inheritance",
+        "trust", "guardianship", "power of attorney", "intestate", "beneficiary", "estates code",
+    ],
+    "business": [
+        "llc", "corporation", "partnership", "contract", "shareholder", "business", "franchise", "invoice",
+        "trademark", "non compete", "bylaws", "sole proprietor", "dba",
+    ],
+    "employment": [
+        "employer", "employee", "fired", "termination", "wrongful termination", "wage", "wages", "overtime",
+        "discrimination", "unemployment", "workers comp", "twc", "eeoc", "paycheck", "severance",
+    ],
+    "immigration": [
+        "immigration", "visa", "green card", "citizenship", "naturalization", "deportation", "asylum", "uscis",
+        "daca", "removal", "work permit", "ice",
+    ],
+}
+
+SMALLTALK_PHRASES = frozenset([
+    "hi", "hello", "hey", "hi there", "hello there", "good morning", "good afternoon", "good evening",
+    "thanks", "thank you", "thanks a lot", "thank you so much", "thx", "ty", "ok", "okay", "ok thanks",
+    "okay thanks", "great", "cool", "got it", "nice", "perfect", "awesome", "bye", "goodbye", "see you",
+    "thanks so much", "thank you very much", "thanks again", "thank you again", "thank you thomas",
+    "much appreciated", "appreciate it", "i appreciate it", "that helps", "that helped", "very helpful",
+    "that was helpful", "really helpful",
+    "who are you", "what are you", "what is your name", "what's your name", "who made you",
+    "what can you do", "how are you", "how can you help", "how can you help me", "help",
+    "are you a lawyer", "are you an attorney", "are you a bot", "are you human",
+])
+# Greetings/thanks only — a turn made entirely of these never needs retrieval.
+# Short follow-ups ("yes", "why?", "really?", "that") are deliberately not here: they may
+# continue a legal question. Longer small talk must match SMALLTALK_PHRASES exactly.
+SMALLTALK_WORDS = frozenset([
+    "hi", "hello", "hey", "thanks", "thank", "thx", "ty", "cheers", "bye", "goodbye", "thomas",
+])
+# Dropped before scoring and before forming bigrams ("power of attorney" -> "power attorney")
+STOPWORDS = frozenset([
+    "a", "an", "the", "of", "to", "in", "on", "at", "for", "and", "or", "is", "are", "was", "were", "be", "been",
+    "i", "i'm", "me", "my", "we", "our", "you", "your", "he", "she", "his", "her", "they", "their", "it", "its",
+    "this", "that", "these", "those", "what", "which", "who", "how", "when", "where", "why", "can", "could",
+    "do", "does", "did", "will", "would", "should", "shall", "may", "might", "have", "has", "had", "get", "got",
+    "if", "with", "about", "from", "by", "as", "not", "no", "yes", "am", "so", "there", "any", "some", "just",
+])
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased content words plus adjacent bigrams ("child support")."""
+    words = [word for word in _TOKEN_RE.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _seed_index() -> dict:
+    index = defaultdict(dict)
+    for domain, keywords in SEED_KEYWORDS.items():
+        for keyword in keywords:
+            # The keyword's own feature: the word itself or its (stopword-free) bigram
+            index[tokenize(keyword)[-1]][domain] = SEED_WEIGHT
+    return dict(index)
+
+
+_SEED_INDEX = _seed_index()
+_model = {"version": 0, "index": _SEED_INDEX}
+_model_checked_at = 0.0
+
+
+def _get_index() -> dict:
+    """Return the term -> {domain: weight} index, refreshing from the cache at most every few minutes."""
+    global _model, _model_checked_at
+    now = time.monotonic()
+    if now - _model_checked_at >= ROUTER_REFRESH_SECONDS:
+        _model_checked_at = now
+        try:
+            stored = cache.get(MODEL_CACHE_KEY)
+        except Exception:
+            logger.warning("Could not load query router model, keeping the current one", exc_info=True)
+            stored = None
+        if stored and stored["version"] != _model["version"]:
+            _model = stored
+    return _model["index"]
+
+
+def _score(tokens, index) -> dict:
+    scores = defaultdict(float)
+    for token in set(tokens):
+        for domain, weight in index.get(token, {}).items():
+            scores[domain] += weight
+    return scores
+
+
+def _seed_label(text: str) -> str:
+    """Unambiguous seed-keyword domain for a training query, or ""."""
+    scores = _score(tokenize(text), _SEED_INDEX)
+    if not scores:
+        return ""
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        return ""
+    return ranked[0][0]
+
+
+def route(text: str) -> dict:
+    """Route one user turn.
+
+    Returns {"retrieval": bool, "domain": str}. domain is one of
+    Document.DOMAIN_CHOICES ("other" when no domain scores high enough), or
+    "" for small talk that does not need retrieval.
+    """
+    words = _TOKEN_RE.findall(text.lower())
+    if words and (" ".join(words) in SMALLTALK_PHRASES or all(word in SMALLTALK_WORDS for word in words)):
+        return {"retrieval": False, "domain": ""}
+    scores = _score(tokenize(text), _get_index())
+    if not scores:
+        return {"retrieval": True, "domain": "other"}
+    domain, best = max(scores.items(), key=lambda item: item[1])
+    return {"retrieval": True, "domain": domain if best >= MIN_DOMAIN_SCORE else "other"}
+
+
+def train_router() -> dict:
+    """Build the TF-IDF domain model from Documents and UsageLog history and store it.
+
+    Returns counts describing the training set.
+    """
+    from adminpanel.models import UsageLog
+    from documents.models import Document
+
+    samples = [
+        (title, domain)
+        for title, domain in Document.objects.exclude(domain="other").values_list("title", "domain").iterator()
+    ]
+    document_count = len(samples)
+    queries = (
+        UsageLog.objects.exclude(query_text__startswith="[")  # background tasks log "[generate_title]" etc.
+        .order_by("-created_at")
+        .values_list("query_text", flat=True)[:TRAINING_QUERY_LIMIT]
+    )
+    for query in queries:
+        label = _seed_label(query)
+        if label:
+            samples.append((query, label))
+
+    # Document frequencies over the whole training set
+    tokenized = [(Counter(tokenize(text)), domain) for text, domain in samples]
+    df = Counter()
+    for counts, _ in tokenized:
+        df.update(counts.keys())
+    total = len(tokenized) or 1
+    idf = {term: math.log((total + 1) / (freq + 1)) + 1 for term, freq in df.items()}
+
+    # Per-domain centroid of L2-normalized TF-IDF vectors
+    centroids = defaultdict(Counter)
+    per_domain = Counter()
+    for counts, domain in tokenized:
+        vector = {term: (1 + math.log(tf)) * idf[term] for term, tf in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        for term, value in vector.items():
+            centroids[domain][term] += value / norm
+        per_domain[domain] += 1
+
+    index = defaultdict(dict)
+    for domain, centroid in centroids.items():
+        for term, value in centroid.most_common(TERMS_PER_DOMAIN):
+            index[term][domain] = value / per_domain[domain]
+    for term, domains in _SEED_INDEX.items():
+        for domain, weight in domains.items():
+            index[term][domain] = max(index[term].get(domain, 0.0), weight)
+
+    model = {"version": time.time_ns(), "index": dict(index)}
+    cache.set(MODEL_CACHE_KEY, model, None)
+    return {"documents": document_count, "queries": len(samples) - document_count, "terms": len(index)}
@@ -0,0 +1,78 @@
+"""Conversation sidebar — per-user versioned fragment cache and cursor paging.
+
+The first page of a user's sidebar is rendered once and cached under a key
+that includes a per-user version. Any change that affects the sidebar
+(create, rename, pin, archive, auto-title) calls invalidate_sidebar(), which
+bumps the version so the next request re-renders. Older entries are
+lazy-loaded page by page through chat:sidebar_more.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+from django.utils.safestring import mark_safe
+
+from chat.models import Conversation
+from chat.services.cursors import decode_cursor, encode_cursor
+
+SIDEBAR_PAGE_SIZE = 30
+SIDEBAR_CACHE_TTL = 60 * 60  # 1 hour
+
+
+def _version_key(user_id) -> str:
+    return f"sidebar:version:{user_id}"
+
+
+def get_sidebar_version(user_id) -> int:
+    """Return the current sidebar cache version for a user, creating one if missing."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        cache.set(_version_key(user_id), version, None)
+    return version
+
+
+def invalidate_sidebar(user_id) -> None:
+    """Drop the cached sidebar for a user by moving them to a fresh version."""
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def get_sidebar_page(user, cursor: str = "") -> tuple[list, str]:
+    """Return (conversations, next_cursor) for one page of the sidebar.
+
+    Ordered by pinned first, then most recently updated — matches the
+    chat_conv_sidebar_idx index on Conversation.
+    """
+    qs = Conversation.objects.filter(user=user, is_archived=False).order_by("-is_pinned", "-updated_at", "-id")
+    after = decode_cursor(cursor)
+    if after and len(after) == 3:
+        pinned, updated_at, pk = after[0], parse_datetime(after[1]), after[2]
+        qs = qs.filter(
+            Q(is_pinned__lt=pinned)
+            | Q(is_pinned=pinned, updated_at__lt=updated_at)
+            | Q(is_pinned=pinned, updated_at=updated_at, pk__lt=pk)
+        )
+    rows = list(qs[:SIDEBAR_PAGE_SIZE + 1])
+    next_cursor = ""
+    if len(rows) > SIDEBAR_PAGE_SIZE:
+        rows = rows[:SIDEBAR_PAGE_SIZE]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.is_pinned, last.updated_at, last.pk)
+    return rows, next_cursor
+
+
+def render_sidebar_items(user) -> str:
+    """Return the HTML for the first sidebar page, served from cache when possible."""
+    key = f"sidebar:html:{user.pk}:{get_sidebar_version(user.pk)}"
+    html = cache.get(key)
+    if html is None:
+        conversations, next_cursor = get_sidebar_page(user)
+        html = render_to_string("chat/partials/sidebar_items.html", {
+            "conversations": conversations,
+            "next_cursor": next_cursor,
+            "first_page": True,
+        })
+        cache.set(key, html, SIDEBAR_CACHE_TTL)
+    return mark_safe(html)
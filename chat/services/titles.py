@@ -0,0 +1,155 @@
+"""Batched conversation titles.
+
+A title is a ~10-token answer, so one request per new conversation is mostly
+request overhead. New conversations are queued in Redis instead; a flush
+task runs TITLE_BATCH_WINDOW seconds after the first one is queued (or at
+once when TITLE_BATCH_SIZE are waiting) and asks for all titles in a single
+structured-output call (chat.services.llm.generate_titles).
+
+The call's tokens are split across the conversations in proportion to their
+share of the prompt and of the output, so every UsageLog carries its own
+part of the cost. When the API is unavailable each conversation gets a local
+extractive title from its first question instead. If the flush itself fails
+before saving, its conversations are put back at the head of the queue
+(at most MAX_ATTEMPTS times each).
+"""
+import logging
+import re
+
+import openai
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+TITLE_BATCH_WINDOW = 2  # seconds
+TITLE_BATCH_SIZE = 20
+PENDING_KEY = "chat:titles:pending"
+FLUSH_KEY = "chat:titles:flush_scheduled"
+ATTEMPTS_KEY = "chat:titles:attempts"
+MAX_ATTEMPTS = 3
+DEFAULT_TITLE = "New Conversation"
+MAX_TITLE_WORDS = 8
+
+_LEADING_FILLER = re.compile(
+    r"^(hi|hello|hey|thomas|please|quick question|i have a question|question|can you|could you|"
+    r"tell me|explain|i need to know|i want to know|i'd like to know|help me understand|whether)\b[\s,:;.!-]*",
+    re.IGNORECASE,
+)
+
+
+def queue_title(conversation_id) -> None:
+    """Queue a conversation for the next title batch, scheduling a flush if none is pending."""
+    from chat.tasks import flush_title_batch
+
+    redis = get_redis_client()
+    pending = redis.rpush(PENDING_KEY, str(conversation_id))
+    if pending >= TITLE_BATCH_SIZE:
+        flush_title_batch.delay()
+    elif redis.set(FLUSH_KEY, 1, nx=True, ex=TITLE_BATCH_WINDOW * 5):
+        flush_title_batch.apply_async(countdown=TITLE_BATCH_WINDOW)
+
+
+def take_batch() -> list[str]:
+    """Pop up to TITLE_BATCH_SIZE queued conversation ids (deduplicated, in queue order)."""
+    redis = get_redis_client()
+    # Clear the flag first: anything queued from now on schedules its own flush
+    redis.delete(FLUSH_KEY)
+    pipe = redis.pipeline()
+    pipe.lrange(PENDING_KEY, 0, TITLE_BATCH_SIZE - 1)
+    pipe.ltrim(PENDING_KEY, TITLE_BATCH_SIZE, -1)
+    ids, _ = pipe.execute()
+    return list(dict.fromkeys(conversation_id.decode() for conversation_id in ids))
+
+
+def requeue(conversation_ids: list[str]) -> None:
+    """Put ids from a failed flush back at the head of the queue and schedule another flush."""
+    from chat.tasks import flush_title_batch
+
+    if not conversation_ids:
+        return
+    redis = get_redis_client()
+    pipe = redis.pipeline()
+    for conversation_id in conversation_ids:
+        pipe.hincrby(ATTEMPTS_KEY, conversation_id, 1)
+    pipe.expire(ATTEMPTS_KEY, 60 * 60)
+    attempts = pipe.execute()[:-1]
+    retry = [cid for cid, count in zip(conversation_ids, attempts) if count < MAX_ATTEMPTS]
+    if len(retry) < len(conversation_ids):
+        logger.error(f"Giving up on titles for {len(conversation_ids) - len(retry)} conversation(s) "
+                     f"after {MAX_ATTEMPTS} failed flushes")
+    if not retry:
+        return
+    # LPUSH reverses its arguments; push backwards to keep the queue order
+    redis.lpush(PENDING_KEY, *reversed(retry))
+    if redis.set(FLUSH_KEY, 1, nx=True, ex=TITLE_BATCH_WINDOW * 5):
+        flush_title_batch.apply_async(countdown=TITLE_BATCH_WINDOW)
+
+
+def pending_count() -> int:
+    return get_redis_client().llen(PENDING_KEY)
+
+
+def extractive_title(first_user_message: str) -> str:
+    """Local fallback: the first substantive sentence of the question, trimmed to a few words."""
+    for sentence in re.split(r"(?<=[.?!:])\s", " ".join(first_user_message.split())):
+        for _ in range(3):
+            sentence = _LEADING_FILLER.sub("", sentence)
+        words = sentence.rstrip(".?!,;:").split()[:MAX_TITLE_WORDS]
+        if len(words) >= 2:
+            title = " ".join(words)
+            return title[0].upper() + title[1:]
+    return DEFAULT_TITLE
+
+
+def apportion(total: int, weights: list[float]) -> list[int]:
+    """Split an integer total in proportion to weights; the parts always sum to total."""
+    weight_sum = sum(weights)
+    if not weights:
+        return []
+    if weight_sum <= 0:
+        weights = [1.0] * len(weights)
+        weight_sum = len(weights)
+    exact = [total * weight / weight_sum for weight in weights]
+    parts = [int(value) for value in exact]
+    # Largest remainders get the leftover tokens
+    by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - parts[i], reverse=True)
+    for i in by_remainder[:total - sum(parts)]:
+        parts[i] += 1
+    return parts
+
+
+def title_batch(exchanges: dict[str, tuple[str, str]]) -> dict:
+    """Titles for a batch of first exchanges, with each one's share of the call's usage.
+
+    Returns {key: {"title", "input_tokens", "output_tokens", "model"}}. Keys
+    the model left out get an extractive title, their share of the input
+    (their prompt lines were sent) and no output. If the call failed every
+    key gets an extractive title and no usage.
+    """
+    from chat.services.llm import generate_titles, title_prompt_line
+
+    result = {key: {"title": extractive_title(user), "input_tokens": 0, "output_tokens": 0, "model": ""}
+              for key, (user, _) in exchanges.items()}
+    try:
+        response = generate_titles(exchanges)
+    except (openai.OpenAIError, ValueError, KeyError, TypeError) as e:
+        # OpenAIError covers connection/API failures; the rest is a malformed structured response
+        logger.warning(f"Batched title generation failed for {len(exchanges)} conversation(s), using extractive titles: {e}")
+        return result
+
+    keys = list(exchanges)
+    titles = response["titles"]
+    # Input: each conversation's prompt line plus an equal share of the instructions
+    input_parts = apportion(
+        response["input_tokens"], [len(title_prompt_line(key, *exchanges[key])) + 100 for key in keys],
+    )
+    # Output: each title plus its share of the JSON wrapper; a key without a title produced none
+    output_parts = apportion(response["output_tokens"], [len(titles[key]) + 20 if key in titles else 0 for key in keys])
+    for key, input_tokens, output_tokens in zip(keys, input_parts, output_parts):
+        result[key].update(input_tokens=input_tokens, output_tokens=output_tokens, model=response["model"])
+        if key in titles:
+            result[key]["title"] = titles[key]
+        else:
+            logger.warning(f"Batched title response had no title for {key}, using extractive title")
+    return result
@@ -1,36 +1,34 @@
 """Celery tasks for chat — background summarization and title generation."""
 import logging
-from decimal import Decimal
 from celery import shared_task
 
-logger = logging.getLogger(__name__)
+from core.celery import PRIORITY_HIGH
 
-# gpt-4o-mini pricing
-_INPUT_PRICE = Decimal("0.15")   # per 1M tokens
-_OUTPUT_PRICE = Decimal("0.60")  # per 1M tokens
-_MILLION = Decimal("1000000")
+logger = logging.getLogger(__name__)
 
 
-def _log_usage(user, conversation, query_text, input_tokens, output_tokens):
+def _log_usage(user, conversation, query_text, input_tokens, output_tokens, cached_tokens=0, model=""):
     """Save a UsageLog entry for a background API call."""
     from adminpanel.models import UsageLog
-    cost = (Decimal(input_tokens) * _INPUT_PRICE / _MILLION) + (Decimal(output_tokens) * _OUTPUT_PRICE / _MILLION)
+    from chat.services.pricing import compute_cost
     UsageLog.objects.create(
         user=user,
         conversation=conversation,
         query_text=query_text,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
-        cost=cost,
+        cached_tokens=cached_tokens,
+        model=model,
+        cost=compute_cost(input_tokens, output_tokens, cached_tokens, model),
     )
 
 
-@shared_task
+@shared_task(acks_late=True)
 def summarize_conversation(conversation_id: str):
     """Create a summary of older messages when conversation exceeds 20 messages."""
     from chat.models import Conversation, ConversationSummary
+    from chat.services.model_router import TASK_SUMMARY, call_with_failover
     from core.openai_client import get_openai_client
-    from django.conf import settings
 
     conversation = Conversation.objects.get(id=conversation_id)
     messages = list(conversation.messages.order_by("created_at"))
@@ -45,22 +43,22 @@ def summarize_conversation(conversation_id: str):
     )
 
     client = get_openai_client()
-    response = client.chat.completions.create(
-        model=settings.OPENAI_CHAT_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Summarize this legal conversation concisely. "
-                    "Focus on: what topics were discussed, what legal questions were asked, "
-                    "what sources/statutes were referenced, and what conclusions were reached. "
-                    "Do NOT add new legal information. Keep it factual and brief."
-                ),
-            },
-            {"role": "user", "content": formatted},
-        ],
-        max_tokens=500,
-        temperature=0.1,
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Summarize this legal conversation concisely. "
+                "Focus on: what topics were discussed, what legal questions were asked, "
+                "what sources/statutes were referenced, and what conclusions were reached. "
+                "Do NOT add new legal information. Keep it factual and brief."
+            ),
+        },
+        {"role": "user", "content": formatted},
+    ]
+    model, response = call_with_failover(
+        TASK_SUMMARY,
+        len(formatted),
+        lambda model: client.chat.completions.create(model=model, messages=messages, max_tokens=500, temperature=0.1),
     )
     summary_text = response.choices[0].message.content.strip()
 
@@ -74,29 +72,100 @@ def summarize_conversation(conversation_id: str):
         messages_covered_until=older_messages[-1].created_at,
     )
 
-    _log_usage(conversation.user, conversation, "[summarize_conversation]", in_tok, out_tok)
+    _log_usage(conversation.user, conversation, "[summarize_conversation]", in_tok, out_tok, model=model)
     logger.info(f"Summarized {len(older_messages)} messages for conversation {conversation_id} (in={in_tok}, out={out_tok})")
 
 
 @shared_task
 def generate_conversation_title(conversation_id: str):
-    """Auto-generate a title after the first exchange."""
-    from chat.models import Conversation
-    from chat.services.llm import generate_title
+    """Queue a title after the first exchange; titles are generated in batches by flush_title_batch."""
+    from chat.services.titles import queue_title
+
+    queue_title(conversation_id)
 
-    conversation = Conversation.objects.get(id=conversation_id)
-    messages = list(conversation.messages.order_by("created_at")[:2])
 
-    if len(messages) < 2:
+@shared_task
+def flush_title_batch():
+    """Title every queued conversation with one API call per batch and push the results."""
+    from chat.models import Conversation
+    from chat.services.events import publish_user_event
+    from chat.services.sidebar import invalidate_sidebar
+    from chat.services.titles import DEFAULT_TITLE, pending_count, requeue, take_batch, title_batch
+
+    conversation_ids = take_batch()
+    if not conversation_ids:
         return
 
-    user_msg = messages[0].content if messages[0].role == "user" else messages[1].content
-    asst_msg = messages[1].content if messages[1].role == "assistant" else messages[0].content
+    done = set()
+    try:
+        exchanges = {}
+        conversations = {}
+        for conversation in Conversation.objects.filter(id__in=conversation_ids).select_related("user"):
+            messages = list(conversation.messages.order_by("created_at")[:2])
+            if len(messages) < 2:
+                continue
+            user_msg = messages[0].content if messages[0].role == "user" else messages[1].content
+            asst_msg = messages[1].content if messages[1].role == "assistant" else messages[0].content
+            exchanges[str(conversation.id)] = (user_msg, asst_msg)
+            conversations[str(conversation.id)] = conversation
+        # Deleted conversations and ones without a full exchange are never titled
+        done.update(cid for cid in conversation_ids if cid not in exchanges)
+
+        results = title_batch(exchanges) if exchanges else {}
+        for key, result in results.items():
+            conversation = conversations[key]
+            title = result["title"][:200]
+            # A title the user set meanwhile wins
+            if Conversation.objects.filter(pk=conversation.pk, title=DEFAULT_TITLE).update(title=title):
+                conversation.title = title
+                invalidate_sidebar(conversation.user_id)
+                publish_user_event(conversation.user_id, {
+                    "type": "title",
+                    "conversation_id": key,
+                    "title": title,
+                })
+            if result["model"]:
+                _log_usage(
+                    conversation.user, conversation, "[generate_title]", result["input_tokens"],
+                    result["output_tokens"], model=result["model"],
+                )
+            done.add(key)
+    except Exception:
+        # The ids were already popped; put back what was not saved
+        requeue([cid for cid in conversation_ids if cid not in done])
+        raise
+    logger.info(f"Generated {len(results)} title(s) in one batch")
+
+    if pending_count():
+        flush_title_batch.delay()
+
+
+@shared_task(bind=True, priority=PRIORITY_HIGH, max_retries=None)
+def generate_response(self, conversation_id: str, user_message_id: str, speculative: bool = False,
+                      enqueued_at: float | None = None, position: int = 0):
+    """Generate the assistant reply for a user message into its Redis event stream.
+
+    While admission control has no free stream slot the task retries itself
+    every RETRY_SECONDS instead of waiting, so queued answers never occupy
+    worker slots that titles and admitted answers need.
+    """
+    from chat.services.admission import RETRY_SECONDS, AdmissionQueued
+    from chat.services.generation import run_generation
+
+    try:
+        run_generation(conversation_id, user_message_id, speculative, enqueued_at, position)
+    except AdmissionQueued as queued:
+        raise self.retry(
+            args=(conversation_id, user_message_id, speculative),
+            kwargs={"enqueued_at": queued.enqueued_at, "position": queued.position},
+            countdown=RETRY_SECONDS,
+        )
 
-    result = generate_title(user_msg, asst_msg)
-    title = result["title"]
-    conversation.title = title[:200]
-    conversation.save(update_fields=["title"])
 
-    _log_usage(conversation.user, conversation, "[generate_title]", result["input_tokens"], result["output_tokens"])
-    logger.info(f"Generated title for conversation {conversation_id}: {title} (in={result['input_tokens']}, out={result['output_tokens']})")
+@shared_task
+def train_query_router():
+    """Rebuild the local query router model (chat.services.router) from recent data."""
+    from chat.services.router import train_router
+
+    result = train_router()
+    logger.info(f"Trained query router: {result}")
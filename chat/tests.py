@@ -1,3 +1,575 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import openai
+from openai import OpenAI
+
+from asgiref.sync import async_to_sync
+from channels.auth import AuthMiddlewareStack
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.identity import invalidate_user
+from adminpanel.management.commands.seed_perf_data import HEAVY_EMAIL
+from chat.models import Conversation, Message
+from chat.routing import websocket_urlpatterns
+from chat.services import admission, hedging, model_router
+from chat.services.admission import Admission, AdmissionQueued, AdmissionTimeout
+from chat.services.assistant import stream_response
+from chat.services.generation import GenerationBuffer, generate_events, run_generation
+from chat.services.markdown import MarkdownBlockStream
+from chat.services.pricing import compute_cost
+from chat.services.router import route
+from chat.services.sidebar import invalidate_sidebar
+from chat.services.sse import DONE_FRAME
+from chat.services.titles import ATTEMPTS_KEY, FLUSH_KEY, MAX_ATTEMPTS, PENDING_KEY, extractive_title, title_batch
+from chat.tasks import flush_title_batch
+from core.openai_cassettes import CassetteTransport, cassette, timings
+from core.redis_client import get_redis_client
+from core.tracing import get_spans, trace_for_message
+from core.query_plans import seq_scans
+
+
+class MarkdownBlockStreamTests(TestCase):
+    def test_chars_count_utf16_code_units(self):
+        # The browser slices its tail by this count; JS strings are UTF-16
+        blocks = MarkdownBlockStream().feed("Liens \U0001F3E0 first.\n\nNext\n")
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0]["chars"], len("Liens ") + 2 + len(" first.\n\n"))
+
+
+class QueryRouterTests(TestCase):
+    def test_small_talk_skips_retrieval(self):
+        for text in ["Hi!", "hello Thomas", "Thank you so much!", "thanks again", "Good morning", "Who are you?"]:
+            with self.subTest(text=text):
+                self.assertEqual(route(text), {"retrieval": False, "domain": ""})
+
+    def test_follow_ups_keep_retrieval(self):
+        for text in ["really?", "that", "got it, so very good", "why?", "yes", "and what about the deposit?"]:
+            with self.subTest(text=text):
+                self.assertTrue(route(text)["retrieval"])
+
+    def test_domain(self):
+        self.assertEqual(route("Can my landlord keep my security deposit?")["domain"], "property")
+        self.assertEqual(route("What is the weather like?")["domain"], "other")
+
+    def test_well_under_a_millisecond(self):
+        texts = ["thanks!", "really?", "Can my landlord keep my security deposit after I move out?"] * 100
+        route(texts[0])  # model load from the cache is not part of the per-query cost
+        start = time.perf_counter()
+        for text in texts:
+            route(text)
+        self.assertLess((time.perf_counter() - start) / len(texts), 0.0002)
+
+
+@override_settings(OPENAI_ANSWER_MODELS=["gpt-4o", "gpt-4.1", "gpt-4.1-mini"], OPENAI_BACKGROUND_MODELS=["gpt-4o-mini", "gpt-4.1-nano"],
+                   OPENAI_ROUTER_TTFT_P95_MS=1000, OPENAI_ROUTER_MAX_ERROR_RATE=0.25)
+class ModelRouterTests(TestCase):
+    MODELS = ["gpt-4o", "gpt-4.1", "gpt-4.1-mini", "gpt-4o-mini", "gpt-4.1-nano"]
+
+    def setUp(self):
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        get_redis_client().delete(*[key for m in self.MODELS for key in (model_router._ttft_key(m), model_router._outcome_key(m))])
+        model_router._stats_read_at = 0.0
+
+    def record(self, model, ttft=None, error=False, times=model_router.MIN_SAMPLES):
+        for _ in range(times):
+            if error:
+                model_router.record_error(model)
+            else:
+                model_router.record_success(model, ttft)
+        model_router._stats_read_at = 0.0
+
+    def test_preference_order_when_healthy(self):
+        self.assertEqual(model_router.rank_models("answer"), ["gpt-4o", "gpt-4.1", "gpt-4.1-mini"])
+
+    def test_prompt_must_fit_the_context_window(self):
+        # ~200k tokens: over gpt-4o's 128k window
+        self.assertEqual(model_router.rank_models("answer", prompt_chars=800_000), ["gpt-4.1", "gpt-4.1-mini"])
+
+    def test_degraded_models_go_last_by_p95(self):
+        self.record("gpt-4o", ttft=3.0)
+        self.record("gpt-4.1", ttft=2.0)
+        self.assertEqual(model_router.rank_models("answer"), ["gpt-4.1-mini", "gpt-4.1", "gpt-4o"])
+
+    def test_error_rate_degrades_background_models_but_latency_does_not(self):
+        self.record("gpt-4o-mini", ttft=9.0)
+        self.assertEqual(model_router.rank_models("title"), ["gpt-4o-mini", "gpt-4.1-nano"])
+        self.record("gpt-4o-mini", error=True)
+        self.assertEqual(model_router.rank_models("title"), ["gpt-4.1-nano", "gpt-4o-mini"])
+
+    @override_settings(OPENAI_BACKGROUND_MODELS=[])
+    def test_no_candidates_is_a_configuration_error(self):
+        with self.assertRaises(ImproperlyConfigured):
+            model_router.rank_models("summary")
+
+    def test_failover_moves_down_the_ranking(self):
+        calls = []
+
+        def call(model):
+            calls.append(model)
+            if model == "gpt-4o-mini":
+                raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+            return "ok"
+
+        with self.assertLogs("chat.services.model_router", "WARNING"):
+            self.assertEqual(model_router.call_with_failover("title", 100, call), ("gpt-4.1-nano", "ok"))
+        self.assertEqual(calls, ["gpt-4o-mini", "gpt-4.1-nano"])
+        model_router._stats_read_at = 0.0
+        stats = model_router.model_stats("title")
+        self.assertEqual((stats["gpt-4o-mini"]["error_rate"], stats["gpt-4.1-nano"]["error_rate"]), (1.0, 0.0))
+
+    def test_failover_reraises_the_last_error_and_not_others(self):
+        request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+
+        def unavailable(model):
+            raise openai.APIConnectionError(request=request)
+
+        with self.assertRaises(openai.APIConnectionError), self.assertLogs("chat.services.model_router", "WARNING"):
+            model_router.call_with_failover("title", 100, unavailable)
+
+        calls = []
+
+        def bad_request(model):
+            calls.append(model)
+            raise ValueError("bad request")
+
+        with self.assertRaises(ValueError):
+            model_router.call_with_failover("title", 100, bad_request)
+        self.assertEqual(calls, ["gpt-4o-mini"])
+
+    def test_compute_cost(self):
+        # 600k uncached input at $2.50/M + 400k cached at $1.25/M + 1M output at $10/M
+        self.assertEqual(compute_cost(1_000_000, 1_000_000, 400_000, "gpt-4o"), Decimal("12.00"))
+        # cached tokens are a subset of input tokens
+        self.assertEqual(compute_cost(1000, 0, 5000, "gpt-4o-mini"), Decimal("0.000075"))
+        with self.assertLogs("chat.services.pricing", "WARNING"):
+            self.assertEqual(compute_cost(1000, 1000, model="unknown-model"), compute_cost(1000, 1000, model=settings.OPENAI_CHAT_MODEL))
+
+
+class FakeStream:
+    """A Responses stream stand-in: yields events once wait_until() is true, or nothing if closed first."""
+
+    def __init__(self, events, wait_until=lambda: True):
+        self.events = events
+        self.wait_until = wait_until
+        self.closed = False
+
+    def __iter__(self):
+        deadline = time.monotonic() + 5
+        while not self.wait_until():
+            if self.closed or time.monotonic() > deadline:
+                return
+            time.sleep(0.001)
+        for event in self.events:
+            if self.closed:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+def text_events(text):
+    return [SimpleNamespace(type="response.output_text.delta", delta=text), SimpleNamespace(type="response.completed")]
+
+
+class HedgedStreamTests(TestCase):
+    def hedged(self, primary, hedge=None, after=0.01):
+        open_hedge = mock.Mock(return_value=hedge)
+        return hedging.HedgedStream(primary, open_hedge, after), open_hedge
+
+    def texts(self, stream):
+        return [event.delta for event in stream if event.type == "response.output_text.delta"]
+
+    # Streams that wait on the HedgedStream itself check for None: their pump starts in its constructor
+
+    def test_primary_first_within_the_threshold_is_not_hedged(self):
+        stream, open_hedge = self.hedged(FakeStream(text_events("primary")), after=5)
+        with mock.patch("chat.services.hedging._take_hedge_budget") as take_budget:
+            self.assertEqual(self.texts(stream), ["primary"])
+        take_budget.assert_not_called()
+        open_hedge.assert_not_called()
+        self.assertEqual((stream.winner, stream.hedged), (0, False))
+
+    def test_hedge_wins_and_primary_is_closed(self):
+        primary = FakeStream(text_events("primary"), wait_until=lambda: False)
+        hedge = FakeStream(text_events("hedge"))
+        stream, open_hedge = self.hedged(primary, hedge)
+        with mock.patch("chat.services.hedging._take_hedge_budget", return_value=True):
+            self.assertEqual(self.texts(stream), ["hedge"])
+        open_hedge.assert_called_once()
+        self.assertEqual((stream.winner, stream.hedged, primary.closed, hedge.closed), (1, True, True, False))
+        # The router is fed the primary's time until it was cancelled, which is at least the hedge delay
+        self.assertGreaterEqual(stream.primary_first_text_at() - stream.started, 0.01)
+
+    def test_failed_hedge_leaves_the_primary_to_answer(self):
+        stream = None
+        primary = FakeStream(text_events("primary"), wait_until=lambda: stream is not None and 1 in stream.finished)
+        hedge = FakeStream([RuntimeError("hedge failed")])
+        stream, _ = self.hedged(primary, hedge)
+        with mock.patch("chat.services.hedging._take_hedge_budget", return_value=True):
+            self.assertEqual(self.texts(stream), ["primary"])
+        self.assertEqual((stream.winner, primary.closed), (0, False))
+
+    def test_failed_primary_leaves_the_hedge_to_answer(self):
+        stream = None
+        primary = FakeStream([RuntimeError("primary failed")], wait_until=lambda: stream is not None and 1 in stream.streams)
+        hedge = FakeStream(text_events("hedge"), wait_until=lambda: stream is not None and 0 in stream.finished)
+        stream, _ = self.hedged(primary, hedge)
+        with mock.patch("chat.services.hedging._take_hedge_budget", return_value=True):
+            self.assertEqual(self.texts(stream), ["hedge"])
+        self.assertEqual(stream.winner, 1)
+
+    def test_exhausted_budget_skips_the_hedge(self):
+        stream = None
+        primary = FakeStream(text_events("primary"), wait_until=lambda: stream is not None and stream.skipped)
+        stream, open_hedge = self.hedged(primary)
+        with mock.patch("chat.services.hedging._take_hedge_budget", return_value=False), \
+                mock.patch("chat.services.hedging.record_outcome") as record_outcome:
+            self.assertEqual(self.texts(stream), ["primary"])
+        open_hedge.assert_not_called()
+        record_outcome.assert_called_once_with("skipped", 0, Decimal(0))
+        self.assertEqual((stream.winner, stream.hedged), (0, False))
+
+
+class StreamingConnectionTests(TransactionTestCase):
+    """No DB connection may be held while an answer is streaming.
+
+    TransactionTestCase because closing a connection inside TestCase's
+    wrapping transaction is (correctly) refused by release_db_connections().
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="reader@example.com", password="pw")
+        self.conv = Conversation.objects.create(user=self.user)
+        self.user_msg = Message.objects.create(conversation=self.conv, role="user", content="What is a lien?")
+
+    async def collect(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    def test_sse_relay_holds_no_connection(self):
+        held = []
+
+        async def fake_relay(user_message_id, last_event_id="0"):
+            for frame in (b'data: {"token":"A lien"}\n\n', DONE_FRAME):
+                held.append(connection.connection is not None)
+                yield frame
+
+        self.client.force_login(self.user)
+        with mock.patch("chat.views.attach_generation", return_value=self.user_msg), \
+                mock.patch("chat.views.relay_buffer", fake_relay):
+            response = self.client.get(reverse("chat:stream", args=[self.conv.pk]))
+            self.assertIsNone(connection.connection)
+            body = async_to_sync(self.collect)(response)
+
+        self.assertTrue(body.endswith(DONE_FRAME))
+        self.assertEqual(held, [False, False])
+
+    def test_generation_holds_no_connection_during_upstream_stream(self):
+        held = []
+        # The upstream is read on another thread; check the generating thread's connection
+        caller = connections[DEFAULT_DB_ALIAS]
+
+        def fake_upstream(history, summary):
+            for token in ("A lien ", "is a claim."):
+                held.append(caller.connection is not None)
+                yield {"token": token}
+            yield {"usage": {"input_tokens": 10, "output_tokens": 4}}
+
+        with mock.patch("chat.services.generation.assistant_stream_response", fake_upstream), \
+                mock.patch("chat.services.generation.generate_conversation_title"):
+            events = list(generate_events(self.conv, self.user_msg))
+
+        self.assertEqual(held, [False, False])
+        self.assertIn({"token": "A lien "}, events)
+        assistant_msg = self.conv.messages.get(role="assistant")
+        self.assertEqual(assistant_msg.content, "A lien is a claim.")
+
+    def test_buffered_tokens_are_flushed_while_upstream_pauses(self):
+        flushed = threading.Event()
+        resumed = []
+
+        def fake_upstream(history, summary):
+            yield {"token": "A "}  # released at once
+            yield {"token": "lien "}  # buffered behind the first
+            # Only continues once the buffered delta has reached the reader
+            resumed.append(flushed.wait(2))
+            yield {"token": "is a claim."}
+            yield {"usage": {"input_tokens": 10, "output_tokens": 4}}
+
+        tokens = []
+        with mock.patch("chat.services.generation.assistant_stream_response", fake_upstream), \
+                mock.patch("chat.services.generation.generate_conversation_title"):
+            for event in generate_events(self.conv, self.user_msg):
+                if "token" in event:
+                    tokens.append(event["token"])
+                    if "lien" in event["token"]:
+                        flushed.set()
+
+        self.assertEqual(resumed, [True])
+        self.assertEqual(tokens, ["A ", "lien ", "is a claim."])
+
+
+@override_settings(CHAT_MAX_CONCURRENT_STREAMS=1, CHAT_MAX_STREAMS_PER_USER=2, CHAT_ADMISSION_TIMEOUT=120)
+class AdmissionTests(TestCase):
+    """The Redis admission script: slots, per-user limits, the staff lane and leases."""
+
+    def setUp(self):
+        redis = get_redis_client()
+        keys = [admission.HOLDERS_KEY, admission.QUEUE_KEY, admission.WAITING_KEY] + [
+            admission._user_key(user) for user in ("u1", "u2", "staff")
+        ]
+        redis.delete(*keys)
+        self.addCleanup(redis.delete, *keys)
+
+    def test_slot_is_handed_to_the_queue_in_order(self):
+        first, second, third = Admission("m1", "u1"), Admission("m2", "u2"), Admission("m3", "u2")
+        self.assertEqual(first.poll(), 0)
+        self.assertEqual(second.poll(), 1)
+        self.assertEqual(third.poll(), 2)
+        first.release()
+        self.assertEqual(third.poll(), 2)  # second is still ahead
+        self.assertEqual(second.poll(), 0)
+
+    def test_staff_wait_ahead_of_everyone(self):
+        Admission("m1", "u1").poll()
+        self.assertEqual(Admission("m2", "u2").poll(), 1)
+        self.assertEqual(Admission("m3", "staff", priority=True).poll(), 1)
+        self.assertEqual(Admission("m2", "u2").poll(), 2)
+
+    @override_settings(CHAT_MAX_CONCURRENT_STREAMS=5, CHAT_MAX_STREAMS_PER_USER=1)
+    def test_user_over_their_limit_does_not_block_others(self):
+        self.assertEqual(Admission("m1", "u1").poll(), 0)
+        self.assertGreater(Admission("m2", "u1").poll(), 0)
+        self.assertEqual(Admission("m3", "u2").poll(), 0)
+
+    def test_expired_lease_frees_the_slot_and_renewal_keeps_it(self):
+        now = 1_000_000.0
+        with mock.patch("chat.services.admission.time.time", return_value=now):
+            holder = Admission("m1", "u1")
+            self.assertEqual(holder.poll(), 0)
+        with mock.patch("chat.services.admission.time.time", return_value=now + 50):
+            holder.renew()
+        with mock.patch("chat.services.admission.time.time", return_value=now + 70):
+            self.assertEqual(Admission("m2", "u2").poll(), 1)
+        with mock.patch("chat.services.admission.time.time", return_value=now + admission.LEASE_SECONDS + 51):
+            self.assertEqual(Admission("m2", "u2").poll(), 0)
+
+    def test_admitted_slot_is_renewed_on_a_timer(self):
+        holder = Admission("m1", "u1")
+        with mock.patch("chat.services.admission.RENEW_INTERVAL", 0.01):
+            self.assertTrue(holder.try_admit(lambda position: None, lambda: False))
+        redis = get_redis_client()
+        first_expiry = redis.zscore(admission.HOLDERS_KEY, "m1")
+        deadline = time.monotonic() + 2
+        while redis.zscore(admission.HOLDERS_KEY, "m1") == first_expiry and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(redis.zscore(admission.HOLDERS_KEY, "m1"), first_expiry)
+        holder.release()
+        self.assertIsNone(redis.zscore(admission.HOLDERS_KEY, "m1"))
+
+    def test_try_admit_queues_without_waiting_then_times_out(self):
+        Admission("m1", "u1").poll()
+        positions = []
+        with self.assertRaises(AdmissionQueued) as queued:
+            Admission("m2", "u2").try_admit(positions.append, lambda: False)
+        self.assertEqual((queued.exception.position, positions), (1, [1]))
+        # The retry keeps its place and reports nothing new
+        retry = Admission("m2", "u2", enqueued_at=queued.exception.enqueued_at - 121)
+        with self.assertRaises(AdmissionTimeout):
+            retry.try_admit(positions.append, lambda: False, last_position=1)
+        self.assertEqual(positions, [1])
+        self.assertIsNone(get_redis_client().zscore(admission.QUEUE_KEY, "m2"))
+
+    def test_queued_generation_reports_position_and_keeps_its_place(self):
+        user = get_user_model().objects.create_user(email="reader@example.com", password="pw")
+        conv = Conversation.objects.create(user=user)
+        user_msg = Message.objects.create(conversation=conv, role="user", content="What is a lien?")
+        buffer = GenerationBuffer(user_msg.pk)
+        self.addCleanup(buffer.redis.delete, buffer.key)
+        Admission("m1", "u1").poll()
+
+        with mock.patch("chat.services.generation.generate_events") as generate:
+            with self.assertRaises(AdmissionQueued):
+                run_generation(str(conv.pk), str(user_msg.pk))
+        generate.assert_not_called()
+        entries = [json.loads(data[b"data"]) for _, data in buffer.redis.xrange(buffer.key)]
+        self.assertEqual(entries, [{"queued": {"position": 1}}])
+        self.assertEqual(get_redis_client().zrank(admission.QUEUE_KEY, str(user_msg.pk)), 0)
+
+
+class TitleBatchTests(TestCase):
+    def setUp(self):
+        redis = get_redis_client()
+        redis.delete(PENDING_KEY, FLUSH_KEY, ATTEMPTS_KEY)
+        self.addCleanup(redis.delete, PENDING_KEY, FLUSH_KEY, ATTEMPTS_KEY)
+
+    def test_key_without_a_title_pays_for_its_input_only(self):
+        response = {"titles": {"a": "Mechanic's liens"}, "input_tokens": 300, "output_tokens": 30, "model": "gpt-4o-mini"}
+        with mock.patch("chat.services.llm.generate_titles", return_value=response):
+            result = title_batch({"a": ("What is a mechanic's lien?", "A lien is..."), "b": ("How do I file in small claims court?", "...")})
+
+        self.assertEqual(result["a"]["title"], "Mechanic's liens")
+        self.assertEqual(result["b"]["title"], extractive_title("How do I file in small claims court?"))
+        self.assertEqual((result["a"]["output_tokens"], result["b"]["output_tokens"]), (30, 0))
+        self.assertEqual(result["a"]["input_tokens"] + result["b"]["input_tokens"], 300)
+        self.assertGreater(result["b"]["input_tokens"], 0)
+
+    def test_failed_flush_requeues_until_max_attempts(self):
+        user = get_user_model().objects.create_user(email="reader@example.com", password="pw")
+        conv = Conversation.objects.create(user=user)
+        Message.objects.create(conversation=conv, role="user", content="What is a lien?")
+        Message.objects.create(conversation=conv, role="assistant", content="A claim on property.")
+        redis = get_redis_client()
+        redis.rpush(PENDING_KEY, str(conv.pk))
+
+        with mock.patch("chat.services.titles.title_batch", side_effect=RuntimeError("db gone")), \
+                mock.patch("chat.tasks.flush_title_batch.apply_async") as schedule:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                with self.assertRaises(RuntimeError):
+                    flush_title_batch()
+                pending = [cid.decode() for cid in redis.lrange(PENDING_KEY, 0, -1)]
+                self.assertEqual(pending, [str(conv.pk)] if attempt < MAX_ATTEMPTS else [])
+        self.assertEqual(schedule.call_count, MAX_ATTEMPTS - 1)
+
+
+class WebSocketMasqueradeTests(TransactionTestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(email="admin@example.com", password="pw", is_staff=True)
+        self.target = get_user_model().objects.create_user(email="client@example.com", password="pw")
+        self.conv = Conversation.objects.create(user=self.target)
+        self.client.force_login(self.admin)
+        session = self.client.session
+        session["masquerade_user_id"] = str(self.target.pk)
+        session.save()
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session.session_key}".encode()
+
+    @override_settings(TRACE_SAMPLE_RATE=1.0)
+    async def test_masquerading_admin_sends_as_target(self):
+        communicator = WebsocketCommunicator(
+            AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), "/ws/chat/", headers=[(b"cookie", self.cookie)],
+        )
+        with mock.patch("chat.services.generation.ensure_generation") as ensure:
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({
+                "type": "send", "conversation_id": str(self.conv.pk), "message": "What is a lien?",
+            })
+            reply = await communicator.receive_json_from(timeout=5)
+            await communicator.disconnect()
+
+        self.assertEqual(reply["type"], "user_message")
+        ensure.assert_called_once()
+        user_msg = await Message.objects.aget(conversation=self.conv)
+        # Same path as send_message: the answer joins the message's trace
+        trace = trace_for_message(user_msg.pk)
+        self.assertIsNotNone(trace)
+        spans = {span["name"]: span for span in get_spans(trace["id"])}
+        self.assertEqual(spans["send_message"]["attrs"]["user_id"], str(self.target.pk))
+        self.assertNotIn("@", json.dumps(list(spans.values())))  # no email addresses in Redis traces
+
+
+class ChatViewQueryTests(TestCase):
+    """Query counts and plans of the chat pages over seed_perf_data output (long conversations, many of them)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_perf_data", users=30, messages=600, documents=0, usage_logs=0, stdout=StringIO())
+        cls.heavy = get_user_model().objects.get(email=HEAVY_EMAIL)
+        cls.longest = Conversation.objects.filter(user=cls.heavy).order_by("-message_count").first()
+
+    def setUp(self):
+        invalidate_user(self.heavy.pk)
+        invalidate_sidebar(self.heavy.pk)
+        self.client.force_login(self.heavy)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_conversation_detail(self):
+        # user, conversation, message window, sidebar page
+        with self.assertNumQueries(4):
+            self.get(reverse("chat:detail", args=[self.longest.pk]))
+        # The sidebar fragment is now cached
+        invalidate_user(self.heavy.pk)
+        with self.assertNumQueries(3):
+            self.get(reverse("chat:detail", args=[self.longest.pk]))
+
+    def test_sidebar(self):
+        with self.assertNumQueries(2):
+            self.get(reverse("chat:sidebar"))
+        invalidate_user(self.heavy.pk)
+        with self.assertNumQueries(1):
+            self.get(reverse("chat:sidebar"))
+
+    @skipUnless(connection.vendor == "postgresql", "EXPLAIN plans are PostgreSQL-specific")
+    def test_no_full_scans(self):
+        for url in (reverse("chat:detail", args=[self.longest.pk]), reverse("chat:sidebar")):
+            with self.subTest(url):
+                invalidate_sidebar(self.heavy.pk)
+                with CaptureQueriesContext(connection) as captured:
+                    self.get(url)
+                self.assertEqual(seq_scans(captured.captured_queries, force_index=True), [])
+
+
+def _sse(event_type, **data):
+    return f"event: {event_type}\ndata: {json.dumps({'type': event_type, 'sequence_number': 0, **data})}\n\n"
+
+
+class CassetteReplayTests(TestCase):
+    """stream_response gives the same events replayed from a cassette as it did against the API."""
+
+    def upstream(self, request):
+        body = "".join([
+            _sse("response.output_text.delta", item_id="m", output_index=0, content_index=0, delta="A lien "),
+            _sse("response.output_text.delta", item_id="m", output_index=0, content_index=0, delta="is a claim."),
+            _sse("response.completed", response={
+                "id": "resp_1", "object": "response", "created_at": 0, "status": "completed", "model": "gpt-4o-mini",
+                "output": [], "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+                "usage": {"input_tokens": 1200, "input_tokens_details": {"cached_tokens": 1024},
+                          "output_tokens": 4, "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": 1204},
+            }),
+        ])
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, text=body)
+
+    def run_question(self, transport):
+        client = OpenAI(api_key="test", http_client=httpx.Client(transport=transport), max_retries=0)
+        with mock.patch("chat.services.assistant.get_openai_client", return_value=client), \
+                mock.patch("chat.services.assistant._log_raw"), cassette("Q1") as tape:
+            events = list(stream_response([{"role": "user", "content": "What is a lien?"}], file_search=False))
+        return events, tape["interactions"]
+
+    def test_record_then_replay_offline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorded, _ = self.run_question(
+                CassetteTransport("record", directory, wrapped=httpx.MockTransport(self.upstream)))
+            replayed, interactions = self.run_question(CassetteTransport("replay", directory))
+
+        self.assertEqual(replayed, recorded)
+        self.assertIn({"usage": {"input_tokens": 1200, "output_tokens": 4, "cached_tokens": 1024,
+                                 "model": "gpt-4o-mini"}}, replayed)
+        self.assertFalse(interactions[0]["stale"])
+        self.assertIsNotNone(timings(interactions[0])["ttft_ms"])
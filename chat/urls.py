@@ -7,11 +7,13 @@ urlpatterns = [
     path("", views.chat_home, name="home"),
     path("new/", views.conversation_new, name="new"),
     path("<uuid:pk>/", views.conversation_detail, name="detail"),
+    path("<uuid:pk>/messages/", views.conversation_messages, name="messages"),
     path("<uuid:pk>/send/", views.send_message, name="send"),
     path("<uuid:pk>/stream/", views.stream_response, name="stream"),
     path("<uuid:pk>/archive/", views.conversation_archive, name="archive"),
     path("<uuid:pk>/rename/", views.conversation_rename, name="rename"),
     path("<uuid:pk>/pin/", views.conversation_pin, name="pin"),
-    path("<uuid:pk>/title/", views.conversation_title, name="title"),
     path("sidebar/", views.conversation_sidebar, name="sidebar"),
+    path("sidebar/more/", views.conversation_sidebar_more, name="sidebar_more"),
+    path("events/", views.user_events, name="events"),
 ]
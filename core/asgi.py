@@ -3,3 +3,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.CHAT_WEBSOCKET_ENABLED:
+    # Import after the app registry is ready — consumers import models
+    from channels.auth import AuthMiddlewareStack
+    from channels.routing import ProtocolTypeRouter, URLRouter
+    from channels.security.websocket import AllowedHostsOriginValidator
+
+    from chat.routing import websocket_urlpatterns
+
+    application = ProtocolTypeRouter({
+        "http": application,
+        "websocket": AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+    })
@@ -1,8 +1,108 @@
+"""Celery app and queue topology.
+
+Tasks are routed (CELERY_TASK_ROUTES) to three queues so bulk ingestion
+never delays work a user is waiting for:
+
+    interactive  generate_response, titles           -> one worker, threads pool
+    background   summaries, router training          -> small worker
+    ingestion    process_document, sync_drive_folder -> small worker, acks_late
+
+Within a queue, lower priority numbers run first (Redis priority lists,
+CELERY_BROKER_TRANSPORT_OPTIONS). Every message carries a published_at
+header so `manage.py celery_queues` can report queue lag. Task run times
+go to core.metrics (celery_task_duration_seconds). Tasks published during a
+traced request carry a "trace" header and join that trace (core.tracing).
+"""
 import os
+import time
+from contextlib import ExitStack
+
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
+QUEUE_INTERACTIVE = "interactive"
+QUEUE_BACKGROUND = "background"
+QUEUE_INGESTION = "ingestion"
+QUEUES = [QUEUE_INTERACTIVE, QUEUE_BACKGROUND, QUEUE_INGESTION]
+
+# Redis transport priorities: 0 runs first. Must be one of the configured priority_steps.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 3
+PRIORITY_BULK = 6
+
 app = Celery("core")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    """Record publish time on every message; queue lag is measured from it."""
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+        from core import tracing
+
+        trace = tracing.current()
+        if trace:
+            headers.setdefault("trace", tracing.serialize(trace))
+
+
+_task_started = {}
+_task_traces = {}
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+
+
+@task_prerun.connect
+def join_trace(task_id=None, task=None, **kwargs):
+    """Run the task inside the trace it was published from: a queue-wait span, then a task span."""
+    from core import tracing
+
+    trace = tracing.parse(_header(task, "trace")) if task is not None else None
+    if not trace:
+        return
+    stack = ExitStack()
+    stack.enter_context(tracing.activated(trace))
+    published_at = _header(task, "published_at")
+    if published_at:
+        tracing.record_span("celery.queue", published_at, max(time.time() - published_at, 0), queue=_queue_of(task))
+    stack.enter_context(tracing.span(f"celery.{task.name.rsplit('.', 1)[-1]}", task_id=task_id))
+    _task_traces[task_id] = stack
+
+
+@task_postrun.connect
+def observe_task_time(task_id=None, task=None, state=None, **kwargs):
+    from core.metrics import CELERY_TASK_SECONDS
+
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.monotonic() - started)
+
+
+@task_postrun.connect
+def leave_trace(task_id=None, **kwargs):
+    stack = _task_traces.pop(task_id, None)
+    if stack is not None:
+        stack.close()
+
+
+def _header(task, name):
+    # Workers expose message headers as request attributes; task.apply() keeps them in request.headers
+    return getattr(task.request, name, None) or (task.request.headers or {}).get(name)
+
+
+def _queue_of(task) -> str:
+    delivery_info = getattr(task.request, "delivery_info", None) or {}
+    return delivery_info.get("routing_key") or ""
+
+
+@worker_process_shutdown.connect
+def drop_process_metrics(pid=None, **kwargs):
+    from core.metrics import mark_process_dead
+
+    mark_process_dead(pid or os.getpid())
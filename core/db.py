@@ -0,0 +1,20 @@
+"""Database connection helpers for long-running requests and tasks.
+
+Streaming answers take 10-60s of upstream time with no database work in
+between. Code on those paths does its queries in short sections and calls
+release_db_connections() before waiting, so the connection goes back to the
+pool (or is closed) instead of being held for the whole stream.
+Usage: from core.db import release_db_connections
+"""
+from django.db import connections
+
+
+def release_db_connections() -> None:
+    """Return this thread's open DB connections to the pool.
+
+    Connections inside an atomic block are left alone; closing them would
+    break the transaction. The next query transparently checks one out again.
+    """
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
@@ -0,0 +1,80 @@
+"""Distributed lease locks in Redis.
+
+A lock is a Redis key holding a random token, set only if absent and with
+an expiry (the lease). The holder renews the lease while it works, so a
+crashed worker frees the lock on its own once the lease runs out. Renewal
+and release check the token first, so a holder whose lease already expired
+(and was taken over) cannot extend or delete someone else's lock.
+
+Usage:
+    lock = LeaseLock("drive-sync", ttl=300)
+    if lock.acquire():
+        try:
+            for item in work:
+                lock.renew()  # raises LockLost if the lease was lost
+                ...
+        finally:
+            lock.release()
+"""
+import time
+import uuid
+
+from core.redis_client import get_redis_client
+
+# KEYS: lock; ARGV: token, lease ms. Returns 1 if still held and extended.
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: lock; ARGV: token. Returns 1 if deleted.
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LockLost(Exception):
+    """Raised by renew() when the lease expired and the lock is gone or held by someone else."""
+
+
+class LeaseLock:
+    def __init__(self, name: str, ttl: int, renew_interval: float | None = None):
+        self.key = f"lock:{name}"
+        self.ttl = ttl
+        # Renew well before the lease could run out
+        self.renew_interval = renew_interval if renew_interval is not None else ttl / 3
+        self.token = uuid.uuid4().hex
+        self.redis = get_redis_client()
+        self.held = False
+        self.renewed_at = 0.0
+
+    def acquire(self) -> bool:
+        """Take the lock if nobody holds it. Never waits."""
+        self.held = bool(self.redis.set(self.key, self.token, nx=True, ex=self.ttl))
+        self.renewed_at = time.monotonic()
+        return self.held
+
+    def renew(self) -> None:
+        """Extend the lease; cheap to call often, it only writes every renew_interval."""
+        if not self.held:
+            raise LockLost(f"{self.key} is not held")
+        if time.monotonic() - self.renewed_at < self.renew_interval:
+            return
+        if not self.redis.eval(_RENEW, 1, self.key, self.token, self.ttl * 1000):
+            self.held = False
+            raise LockLost(f"Lease on {self.key} expired")
+        self.renewed_at = time.monotonic()
+
+    def release(self) -> None:
+        if self.held:
+            self.redis.eval(_RELEASE, 1, self.key, self.token)
+            self.held = False
+
+    def is_locked(self) -> bool:
+        """Whether anyone holds the lock right now."""
+        return bool(self.redis.exists(self.key))
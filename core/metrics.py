@@ -0,0 +1,102 @@
+"""Prometheus metrics for chat latency, tokens and the ingestion pipeline.
+
+Exposed at /metrics (core.views.metrics). Every Daphne and Celery process
+records into the same set of metrics:
+
+* With PROMETHEUS_MULTIPROC_DIR set (an empty directory, shared by all
+  processes on the host and wiped before they start), each process writes
+  its samples to files there and /metrics sums them across processes.
+* Without it, /metrics only reports the process that serves the request.
+
+Usage:
+    from core.metrics import CHAT_TTFT, timed
+    CHAT_TTFT.labels(model).observe(seconds)
+    with timed(DRIVE_SYNC_PHASE_SECONDS, phase="list"):
+        ...
+"""
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+TASK_BUCKETS = (0.05, 0.25, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RATE_BUCKETS = (5, 10, 20, 30, 45, 60, 80, 100, 150, 200, 300)
+
+# Chat answers (chat.services.assistant.stream_response)
+CHAT_TTFT = Histogram(
+    "chat_ttft_seconds", "Time from opening the upstream request to the first text delta",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+CHAT_STREAM_SECONDS = Histogram(
+    "chat_stream_duration_seconds", "Total duration of an upstream answer stream",
+    ["model", "outcome"], buckets=LATENCY_BUCKETS,
+)
+CHAT_TOKENS_PER_SECOND = Histogram(
+    "chat_output_tokens_per_second", "Output tokens per second after the first token",
+    ["model"], buckets=RATE_BUCKETS,
+)
+CHAT_TOKENS = Counter("chat_tokens", "Tokens used by answers", ["model", "kind"])
+CHAT_RESPONSES = Counter("chat_responses", "Completed answers, by whether file_search ran", ["model", "file_search"])
+CHAT_TOOL_EVENTS = Counter("chat_tool_events", "Tool call events in answer streams", ["event"])
+CHAT_CITATION_SECONDS = Histogram(
+    "chat_citation_resolution_seconds", "Time to map file citations to documents", buckets=FAST_BUCKETS,
+)
+CHAT_DB_SECONDS = Histogram(
+    "chat_db_phase_seconds", "Database phases around an answer stream", ["phase"], buckets=FAST_BUCKETS,
+)
+
+# OpenAI HTTP calls (core.openai_client), timed to response headers
+OPENAI_REQUESTS = Counter("openai_requests", "OpenAI API requests", ["endpoint", "status"])
+OPENAI_REQUEST_SECONDS = Histogram(
+    "openai_request_seconds", "OpenAI API time to response headers", ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+
+# Celery and ingestion
+CELERY_TASK_SECONDS = Histogram("celery_task_duration_seconds", "Celery task run time", ["task", "state"], buckets=TASK_BUCKETS)
+DOCUMENT_PROCESS_SECONDS = Histogram(
+    "document_process_seconds", "process_document run time", ["status"], buckets=TASK_BUCKETS,
+)
+DRIVE_SYNC_PHASE_SECONDS = Histogram(
+    "drive_sync_phase_seconds", "Drive sync phases (list, diff, per-file download/db/enqueue, removals)",
+    ["phase"], buckets=TASK_BUCKETS,
+)
+DRIVE_SYNC_FILES = Counter("drive_sync_files", "Drive files seen by sync, by outcome", ["result"])
+
+_ID_SEGMENT = re.compile(r"/(?=[A-Za-z0-9_-]*\d)[A-Za-z]+[-_][A-Za-z0-9_-]{8,}")
+
+
+def endpoint_label(path: str) -> str:
+    """Collapse object ids in an API path: /v1/vector_stores/vs_abc123.../files -> /v1/vector_stores/{id}/files."""
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block on histogram (with labels, if any)."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.monotonic() - started)
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in Prometheus text format, summed across processes when multi-process is on."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop a finished process's live-only samples (multi-process mode only)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,211 @@
+"""Record/replay transport for the OpenAI client.
+
+In "record" mode every OpenAI HTTP exchange goes to the API as usual and is
+also written to a cassette: the request body and, for the response, its
+status, a few headers and each SSE frame with its time offset from the
+request. In "replay" mode the same responses are served from the cassettes
+without a network, so runs are offline and deterministic. Recorded timings
+are kept, so latency can be simulated: timings() reads it from a recording,
+and OPENAI_CASSETTE_REALTIME replays at the recorded pace.
+
+Cassettes are JSON files in OPENAI_CASSETTE_DIR. Inside a `cassette(name)`
+block the exchanges are stored in order under that name and replayed in
+the same order; a replayed request whose body differs from the recording
+(changed prompt, history or settings) is served anyway and marked stale.
+Outside a block each exchange gets its own cassette named after a hash of
+the request.
+
+The transport sits below the client's event hooks, so metrics and tracing
+still see every call.
+
+Usage:
+    OPENAI_CASSETTE_MODE=record  # or replay; read by core.openai_client
+
+    with openai_cassettes.cassette("q1") as tape:
+        ...                      # OpenAI calls
+    tape["interactions"]         # [{"status": 200, "ttfb": 0.41, "frames": [[0.9, "event: ..."], ...], ...}]
+"""
+import contextvars
+import hashlib
+import json
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+MODES = ("record", "replay")
+# Response headers worth keeping; the rest (cookies, rate-limit counters) are noise
+KEPT_HEADERS = ("content-type", "x-request-id", "openai-processing-ms")
+
+_tape = contextvars.ContextVar("openai_cassette", default=None)
+
+
+class CassetteError(Exception):
+    """A replayed request has no recording."""
+
+
+@contextmanager
+def cassette(name: str):
+    """Record or replay the OpenAI calls in the block under one named cassette."""
+    tape = {"name": _safe_name(name), "interactions": []}
+    token = _tape.set(tape)
+    try:
+        yield tape
+    finally:
+        _tape.reset(token)
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name).strip("-") or "cassette"
+
+
+def _body_hash(body: bytes) -> str:
+    try:
+        # Key order must not matter
+        body = json.dumps(json.loads(body), sort_keys=True).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(body).hexdigest()
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, mode: str, directory, realtime: bool = False, wrapped: httpx.BaseTransport | None = None):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {MODES}, not {mode!r}")
+        self.mode = mode
+        self.directory = Path(directory)
+        self.realtime = realtime
+        self.wrapped = wrapped or (httpx.HTTPTransport() if mode == "record" else None)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        tape = _tape.get()
+        name = tape["name"] if tape else f"{request.url.path.strip('/').replace('/', '-')}-{_body_hash(body)[:16]}"
+        if self.mode == "replay":
+            return self._replay(request, body, name, tape)
+        return self._record(request, body, name, tape)
+
+    # ─── Record ─────────────────────────────────────────────────────────
+
+    def _record(self, request, body, name, tape):
+        # Uncompressed, so SSE frames can be split and stored as text
+        request.headers["Accept-Encoding"] = "identity"
+        started = time.monotonic()
+        response = self.wrapped.handle_request(request)
+        interaction = {
+            "request": {
+                "method": request.method,
+                "path": request.url.path,
+                "body_sha256": _body_hash(body),
+                "body": json.loads(body) if body else None,
+            },
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            "ttfb": round(time.monotonic() - started, 4),
+            "frames": [],
+        }
+
+        def finished():
+            if tape is None:
+                self._write(name, [interaction])
+                return
+            tape["interactions"].append(interaction)
+            self._write(name, tape["interactions"])
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, interaction["frames"], started, finished),
+            extensions=response.extensions,
+        )
+
+    def _write(self, name: str, interactions: list) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{name}.json").write_text(json.dumps({"interactions": interactions}, indent=1))
+
+    # ─── Replay ─────────────────────────────────────────────────────────
+
+    def _replay(self, request, body, name, tape):
+        path = self.directory / f"{name}.json"
+        try:
+            interactions = json.loads(path.read_text())["interactions"]
+        except FileNotFoundError:
+            raise CassetteError(f"No cassette {path} for {request.method} {request.url.path}; record it first")
+        # Named cassettes replay in order within a block; a request-hash cassette holds one exchange
+        position = len(tape["interactions"]) if tape is not None else 0
+        if position >= len(interactions):
+            raise CassetteError(f"Cassette {path} has only {len(interactions)} recorded call(s)")
+        interaction = dict(interactions[position])
+        interaction["stale"] = interaction["request"]["body_sha256"] != _body_hash(body)
+        if tape is not None:
+            tape["interactions"].append(interaction)
+        if self.realtime:
+            time.sleep(interaction["ttfb"])
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            stream=_ReplayStream(interaction["frames"], interaction["ttfb"], self.realtime),
+            request=request,
+        )
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes the response through while storing it as [offset, text] frames (SSE events, or the whole body)."""
+
+    def __init__(self, stream, frames: list, started: float, on_close):
+        self.stream = stream
+        self.frames = frames
+        self.started = started
+        self.on_close = on_close
+        self.buffer = b""
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.buffer += chunk
+            while b"\n\n" in self.buffer:
+                frame, self.buffer = self.buffer.split(b"\n\n", 1)
+                self._add(frame + b"\n\n")
+            yield chunk
+
+    def _add(self, data: bytes) -> None:
+        self.frames.append([round(time.monotonic() - self.started, 4), data.decode("utf-8", errors="replace")])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.buffer:
+            self._add(self.buffer)
+        try:
+            self.stream.close()
+        finally:
+            self.on_close()
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, frames: list, ttfb: float, realtime: bool):
+        self.frames = frames
+        self.ttfb = ttfb
+        self.realtime = realtime
+
+    def __iter__(self):
+        previous = self.ttfb
+        for offset, text in self.frames:
+            if self.realtime and offset > previous:
+                time.sleep(offset - previous)
+                previous = offset
+            yield text.encode("utf-8")
+
+
+def timings(interaction: dict) -> dict:
+    """Simulated latency of a recorded exchange: to the first text token and to the last byte, in ms."""
+    first_token = next((offset for offset, text in interaction["frames"] if "response.output_text.delta" in text),
+                       None)
+    last = interaction["frames"][-1][0] if interaction["frames"] else interaction["ttfb"]
+    return {
+        "ttft_ms": round(first_token * 1000) if first_token is not None else None,
+        "total_ms": round(last * 1000),
+    }
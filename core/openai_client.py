@@ -1,17 +1,76 @@
 """Shared OpenAI client singleton.
 
 Replaces scattered _client globals across services.
+Every HTTP call is counted and timed (to response headers) in core.metrics,
+carries the current request id as X-Client-Request-Id and, in a sampled
+trace, records a span with OpenAI's own x-request-id.
+With OPENAI_CASSETTE_MODE set, calls are recorded to or replayed from
+cassettes (core.openai_cassettes).
 Usage: from core.openai_client import get_openai_client
 """
+import time
+
 from django.conf import settings
-from openai import OpenAI
+from openai import DefaultHttpxClient, OpenAI
+
+from core import tracing
+from core.openai_cassettes import CassetteTransport
+from core.metrics import OPENAI_REQUEST_SECONDS, OPENAI_REQUESTS, endpoint_label
 
 _client = None
 
 
+def _on_request(request):
+    request.extensions["metrics_started"] = time.monotonic()
+    request.extensions["trace_started_at"] = time.time()
+    request_id = tracing.request_id()
+    if request_id:
+        request.headers["X-Client-Request-Id"] = request_id
+
+
+def _on_response(response):
+    request = response.request
+    endpoint = endpoint_label(request.url.path)
+    started = request.extensions.get("metrics_started")
+    if started is not None:
+        OPENAI_REQUEST_SECONDS.labels(endpoint).observe(time.monotonic() - started)
+        tracing.record_span(
+            f"openai {request.method} {endpoint}",
+            request.extensions["trace_started_at"],
+            time.monotonic() - started,
+            status=response.status_code,
+            openai_request_id=response.headers.get("x-request-id", ""),
+        )
+    OPENAI_REQUESTS.labels(endpoint, str(response.status_code)).inc()
+
+
 def get_openai_client() -> OpenAI:
     """Return a shared OpenAI client instance."""
     global _client
     if _client is None:
-        _client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        transport = None
+        if settings.OPENAI_CASSETTE_MODE:
+            transport = CassetteTransport(
+                settings.OPENAI_CASSETTE_MODE, settings.OPENAI_CASSETTE_DIR, realtime=settings.OPENAI_CASSETTE_REALTIME,
+            )
+        _client = OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            # Empty = api.openai.com; `manage.py fake_openai` serves a local stand-in for load tests
+            base_url=settings.OPENAI_BASE_URL or None,
+            # A missing cassette is not worth retrying
+            max_retries=0 if settings.OPENAI_CASSETTE_MODE == "replay" else 2,
+            # The SDK's default httpx settings (timeouts, connection limits), plus metrics hooks
+            http_client=DefaultHttpxClient(
+                transport=transport,
+                event_hooks={"request": [_on_request], "response": [_on_response]},
+            ),
+        )
     return _client
+
+
+def reset_openai_client() -> None:
+    """Drop the shared client, so the next get_openai_client() applies changed settings."""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = None
@@ -0,0 +1,65 @@
+"""Query plan checks for the view regression suite (PostgreSQL only).
+
+Runs EXPLAIN on the queries a view issued and reports the tables read with
+a full scan. On a small test database the planner prefers sequential scans
+everywhere, so the tests pass force_index=True, which disables them
+(SET LOCAL enable_seqscan = off). The planner then walks some index of the
+table instead, so an index scan that filters rows without an index condition
+counts as a full scan too. `manage.py perf_views` runs the same check with
+the default planner against the seeded data.
+
+Usage:
+    with CaptureQueriesContext(connection) as captured:
+        client.get(url)
+    seq_scans(captured.captured_queries, force_index=True)  # -> [("adminpanel_usagelog", sql), ...]
+"""
+import json
+import re
+
+from django.db import connection, transaction
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def explain(sql: str, force_index: bool = False) -> dict:
+    """The JSON plan of an already-interpolated SELECT."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        if force_index:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        try:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+        finally:
+            if force_index:
+                # Inside a test's transaction SET LOCAL would otherwise outlive this savepoint
+                cursor.execute("SET LOCAL enable_seqscan = on")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def _is_full_scan(node: dict) -> bool:
+    if node["Node Type"] == "Seq Scan":
+        return True
+    # With seq scans disabled, a filter the index could not serve shows up as an unconditioned index scan
+    return node["Node Type"] in ("Index Scan", "Index Only Scan") and "Filter" in node and "Index Cond" not in node
+
+
+def seq_scans(queries, allow=(), force_index: bool = False) -> list[tuple[str, str]]:
+    """(table, sql) for every full table scan in the given captured queries, except tables in allow."""
+    found = []
+    for query in queries:
+        sql = query["sql"]
+        if not _EXPLAINABLE.match(sql):
+            continue
+        for node in _walk(explain(sql, force_index=force_index)):
+            table = node.get("Relation Name")
+            if table and table not in allow and _is_full_scan(node):
+                found.append((table, sql))
+    return found
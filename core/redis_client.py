@@ -0,0 +1,18 @@
+"""Shared Redis client singleton.
+
+Used for pub/sub notifications and other coordination that goes beyond the
+Django cache API. Cache reads/writes should keep using django.core.cache.
+Usage: from core.redis_client import get_redis_client
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis_client() -> redis.Redis:
+    """Return a shared Redis client instance."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
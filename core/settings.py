@@ -39,7 +39,7 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.CachedAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
@@ -75,6 +75,16 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD", "legal_pass"),
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        # psycopg3 connection pool (per process). Pooling requires CONN_MAX_AGE = 0;
+        # connections are returned to the pool when a request or task section ends.
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "20")),
+                "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+            },
+        } if os.getenv("DB_POOL", "True").lower() in ("true", "1", "yes") else {},
     }
 }
 
@@ -90,6 +100,9 @@ AUTH_USER_MODEL = "accounts.CustomUser"
 
 # Allauth
 SITE_ID = 1
+# Sessions are read from the cache (Redis) and written through to the DB
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
     "allauth.account.auth_backends.AuthenticationBackend",
@@ -131,6 +144,15 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache — Redis (sidebar fragments, per-user cache versions)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/2")
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    }
+}
+
 # Celery
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
@@ -138,22 +160,99 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# Queue topology (see core/celery.py): interactive work never waits behind bulk ingestion
+CELERY_TASK_DEFAULT_QUEUE = "background"
+CELERY_TASK_ROUTES = {
+    "chat.tasks.generate_response": {"queue": "interactive"},
+    "chat.tasks.generate_conversation_title": {"queue": "interactive"},
+    "chat.tasks.flush_title_batch": {"queue": "interactive"},
+    "chat.tasks.summarize_conversation": {"queue": "background"},
+    "chat.tasks.train_query_router": {"queue": "background"},
+    "documents.tasks.process_document": {"queue": "ingestion"},
+    "documents.tasks.sync_drive_folder": {"queue": "ingestion"},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": [0, 3, 6, 9],
+    "sep": ":",
+}
+CELERY_TASK_DEFAULT_PRIORITY = 3
+# Workers reserve one task at a time, so a long upload never holds back queued tasks
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER", "1"))
+# Per-worker rate limits
+CELERY_TASK_ANNOTATIONS = {
+    "documents.tasks.process_document": {"rate_limit": os.getenv("CELERY_INGEST_RATE_LIMIT", "60/m")},
+    "chat.tasks.summarize_conversation": {"rate_limit": os.getenv("CELERY_SUMMARY_RATE_LIMIT", "60/m")},
+}
+
 # OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-OPENAI_CHAT_MODEL = "gpt-4o-mini"
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+# "record" or "replay" OpenAI calls to/from cassettes (core/openai_cassettes.py); empty = live API
+OPENAI_CASSETTE_MODE = os.getenv("OPENAI_CASSETTE_MODE", "")
+OPENAI_CASSETTE_DIR = os.getenv("OPENAI_CASSETTE_DIR", str(BASE_DIR / "cassettes"))
+# Replay at the recorded pace instead of as fast as possible
+OPENAI_CASSETTE_REALTIME = os.getenv("OPENAI_CASSETTE_REALTIME", "False").lower() in ("true", "1", "yes")
+OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+# Model routing (chat/services/model_router.py): candidates per task, in preference order.
+# An empty list (e.g. OPENAI_ANSWER_MODELS=",") falls back to OPENAI_CHAT_MODEL.
+OPENAI_ANSWER_MODELS = [
+    m.strip() for m in os.getenv("OPENAI_ANSWER_MODELS", OPENAI_CHAT_MODEL).split(",") if m.strip()
+] or [OPENAI_CHAT_MODEL]
+OPENAI_BACKGROUND_MODELS = [
+    m.strip() for m in os.getenv("OPENAI_BACKGROUND_MODELS", OPENAI_CHAT_MODEL).split(",") if m.strip()
+] or [OPENAI_CHAT_MODEL]
+# A model is skipped while its rolling p95 time-to-first-token or error rate is above these
+OPENAI_ROUTER_TTFT_P95_MS = int(os.getenv("OPENAI_ROUTER_TTFT_P95_MS", "5000"))
+OPENAI_ROUTER_MAX_ERROR_RATE = float(os.getenv("OPENAI_ROUTER_MAX_ERROR_RATE", "0.25"))
+# Admission control: concurrent upstream answer streams (0 = unlimited); excess requests queue FIFO
+CHAT_MAX_CONCURRENT_STREAMS = int(os.getenv("CHAT_MAX_CONCURRENT_STREAMS", "0"))
+CHAT_MAX_STREAMS_PER_USER = int(os.getenv("CHAT_MAX_STREAMS_PER_USER", "2"))
+CHAT_ADMISSION_TIMEOUT = int(os.getenv("CHAT_ADMISSION_TIMEOUT", "120"))
+# Hedging: send a duplicate answer request when the first token is slow, capped to a share of traffic
+CHAT_HEDGE_ENABLED = os.getenv("CHAT_HEDGE_ENABLED", "False").lower() in ("true", "1", "yes")
+CHAT_HEDGE_AFTER_MS = int(os.getenv("CHAT_HEDGE_AFTER_MS", "3000"))
+CHAT_HEDGE_MAX_PERCENT = float(os.getenv("CHAT_HEDGE_MAX_PERCENT", "5"))
 
 # OpenAI Responses API + Vector Store (file_search)
 OPENAI_VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID", "")
+# Prompt caching: empty = derive a stable key from the model + system prompt
+OPENAI_PROMPT_CACHE_KEY = os.getenv("OPENAI_PROMPT_CACHE_KEY", "")
+# Chain turns with previous_response_id instead of resending the history
+CHAT_STATEFUL_RESPONSES = os.getenv("CHAT_STATEFUL_RESPONSES", "False").lower() in ("true", "1", "yes")
+
+# Chat streaming — start the upstream call from send_message and buffer events in Redis
+CHAT_SPECULATIVE_START = os.getenv("CHAT_SPECULATIVE_START", "False").lower() in ("true", "1", "yes")
+CHAT_SPECULATIVE_ATTACH_TIMEOUT = int(os.getenv("CHAT_SPECULATIVE_ATTACH_TIMEOUT", "20"))
+# Coalesce streamed tokens into one SSE event per CHAT_SSE_FLUSH_MS or CHAT_SSE_FLUSH_BYTES
+CHAT_SSE_FLUSH_MS = int(os.getenv("CHAT_SSE_FLUSH_MS", "30"))
+CHAT_SSE_FLUSH_BYTES = int(os.getenv("CHAT_SSE_FLUSH_BYTES", "512"))
+# Optional WebSocket transport (ws/chat/) multiplexing all conversations over one socket
+CHAT_WEBSOCKET_ENABLED = os.getenv("CHAT_WEBSOCKET_ENABLED", "False").lower() in ("true", "1", "yes")
+
+# Request tracing (core/tracing.py): share of requests whose spans are kept for the admin Traces page
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+
+# Metrics (/metrics): staff sessions, or a scraper sending "Authorization: Bearer <METRICS_TOKEN>".
+# Multi-process collection across Daphne and Celery is enabled by the PROMETHEUS_MULTIPROC_DIR env var.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # Google Drive (Service Account)
 GOOGLE_SERVICE_ACCOUNT_FILE = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE", "")
 GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID", "")
 GOOGLE_DRIVE_SYNC_INTERVAL_MINUTES = int(os.getenv("GOOGLE_DRIVE_SYNC_INTERVAL_MINUTES", "60"))
+# Lease on the Drive sync lock (core/locks.py), renewed between files; a dead worker's lock frees itself after it
+DRIVE_SYNC_LOCK_TTL = int(os.getenv("DRIVE_SYNC_LOCK_TTL", "600"))
 
 # Celery Beat schedule
 from celery.schedules import crontab
 
-CELERY_BEAT_SCHEDULE = {}
+CELERY_BEAT_SCHEDULE = {
+    "train-query-router": {
+        "task": "chat.tasks.train_query_router",
+        "schedule": crontab(hour=3, minute=30),
+    },
+}
 if GOOGLE_DRIVE_FOLDER_ID:
     CELERY_BEAT_SCHEDULE["sync-google-drive"] = {
         "task": "documents.tasks.sync_drive_folder",
@@ -0,0 +1,236 @@
+"""Lightweight request tracing: one request id from send_message to OpenAI.
+
+send_message starts a trace. Its id (the request id) is remembered for the
+user message, so the SSE request that follows joins the same trace. The id
+then travels with the work:
+
+* Celery: a "trace" header on every task published while a trace is active
+  (core/celery.py). The worker restores it and records a span for the
+  queue wait and one for the task.
+* OpenAI: the X-Client-Request-Id header on every API call
+  (core/openai_client.py), so a trace can be matched with OpenAI's logs.
+
+Only a sample of traces (TRACE_SAMPLE_RATE) record spans. Spans are kept in
+Redis for TRACE_TTL seconds, at most TRACE_MAX_KEPT traces, and shown as a
+waterfall on the admin Traces page. Tracing never fails the request: Redis
+errors are logged and dropped.
+
+Usage:
+    with tracing.activated(tracing.start_trace()):
+        with tracing.span("db.history", messages=10):
+            ...
+        tracing.record_span("file_search", started_at, seconds)
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from core.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+TRACE_TTL = 60 * 60 * 24 * 3
+TRACE_MAX_KEPT = 500
+INDEX_KEY = "trace:recent"
+MESSAGE_TRACE_TTL = 60 * 60
+
+_current = contextvars.ContextVar("trace", default=None)
+_PROCESS = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _spans_key(trace_id: str) -> str:
+    return f"trace:{trace_id}"
+
+
+def start_trace() -> dict:
+    """A new trace context; sampled with probability TRACE_SAMPLE_RATE."""
+    sampled = random.random() < settings.TRACE_SAMPLE_RATE
+    trace = {"id": uuid.uuid4().hex, "sampled": sampled, "span": ""}
+    if sampled:
+        try:
+            client = get_redis_client()
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(INDEX_KEY, {trace["id"]: time.time()})
+            pipe.zremrangebyrank(INDEX_KEY, 0, -TRACE_MAX_KEPT - 1)
+            pipe.execute()
+        except Exception:
+            logger.warning("Could not index trace", exc_info=True)
+    return trace
+
+
+def current() -> dict | None:
+    return _current.get()
+
+
+def request_id() -> str:
+    trace = _current.get()
+    return trace["id"] if trace else ""
+
+
+@contextmanager
+def activated(trace: dict | None):
+    """Make trace the current one for the block (a no-op for None)."""
+    if trace is None:
+        yield None
+        return
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def serialize(trace: dict) -> str:
+    return f"{trace['id']}:{int(trace['sampled'])}:{trace['span']}"
+
+
+def parse(value) -> dict | None:
+    """Inverse of serialize(); None for a missing or malformed value."""
+    if isinstance(value, bytes):
+        value = value.decode()
+    try:
+        trace_id, sampled, span_id = value.split(":")
+    except (AttributeError, ValueError):
+        return None
+    return {"id": trace_id, "sampled": sampled == "1", "span": span_id}
+
+
+def remember_for_message(user_message_id, trace: dict) -> None:
+    """Let later requests for this user message (the SSE relay) join its trace."""
+    try:
+        get_redis_client().set(f"trace:msg:{user_message_id}", serialize(trace), ex=MESSAGE_TRACE_TTL)
+    except Exception:
+        logger.warning("Could not store trace for message", exc_info=True)
+
+
+def trace_for_message(user_message_id) -> dict | None:
+    try:
+        return parse(get_redis_client().get(f"trace:msg:{user_message_id}"))
+    except Exception:
+        logger.warning("Could not load trace for message", exc_info=True)
+        return None
+
+
+def _write(trace: dict, span: dict) -> None:
+    key = _spans_key(trace["id"])
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.rpush(key, json.dumps(span, default=str))
+        pipe.expire(key, TRACE_TTL)
+        pipe.execute()
+    except Exception:
+        logger.warning("Could not record trace span", exc_info=True)
+
+
+def record_span(name: str, started_at: float, seconds: float, **attrs) -> None:
+    """Record a finished span with explicit timing (started_at is epoch seconds)."""
+    trace = _current.get()
+    if not trace or not trace["sampled"]:
+        return
+    _write(trace, {
+        "id": uuid.uuid4().hex[:16],
+        "parent": trace["span"],
+        "name": name,
+        "start": started_at,
+        "ms": round(seconds * 1000, 2),
+        "process": _PROCESS,
+        "attrs": attrs,
+    })
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a span; spans recorded inside it are its children.
+
+    Yields the attrs dict, so the block can add attributes as it learns them.
+    Do not hold it open across a generator's yield.
+    """
+    trace = _current.get()
+    if not trace or not trace["sampled"]:
+        yield attrs
+        return
+    span_id = uuid.uuid4().hex[:16]
+    token = _current.set({**trace, "span": span_id})
+    started_at = time.time()
+    started = time.monotonic()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        _write(trace, {
+            "id": span_id,
+            "parent": trace["span"],
+            "name": name,
+            "start": started_at,
+            "ms": round((time.monotonic() - started) * 1000, 2),
+            "process": _PROCESS,
+            "attrs": attrs,
+        })
+
+
+def get_spans(trace_id: str) -> list[dict]:
+    """All recorded spans of a trace, in start order."""
+    raw = get_redis_client().lrange(_spans_key(trace_id), 0, -1)
+    return sorted((json.loads(item) for item in raw), key=lambda s: s["start"])
+
+
+def waterfall(trace_id: str) -> dict:
+    """Spans laid out for display: offset and width as percentages of the whole trace, nesting depth."""
+    spans = get_spans(trace_id)
+    if not spans:
+        return {"spans": [], "total_ms": 0, "started_at": None}
+    t0 = spans[0]["start"]
+    total_ms = max(max((s["start"] - t0) * 1000 + s["ms"] for s in spans), 0.01)
+    by_id = {s["id"]: s for s in spans}
+
+    def depth(span):
+        level = 0
+        while span["parent"] in by_id and level < 20:
+            span = by_id[span["parent"]]
+            level += 1
+        return level
+
+    for s in spans:
+        s["offset_ms"] = round((s["start"] - t0) * 1000, 1)
+        s["left"] = round(s["offset_ms"] / total_ms * 100, 2)
+        s["width"] = max(round(s["ms"] / total_ms * 100, 2), 0.3)
+        s["depth"] = depth(s)
+    return {"spans": spans, "total_ms": round(total_ms, 1), "started_at": t0}
+
+
+def recent_traces(limit: int = 50) -> list[dict]:
+    """Newest sampled traces with their root span, total duration and span count."""
+    client = get_redis_client()
+    ids = [trace_id.decode() for trace_id in client.zrevrange(INDEX_KEY, 0, limit - 1)]
+    pipe = client.pipeline(transaction=False)
+    for trace_id in ids:
+        pipe.lrange(_spans_key(trace_id), 0, -1)
+    traces = []
+    for trace_id, raw in zip(ids, pipe.execute()):
+        spans = [json.loads(item) for item in raw]
+        if not spans:
+            continue
+        t0 = min(s["start"] for s in spans)
+        root = next((s for s in spans if not s["parent"]), min(spans, key=lambda s: s["start"]))
+        ttft = next((s["attrs"]["ttft_ms"] for s in spans if "ttft_ms" in s["attrs"]), None)
+        traces.append({
+            "id": trace_id,
+            "started_at": t0,
+            "root": root["name"],
+            "attrs": root["attrs"],
+            "total_ms": round(max((s["start"] - t0) * 1000 + s["ms"] for s in spans), 1),
+            "ttft_ms": ttft,
+            "span_count": len(spans),
+        })
+    return traces
@@ -3,12 +3,15 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
 
+from core.views import metrics
+
 urlpatterns = [
     path("accounts/", include("allauth.urls")),
     path("accounts/", include("accounts.urls")),
     path("chat/", include("chat.urls")),
     path("documents/", include("documents.urls")),
     path("panel/", include("adminpanel.urls")),
+    path("metrics", metrics, name="metrics"),
     path("", lambda r: redirect("chat:home")),
 ]
 
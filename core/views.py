@@ -0,0 +1,19 @@
+"""Project-level views."""
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from core.metrics import render
+
+
+def metrics(request):
+    """Prometheus scrape endpoint: staff users, or a bearer token matching METRICS_TOKEN."""
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        auth.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()
+    )
+    if not token_ok and not request.user.is_staff:
+        raise Http404
+    body, content_type = render()
+    return HttpResponse(body, content_type=content_type)
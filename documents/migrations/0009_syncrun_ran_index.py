@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_syncrun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='syncrun',
+            index=models.Index(condition=models.Q(('status', 'skipped'), _negated=True), fields=['-started_at'], name='documents_syncrun_ran_idx'),
+        ),
+    ]
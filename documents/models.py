@@ -44,6 +44,9 @@ class Document(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at"], name="documents_doc_recent_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -63,6 +66,70 @@ class DriveFile(models.Model):
 
     class Meta:
         ordering = ["-last_synced"]
+        indexes = [
+            models.Index(fields=["-last_synced"], name="documents_drive_synced_idx"),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class SyncRun(models.Model):
+    """One Drive sync attempt: outcome, per-phase timings and counters."""
+
+    TRIGGER_CHOICES = [
+        ("beat", "Scheduled"),
+        ("manual", "Manual"),
+    ]
+    STATUS_CHOICES = [
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+        ("skipped", "Skipped"),  # another run held the lock
+    ]
+    PHASES = ["list", "diff", "download", "db", "enqueue", "remove"]
+
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES, default="beat")
+    triggered_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="running")
+    error = models.TextField(blank=True, default="")
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Seconds spent per phase, summed over all files; db includes writing files to media storage
+    list_seconds = models.FloatField(default=0)
+    diff_seconds = models.FloatField(default=0)
+    download_seconds = models.FloatField(default=0)
+    db_seconds = models.FloatField(default=0)
+    enqueue_seconds = models.FloatField(default=0)
+    remove_seconds = models.FloatField(default=0)
+    files_seen = models.IntegerField(default=0)
+    new_count = models.IntegerField(default=0)
+    updated_count = models.IntegerField(default=0)
+    unchanged_count = models.IntegerField(default=0)
+    skipped_count = models.IntegerField(default=0)  # blocked file names
+    removed_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["-started_at"], name="documents_syncrun_recent_idx"),
+            # The admin's "last run" (skipped runs excluded) reads this in order, without a filter
+            models.Index(fields=["-started_at"], condition=~models.Q(status="skipped"), name="documents_syncrun_ran_idx"),
+        ]
+
+    def __str__(self):
+        return f"Drive sync {self.started_at:%Y-%m-%d %H:%M} ({self.status})"
+
+    @property
+    def duration(self):
+        """Seconds from start to finish; None while running."""
+        if not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def phase_timings(self) -> list[tuple[str, float]]:
+        return [(phase, getattr(self, f"{phase}_seconds")) for phase in self.PHASES]
@@ -2,14 +2,24 @@
 import logging
 import os
 import tempfile
-from datetime import datetime
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.core.files import File
+from django.db import transaction
 from django.utils import timezone
 
+from core.celery import PRIORITY_BULK
+from core.locks import LeaseLock
+from core.metrics import DRIVE_SYNC_FILES, DRIVE_SYNC_PHASE_SECONDS, timed
+
 logger = logging.getLogger(__name__)
 
+SYNC_LOCK_NAME = "drive-sync"
+SYNC_RUN_RETENTION_DAYS = 90
+
 # Files to never sync from Drive (case-insensitive, matched against filename without extension)
 BLOCKED_FILES = {
     "systemprompt_customgpt_full",
@@ -135,92 +145,168 @@ def download_drive_file(service, file_id, name, mime_type):
     return tmp_path, name
 
 
-def sync_folder():
-    """Main sync function: pull files from Drive, create/update/remove Documents."""
-    from documents.models import Document, DriveFile
-    from documents.tasks import process_document
-    from documents.services.vector_store import remove_file_from_vector_store
+@contextmanager
+def _phase(run, name):
+    """Time a phase into both the Prometheus histogram and the run's <name>_seconds total."""
+    started = time.monotonic()
+    try:
+        with timed(DRIVE_SYNC_PHASE_SECONDS, phase=name):
+            yield
+    finally:
+        field = f"{name}_seconds"
+        setattr(run, field, getattr(run, field) + time.monotonic() - started)
+
+
+def sync_folder(trigger: str = "beat", triggered_by_id=None):
+    """Main sync function: pull files from Drive, create/update/remove Documents.
+
+    Only one sync runs at a time: the run holds a lease lock in Redis, and a
+    sync started while another one is running is recorded as skipped.
+    Every attempt is recorded as a SyncRun.
+    """
+    from documents.models import SyncRun
 
     folder_id = settings.GOOGLE_DRIVE_FOLDER_ID
     if not folder_id:
         logger.warning("GOOGLE_DRIVE_FOLDER_ID not configured, skipping sync.")
         return {"new": 0, "updated": 0, "removed": 0, "error": "No folder ID configured"}
 
-    service = get_drive_service()
-    drive_files = list_drive_files(service, folder_id)
-    logger.info(f"Found {len(drive_files)} files in Drive folder {folder_id}")
-
-    # Track IDs we've seen for removal detection
-    seen_drive_ids = set()
-    new_count = 0
-    updated_count = 0
-    removed_count = 0
-
-    for df in drive_files:
-        file_id = df["id"]
-        seen_drive_ids.add(file_id)
-        name = df["name"]
-        mime_type = df["mimeType"]
-
-        # Skip blocked files
-        name_without_ext = os.path.splitext(name)[0].strip().lower()
-        if name_without_ext in BLOCKED_FILES:
-            logger.info(f"Skipping blocked file: {name}")
-            continue
-        md5 = df.get("md5Checksum", "")
-        modified_str = df.get("modifiedTime", "")
-
-        # Parse Drive's ISO timestamp
-        if modified_str:
-            modified_time = datetime.fromisoformat(modified_str.replace("Z", "+00:00"))
-        else:
-            modified_time = timezone.now()
+    lock = LeaseLock(SYNC_LOCK_NAME, ttl=settings.DRIVE_SYNC_LOCK_TTL)
+    if not lock.acquire():
+        run = SyncRun.objects.create(
+            trigger=trigger, triggered_by_id=triggered_by_id, status="skipped", finished_at=timezone.now(),
+        )
+        logger.info("Drive sync already running, skipping this one.")
+        return {"new": 0, "updated": 0, "removed": 0, "skipped": True, "run_id": run.pk}
 
+    try:
+        # Only the lock holder gets here, so a run still marked running was interrupted
+        SyncRun.objects.filter(status="running").update(
+            status="failed", error="Interrupted (worker lost)", finished_at=timezone.now(),
+        )
+        run = SyncRun.objects.create(trigger=trigger, triggered_by_id=triggered_by_id)
         try:
-            existing = DriveFile.objects.select_related("document").get(drive_file_id=file_id)
+            _sync(run, lock, folder_id)
+            run.status = "succeeded"
+        except Exception as e:
+            run.status = "failed"
+            run.error = f"{e.__class__.__name__}: {e}"
+            raise
+        finally:
+            run.finished_at = timezone.now()
+            run.save()
+            SyncRun.objects.filter(started_at__lt=timezone.now() - timedelta(days=SYNC_RUN_RETENTION_DAYS)).delete()
+    finally:
+        lock.release()
+
+    result = {"new": run.new_count, "updated": run.updated_count, "removed": run.removed_count, "run_id": run.pk}
+    logger.info(f"Drive sync complete: {result}")
+    return result
 
-            # Check if file has changed (by md5 or modified time)
-            changed = False
-            if md5 and existing.md5_checksum and md5 != existing.md5_checksum:
-                changed = True
-            elif modified_time > existing.modified_time:
-                changed = True
 
-            if not changed:
-                logger.debug(f"Skipping unchanged file: {name}")
+def _sync(run, lock, folder_id):
+    from documents.models import DriveFile
+    from documents.services.vector_store import remove_file_from_vector_store
+
+    service = get_drive_service()
+    with _phase(run, "list"):
+        drive_files = list_drive_files(service, folder_id)
+    run.files_seen = len(drive_files)
+    logger.info(f"Found {len(drive_files)} files in Drive folder {folder_id}")
+
+    # Compare with what we have in one query instead of one per file
+    with _phase(run, "diff"):
+        existing = {record.drive_file_id: record for record in DriveFile.objects.select_related("document")}
+        seen_drive_ids = set()
+        to_fetch = []
+        for df in drive_files:
+            seen_drive_ids.add(df["id"])
+            name = df["name"]
+
+            # Skip blocked files
+            if os.path.splitext(name)[0].strip().lower() in BLOCKED_FILES:
+                logger.info(f"Skipping blocked file: {name}")
+                run.skipped_count += 1
+                DRIVE_SYNC_FILES.labels("skipped").inc()
                 continue
 
-            # File changed — re-download and re-process
-            logger.info(f"Updating changed file: {name}")
-            tmp_path, final_name = download_drive_file(service, file_id, name, mime_type)
-            try:
-                doc = existing.document
+            md5 = df.get("md5Checksum", "")
+            modified_str = df.get("modifiedTime", "")
+            # Parse Drive's ISO timestamp
+            if modified_str:
+                modified_time = datetime.fromisoformat(modified_str.replace("Z", "+00:00"))
+            else:
+                modified_time = timezone.now()
+
+            record = existing.get(df["id"])
+            if record is not None:
+                # Changed by md5 or modified time?
+                changed = bool(md5 and record.md5_checksum and md5 != record.md5_checksum)
+                if not changed and modified_time <= record.modified_time:
+                    logger.debug(f"Skipping unchanged file: {name}")
+                    run.unchanged_count += 1
+                    DRIVE_SYNC_FILES.labels("unchanged").inc()
+                    continue
+            to_fetch.append((df, record, md5, modified_time))
+        stale = [record for drive_id, record in existing.items() if drive_id not in seen_drive_ids]
+
+    for df, record, md5, modified_time in to_fetch:
+        lock.renew()
+        try:
+            _fetch(service, run, df, record, md5, modified_time)
+        except Exception:
+            logger.exception(f"Error syncing file {df['name']} ({df['id']})")
+            run.error_count += 1
+            DRIVE_SYNC_FILES.labels("error").inc()
+
+    # Removed files: DriveFile records whose IDs are no longer in Drive
+    with _phase(run, "remove"):
+        for df_record in stale:
+            lock.renew()
+            logger.info(f"File removed from Drive: {df_record.name}")
+            if df_record.document:
+                # Remove from OpenAI Vector Store
+                if df_record.document.openai_file_id:
+                    remove_file_from_vector_store(df_record.document.openai_file_id)
+                df_record.document.status = "failed"
+                df_record.document.save(update_fields=["status"])
+            df_record.delete()
+            run.removed_count += 1
+    DRIVE_SYNC_FILES.labels("removed").inc(run.removed_count)
+
+
+def _fetch(service, run, df, record, md5, modified_time):
+    """Download a new or changed file, store it and queue it for processing."""
+    from documents.models import Document, DriveFile
+    from documents.tasks import process_document
+    from documents.services.vector_store import remove_file_from_vector_store
+
+    file_id, name, mime_type = df["id"], df["name"], df["mimeType"]
+    logger.info(f"{'Updating changed' if record else 'New'} file from Drive: {name}")
+    with _phase(run, "download"):
+        tmp_path, final_name = download_drive_file(service, file_id, name, mime_type)
+    try:
+        run.bytes_downloaded += os.path.getsize(tmp_path)
+        if record is not None:
+            doc = record.document
+            if doc and doc.openai_file_id:
+                # Remove old file from OpenAI Vector Store
+                with _phase(run, "remove"):
+                    remove_file_from_vector_store(doc.openai_file_id)
+                doc.openai_file_id = ""
+            with _phase(run, "db"), transaction.atomic():
                 if doc:
-                    # Remove old file from OpenAI Vector Store
-                    if doc.openai_file_id:
-                        remove_file_from_vector_store(doc.openai_file_id)
-                        doc.openai_file_id = ""
                     doc.file.delete(save=False)
                     with open(tmp_path, "rb") as f:
                         doc.file.save(final_name, File(f), save=False)
                     doc.status = "pending"
                     doc.save(update_fields=["file", "status", "openai_file_id"])
-                    process_document.delay(str(doc.id))
-            finally:
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
-
-            existing.md5_checksum = md5
-            existing.modified_time = modified_time
-            existing.name = name
-            existing.save(update_fields=["md5_checksum", "modified_time", "name", "last_synced"])
-            updated_count += 1
-
-        except DriveFile.DoesNotExist:
-            # New file — download and create Document
-            logger.info(f"New file from Drive: {name}")
-            tmp_path, final_name = download_drive_file(service, file_id, name, mime_type)
-            try:
+                record.md5_checksum = md5
+                record.modified_time = modified_time
+                record.name = name
+                record.save(update_fields=["md5_checksum", "modified_time", "name", "last_synced"])
+        else:
+            with _phase(run, "db"), transaction.atomic():
                 doc = Document(
                     title=os.path.splitext(final_name)[0],
                     authority_level="statute",
@@ -231,7 +317,6 @@ def sync_folder():
                 with open(tmp_path, "rb") as f:
                     doc.file.save(final_name, File(f), save=False)
                 doc.save()
-
                 DriveFile.objects.create(
                     drive_file_id=file_id,
                     name=name,
@@ -240,28 +325,16 @@ def sync_folder():
                     modified_time=modified_time,
                     document=doc,
                 )
-                process_document.delay(str(doc.id))
-                new_count += 1
-            finally:
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
-
-        except Exception:
-            logger.exception(f"Error syncing file {name} ({file_id})")
-
-    # Detect removed files: DriveFile records whose IDs are no longer in Drive
-    stale = DriveFile.objects.exclude(drive_file_id__in=seen_drive_ids)
-    for df_record in stale:
-        logger.info(f"File removed from Drive: {df_record.name}")
-        if df_record.document:
-            # Remove from OpenAI Vector Store
-            if df_record.document.openai_file_id:
-                remove_file_from_vector_store(df_record.document.openai_file_id)
-            df_record.document.status = "failed"
-            df_record.document.save(update_fields=["status"])
-        df_record.delete()
-        removed_count += 1
-
-    result = {"new": new_count, "updated": updated_count, "removed": removed_count}
-    logger.info(f"Drive sync complete: {result}")
-    return result
+        if doc:
+            with _phase(run, "enqueue"):
+                process_document.apply_async((str(doc.id),), priority=PRIORITY_BULK)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    if record is not None:
+        run.updated_count += 1
+        DRIVE_SYNC_FILES.labels("updated").inc()
+    else:
+        run.new_count += 1
+        DRIVE_SYNC_FILES.labels("new").inc()
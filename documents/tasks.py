@@ -4,17 +4,24 @@ Uses OpenAI Vector Store (Responses API) for storage and retrieval.
 Documents are uploaded as raw files — OpenAI handles chunking, embedding, and search.
 """
 import logging
+import time
+
 from celery import shared_task
 
+from core.celery import PRIORITY_BULK
+from core.metrics import DOCUMENT_PROCESS_SECONDS
+
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
+# acks_late: a worker lost mid-upload hands the document to another worker
+@shared_task(bind=True, max_retries=3, acks_late=True, reject_on_worker_lost=True)
 def process_document(self, document_id: str):
     """Upload document to OpenAI Vector Store."""
     from documents.models import Document
     from documents.services.vector_store import upload_file_to_vector_store
 
+    started = time.monotonic()
     try:
         doc = Document.objects.get(id=document_id)
         doc.status = "processing"
@@ -35,6 +42,7 @@ def process_document(self, document_id: str):
         doc.status = "completed"
         doc.save(update_fields=["openai_file_id", "status"])
         logger.info(f"Document '{doc.title}' uploaded to OpenAI: {openai_file_id}")
+        DOCUMENT_PROCESS_SECONDS.labels("completed").observe(time.monotonic() - started)
 
     except Exception as exc:
         logger.exception(f"Error processing document {document_id}")
@@ -44,14 +52,15 @@ def process_document(self, document_id: str):
             doc.save(update_fields=["status"])
         except Document.DoesNotExist:
             pass
+        DOCUMENT_PROCESS_SECONDS.labels("failed").observe(time.monotonic() - started)
         raise self.retry(exc=exc, countdown=60)
 
 
-@shared_task
-def sync_drive_folder():
-    """Periodic task: sync documents from Google Drive folder."""
+@shared_task(priority=PRIORITY_BULK)
+def sync_drive_folder(trigger: str = "beat", user_id: str | None = None):
+    """Periodic task: sync documents from Google Drive folder (also queued by the admin "Sync Now")."""
     from documents.services.drive_sync import sync_folder
 
-    result = sync_folder()
+    result = sync_folder(trigger=trigger, triggered_by_id=user_id)
     logger.info(f"Drive sync complete: {result}")
     return result
@@ -1,3 +1,123 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from core.locks import LeaseLock, LockLost
+from documents.models import Document, DriveFile, SyncRun
+from documents.services.drive_sync import SYNC_LOCK_NAME, sync_folder
+
+MODIFIED = datetime(2026, 1, 5, tzinfo=dt_timezone.utc)
+
+
+def _drive_file(file_id, name, md5):
+    return {"id": file_id, "name": name, "mimeType": "application/pdf", "md5Checksum": md5,
+            "modifiedTime": "2026-01-05T00:00:00Z"}
+
+
+def _download(service, file_id, name, mime_type):
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"%PDF-1.4 " + file_id.encode())
+    return path, name
+
+
+class DriveSyncRunTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, GOOGLE_DRIVE_FOLDER_ID="folder", DRIVE_SYNC_LOCK_TTL=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.lock = LeaseLock(SYNC_LOCK_NAME, ttl=60)
+        self.addCleanup(self.lock.redis.delete, self.lock.key)
+
+        for patcher in (
+            mock.patch("documents.services.drive_sync.get_drive_service"),
+            mock.patch("documents.services.drive_sync.download_drive_file", side_effect=_download),
+            mock.patch("documents.services.vector_store.remove_file_from_vector_store"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.enqueue = mock.patch("documents.tasks.process_document.apply_async").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def add_synced(self, file_id, name, md5):
+        doc = Document.objects.create(title=name, file=f"documents/{name}", authority_level="statute", domain="other",
+                                      status="completed", openai_file_id=f"file-{file_id}")
+        return DriveFile.objects.create(drive_file_id=file_id, name=name, mime_type="application/pdf",
+                                        md5_checksum=md5, modified_time=MODIFIED, document=doc)
+
+    def test_run_records_counters_and_phases(self):
+        self.add_synced("same", "same.pdf", "aaa")
+        self.add_synced("changed", "changed.pdf", "old")
+        self.add_synced("gone", "gone.pdf", "ccc")
+        listing = [
+            _drive_file("same", "same.pdf", "aaa"),
+            _drive_file("changed", "changed.pdf", "new"),
+            _drive_file("fresh", "fresh.pdf", "ddd"),
+            _drive_file("blocked", "SystemPrompt_CustomGPT_Full.pdf", "eee"),
+        ]
+        with mock.patch("documents.services.drive_sync.list_drive_files", return_value=listing):
+            result = sync_folder(trigger="manual")
+
+        run = SyncRun.objects.get()
+        self.assertEqual(result["run_id"], run.pk)
+        self.assertEqual(run.status, "succeeded")
+        self.assertEqual(run.trigger, "manual")
+        self.assertEqual(
+            (run.files_seen, run.new_count, run.updated_count, run.unchanged_count, run.skipped_count,
+             run.removed_count, run.error_count),
+            (4, 1, 1, 1, 1, 1, 0),
+        )
+        self.assertGreater(run.bytes_downloaded, 0)
+        self.assertIsNotNone(run.duration)
+        self.assertTrue(all(seconds >= 0 for _, seconds in run.phase_timings()))
+        self.assertGreater(run.download_seconds, 0)
+        self.assertEqual(self.enqueue.call_count, 2)
+        self.assertEqual(set(DriveFile.objects.values_list("drive_file_id", flat=True)), {"same", "changed", "fresh"})
+        self.assertFalse(self.lock.is_locked())
+
+    def test_overlapping_run_is_skipped(self):
+        self.assertTrue(self.lock.acquire())
+        with mock.patch("documents.services.drive_sync.list_drive_files") as list_files:
+            result = sync_folder()
+
+        self.assertTrue(result["skipped"])
+        list_files.assert_not_called()
+        self.assertEqual(SyncRun.objects.get().status, "skipped")
+        # The holder's lock is untouched
+        self.assertTrue(self.lock.is_locked())
+
+    def test_failed_run_is_recorded_and_unlocks(self):
+        with mock.patch("documents.services.drive_sync.list_drive_files", side_effect=RuntimeError("quota")):
+            with self.assertRaises(RuntimeError):
+                sync_folder()
+
+        run = SyncRun.objects.get()
+        self.assertEqual(run.status, "failed")
+        self.assertIn("quota", run.error)
+        self.assertFalse(self.lock.is_locked())
+
+    def test_interrupted_run_is_closed_by_the_next(self):
+        stuck = SyncRun.objects.create()
+        with mock.patch("documents.services.drive_sync.list_drive_files", return_value=[]):
+            sync_folder()
+
+        stuck.refresh_from_db()
+        self.assertEqual(stuck.status, "failed")
+        self.assertIsNotNone(stuck.finished_at)
+
+    def test_lost_lease_cannot_be_renewed_or_released(self):
+        self.assertTrue(self.lock.acquire())
+        self.lock.redis.delete(self.lock.key)
+        other = LeaseLock(SYNC_LOCK_NAME, ttl=60)
+        self.assertTrue(other.acquire())
+
+        self.lock.renew_interval = 0
+        with self.assertRaises(LockLost):
+            self.lock.renew()
+        self.lock.release()
+        self.assertTrue(other.is_locked())